@@ -21,14 +21,22 @@ uuid in this context is universal unique id, it is unique whithin a world
 """
 from itertools import imap
 #from collections import defaultdict
+from collections import deque
 from functools import partial
 from numpy import array
 from numpy import sign
-from numpy import linspace
+from numpy import zeros, arange, repeat, tile, nan, hypot, where, inf
+from numpy import interp, unwrap, radians, degrees, isnan
+from numpy import cos as npcos, sin as npsin
 #from numpy import sign
 from shapely import geometry
 
 from .utils import geom
+from .utils.lineofsight import occlusion_matrix, open_intervals
+from .utils.stadium import Stadium
+from .utils.fieldgrid import FieldGrid
+from .utils.history import History
+from .utils.planner import Planner
 from .utils.mathutils import cos, sin, sqrt
 from .utils.keydefaultdict import keydefaultdict
 from .communication.protos.referee_pb2 import SSL_Referee as ref
@@ -43,6 +51,53 @@ MAX_ROBOT_SPEED = config['robot']['max_speed']
 Yellow = 0x1e11000
 Blue = 0xb100e00
 
+# maximum number of robots per team on the world state store, robots with
+# uids that don't fit are still supported, they simply get a private row
+# and are left out of the queries that run over the whole store
+MAX_ROBOTS = 16
+
+# columns of the world state store
+X, Y, ANGLE, VX, VY, AX, AY, ACTIVE, CAN_KICK = range(9)
+STATE_COLUMNS = ('x', 'y', 'angle', 'vx', 'vy', 'ax', 'ay', 'active', 'can_kick')
+
+# boolean flags kept next to the state of each robot: moved since the cached
+# geometry was built, touching the ball, has just released it and is the
+# last of its team to have touched it
+MOVED, TOUCHING, TOUCHED, LAST_TOUCHER = range(4)
+FLAG_COLUMNS = ('moved', 'touching', 'touched', 'last_toucher')
+
+# every robot is built this size for now
+ROBOT_RADIUS = 180e-3 / 2
+
+# columns of the action tables, speeds are on the robot frame unless absolute is set
+ACTION_COLUMNS = ('vx', 'vy', 'va', 'kick', 'chip', 'dribble', 'has_speeds', 'absolute', 'has_target', 'tx', 'ty', 'ta')
+A_VX, A_VY, A_VA, A_KICK, A_CHIP, A_DRIBBLE, A_HAS_SPEEDS, A_ABSOLUTE, A_HAS_TARGET, A_TX, A_TY, A_TA = range(12)
+# columns that are NaN while not set
+ACTION_UNSET = [A_KICK, A_CHIP, A_DRIBBLE, A_TX, A_TY, A_TA]
+
+# columns of the history of robots and ball
+HISTORY_COLUMNS = ('t', 'x', 'y', 'angle', 'vx', 'vy')
+H_T, H_X, H_Y, H_ANGLE, H_VX, H_VY = range(6)
+
+# world attributes describing the field, these are what the vision geometry
+# packets fill in and what the cached field shapes depend on
+GEOMETRY_FIELDS = (
+    'width',
+    'length',
+    'line_width',
+    'boundary_width',
+    'referee_width',
+    'center_radius',
+    'defense_radius',
+    'defense_stretch',
+    'free_kick_distance',
+    'penalty_spot_distance',
+    'penalty_line_distance',
+    'goal_width',
+    'goal_depth',
+    'goal_wall_width',
+)
+
 
 class Rules(object):
     max_conduction_distance = 0.5
@@ -63,7 +118,9 @@ class Component(object):
 class Action(object):
     """An instance of this class determines what will a robot do."""
 
-    def __init__(self, uid_robot, target=None, speeds=None):
+    __slots__ = ('robot', '_uid', '_row', '_index')
+
+    def __init__(self, uid_robot=None, target=None, speeds=None):
         """
         The action can do a veeery rudimentary control, for that one has to set
         a target instead of the speeds. This feature is deprecated and may be
@@ -83,30 +140,93 @@ class Action(object):
 
         One can also use the speeds property, to have it spin still for instance:
         >>> a.speeds = (0.0, 0.0, 2.0)
+
+        The values live on a row of ACTION_COLUMNS, a private one until the
+        action is bound to the ActionTable of a team.
         """
-        if isinstance(uid_robot, int):
+        if isinstance(uid_robot, int) or uid_robot is None:
             self._uid = uid_robot
             self.robot = None
         else:
             self._uid = None
             self.robot = uid_robot
-        self.x, self.y, self.angle = target if target is not None else (None, None, None)
-        self.kick = None
-        self.chipkick = None
-        self.dribble = None
-        self._speeds = speeds
+        self._row = zeros(len(ACTION_COLUMNS))
+        self._row[ACTION_UNSET] = nan
+        self._index = None
+        if target is not None:
+            self.target = target
+        if speeds is not None:
+            self.speeds = speeds
 
     def reset(self):
-        self._speeds = None
-        self.kick = None
-        self.chipkick = None
-        self.dribble = None
+        row = self._row
+        row[A_VX:A_VA + 1] = 0.0
+        row[A_HAS_SPEEDS] = row[A_ABSOLUTE] = 0.0
+        row[A_KICK:A_DRIBBLE + 1] = nan
 
     def __nonzero__(self):
         """This is used for implicit bool conversion, which answers if the action does something."""
-        #return not (self.x is None or self.y is None or self.angle is None) or self._speeds is not None
         return self.has_target or self.has_speeds
 
+    def _get(self, column):
+        value = self._row[column].item()
+        return None if value != value else value
+
+    def _set(self, column, value):
+        self._row[column] = nan if value is None else value
+
+    def _set_target(self, column, value):
+        self._set(column, value)
+        self._row[A_HAS_TARGET] = not isnan(self._row[A_TX:A_TA + 1]).all()
+
+    @property
+    def x(self):
+        return self._get(A_TX)
+
+    @x.setter
+    def x(self, x):
+        self._set_target(A_TX, x)
+
+    @property
+    def y(self):
+        return self._get(A_TY)
+
+    @y.setter
+    def y(self, y):
+        self._set_target(A_TY, y)
+
+    @property
+    def angle(self):
+        return self._get(A_TA)
+
+    @angle.setter
+    def angle(self, angle):
+        self._set_target(A_TA, angle)
+
+    @property
+    def kick(self):
+        return self._get(A_KICK)
+
+    @kick.setter
+    def kick(self, kick):
+        self._set(A_KICK, kick)
+
+    @property
+    def chipkick(self):
+        return self._get(A_CHIP)
+
+    @chipkick.setter
+    def chipkick(self, chipkick):
+        self._set(A_CHIP, chipkick)
+
+    @property
+    def dribble(self):
+        return self._get(A_DRIBBLE)
+
+    @dribble.setter
+    def dribble(self, dribble):
+        self._set(A_DRIBBLE, dribble)
+
     @property
     def target(self):
         if self.has_target:
@@ -116,16 +236,16 @@ class Action(object):
 
     @target.setter
     def target(self, t):
-        self._speeds = None
+        self.speeds = None
         self.x, self.y, self.angle = t
 
     @property
     def has_target(self):
-        return (self.x, self.y, self.angle) != (None, None, None)
+        return bool(self._row[A_HAS_TARGET])
 
     @property
     def has_speeds(self):
-        return self._speeds is not None
+        return bool(self._row[A_HAS_SPEEDS])
 
     @property
     def uid(self):
@@ -138,31 +258,385 @@ class Action(object):
     def color(self):
         return self.robot.color
 
+    def _robot_angle(self):
+        angle = self.robot.angle if self.robot is not None else None
+        return angle or 0.0
+
     @property
     def speeds(self):
-        return self._speeds or (0.0, 0.0, 0.0)
+        vx, vy, va = self._row[A_VX:A_VA + 1].tolist()
+        if self._row[A_ABSOLUTE]:
+            ra = self._robot_angle()
+            return (vx * cos(ra) + vy * sin(ra), vy * cos(ra) - vx * sin(ra), va)
+        return (vx, vy, va)
 
     @speeds.setter
     def speeds(self, speeds):
-        self._speeds = speeds
+        row = self._row
+        if speeds is None:
+            row[A_VX:A_VA + 1] = 0.0
+            row[A_HAS_SPEEDS] = 0.0
+        else:
+            # one item at a time is faster than a slice for three of them
+            row[A_VX], row[A_VY], row[A_VA] = speeds
+            row[A_HAS_SPEEDS] = 1.0
+        row[A_ABSOLUTE] = 0.0
 
     @property
     def absolute_speeds(self):
-        vx, vy, va = self.speeds
-        ra = self.robot.angle
+        vx, vy, va = self._row[A_VX:A_VA + 1].tolist()
+        if self._row[A_ABSOLUTE]:
+            return (vx, vy, va)
+        ra = self._robot_angle()
         return (vx * cos(ra) - vy * sin(ra), vy * cos(ra) + vx * sin(ra), va)
 
     @absolute_speeds.setter
     def absolute_speeds(self, speeds):
-        vx, vy, va = speeds
-        ra = self.robot.angle or 0.0
-        self._speeds = (vx * cos(ra) + vy * sin(ra), vy * cos(ra) - vx * sin(ra), va)
+        """Field frame speeds are kept as they are, commanders convert them with the whole team."""
+        row = self._row
+        row[A_VX], row[A_VY], row[A_VA] = speeds
+        row[A_HAS_SPEEDS] = row[A_ABSOLUTE] = 1.0
 
     def __str__(self):
         #return "Action: "+str(type(self.robot))+ str(self.speeds)#{'x': self.x, 'y': self.y, 'angle':self.angle})
         return "Action: {}{}".format(type(self.robot), str(self.speeds))
 
 
+class ActionTable(object):
+    """
+    The actions of the robots of a team, one row of ACTION_COLUMNS per uid.
+
+    The Action of each robot is a view over its row, so commanders can take
+    the actions of the whole team at once:
+
+    >>> team = Team(Blue)
+    >>> team[0].action.speeds = (1.0, 0.0, 0.0)
+    >>> team[2].action.absolute_speeds = (0.0, 1.0, 0.0)
+    >>> team[2].angle = 90.0
+    >>> uids, rows = team.actions.block([team[0].action, team[2].action])
+    >>> uids, rows[:, A_VX:A_VA + 1].round(6).tolist()
+    ([0, 2], [[1.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    """
+
+    def __init__(self, team, max_robots=MAX_ROBOTS):
+        self.team = team
+        self.max_robots = max_robots
+        self.data = zeros((max_robots, len(ACTION_COLUMNS)))
+        self.data[:, ACTION_UNSET] = nan
+        # what Action.reset leaves on the first columns
+        self._reset_row = self.data[0, :A_ABSOLUTE + 1].copy()
+
+    def bind(self, action):
+        """Move action to the row of its uid, copying whatever it had."""
+        uid = action.uid
+        if uid is None or not 0 <= uid < self.max_robots:
+            return
+        row = self.data[uid]
+        row[:] = action._row
+        action._row = row
+        action._index = uid
+
+    def angles(self, index):
+        """Angle of the robot of each of the rows in index, 0.0 where unknown."""
+        world = self.team.world
+        if world is not None and world.state.max_robots >= self.max_robots:
+            state = world.state
+            angles = state.robots[state.team_slice(self.team.color), ANGLE].take(index)
+        else:
+            team = self.team
+            angles = array([team[uid].angle if uid in team else None for uid in index], dtype=float)
+        angles[isnan(angles)] = 0.0
+        return angles
+
+    def block(self, actions):
+        """
+        The rows of actions as one (n, len(ACTION_COLUMNS)) array.
+
+        Returns (uids, rows). Speeds on rows are all in the robot frame and
+        kick, chip and dribble are 0.0 where unset.
+        """
+        data = self.data
+        if all(a._row.base is data for a in actions):
+            # rows on the table are those of the uids
+            uids = [a._index for a in actions]
+            rows = data.take(uids, axis=0)
+            angles = lambda: self.angles(uids)
+        else:
+            # some of the actions are not on this table
+            uids = [a.uid for a in actions]
+            rows = array([a._row for a in actions]).reshape(-1, len(ACTION_COLUMNS))
+            angles = lambda: array([a._robot_angle() for a in actions], dtype=float)
+        absolute = rows[:, A_ABSOLUTE]
+        if any(absolute.tolist()):
+            # rows on the robot frame are turned by 0 degrees, which keeps them
+            ra = radians(angles()) * absolute
+            c, s = npcos(ra), npsin(ra)
+            vx, vy = rows[:, A_VX], rows[:, A_VY]
+            rows[:, A_VX], rows[:, A_VY] = vx * c + vy * s, vy * c - vx * s
+            rows[:, A_ABSOLUTE] = 0.0
+        unset = rows[:, A_KICK:A_DRIBBLE + 1]
+        unset[isnan(unset)] = 0.0
+        return uids, rows
+
+    def reset(self, actions):
+        """Like Action.reset for all of actions."""
+        data = self.data
+        if not all(a._row.base is data for a in actions):
+            for a in actions:
+                a.reset()
+            return
+        index = [a._index for a in actions]
+        data[index, :A_ABSOLUTE + 1] = self._reset_row
+
+
+class WorldState(object):
+    """
+    Structure-of-arrays store for the state of the moving objects of a world.
+
+    There is one preallocated row per (team, uid) slot on `robots` and a
+    single row for the ball, each row holds the columns on STATE_COLUMNS.
+    Robots and the ball are thin views over these rows, so anything that
+    needs all the robots at once can read contiguous memory:
+
+    >>> s = WorldState()
+    >>> s.robots.shape
+    (32, 9)
+    >>> s.slot(Blue, 3)
+    19
+    >>> s.robots[s.team_slice(Blue), X].shape
+    (16,)
+
+    Angles are NaN while unknown and active/can_kick are stored as 0.0/1.0.
+    Each robot row has a row of FLAG_COLUMNS on `flags` as well.
+    """
+
+    def __init__(self, max_robots=MAX_ROBOTS):
+        self.max_robots = max_robots
+        self.robots = zeros((2 * max_robots, len(STATE_COLUMNS)))
+        self.robots[:, ANGLE] = nan
+        self.robots[:, CAN_KICK] = 1.0
+        self.flags = zeros((2 * max_robots, len(FLAG_COLUMNS)), dtype=bool)
+        self.ball = zeros(len(STATE_COLUMNS))
+        self.ball[ANGLE] = nan
+
+        # what each slot is, and the robot that owns it (if created already)
+        self.colors = repeat((Yellow, Blue), max_robots)
+        self.uids = tile(arange(max_robots), 2)
+        self.objects = [None] * (2 * max_robots)
+        self.bound = zeros(2 * max_robots, dtype=bool)
+
+    def slot(self, color, uid):
+        """Index of the row of a robot, None if it doesn't fit on the store."""
+        if color not in (Yellow, Blue) or not 0 <= uid < self.max_robots:
+            return None
+        return (0 if color == Yellow else self.max_robots) + uid
+
+    def team_slice(self, color):
+        offset = 0 if color == Yellow else self.max_robots
+        return slice(offset, offset + self.max_robots)
+
+    def bind(self, robot):
+        """Give robot a view over its row, copying whatever state it had."""
+        slot = self.slot(robot.color, robot.uid)
+        if slot is None:
+            return
+        row = self.robots[slot]
+        row[:] = robot._state
+        robot._state = row
+        flags = self.flags[slot]
+        flags[:] = robot._flags
+        robot._flags = flags
+        self.objects[slot] = robot
+        self.bound[slot] = True
+
+    def mask(self, color=None, active=True, can_kick=None):
+        """
+        Boolean mask over the robot rows.
+
+        Each argument filters the rows when not None, like on World.iterrobots.
+        Slots of robots that were never created are always left out.
+        """
+        m = self.bound.copy()
+        if color is not None:
+            m &= self.colors == color
+        if active is not None:
+            m &= (self.robots[:, ACTIVE] != 0.0) == active
+        if can_kick is not None:
+            m &= (self.robots[:, CAN_KICK] != 0.0) == can_kick
+        return m
+
+    def distances_to_point(self, point, **kwargs):
+        """
+        Distances from the robots selected by mask(**kwargs) to point.
+
+        Returns a tuple (slots, distances) of arrays.
+        """
+        slots = self.mask(**kwargs).nonzero()[0]
+        rows = self.robots[slots]
+        return slots, hypot(rows[:, X] - point.x, rows[:, Y] - point.y)
+
+    def discs(self, exclude=(), **kwargs):
+        """
+        The robots selected by mask(**kwargs), leaving out those in exclude, as discs.
+
+        Returns a tuple (slots, centers, radii) of arrays.
+        """
+        slots = [i for i in self.mask(**kwargs).nonzero()[0] if not any(self.objects[i] is e for e in exclude)]
+        radii = array([self.objects[i].radius for i in slots], dtype=float)
+        return array(slots, dtype=int), self.robots[slots, X:Y + 1], radii
+
+    def write(self, slots, columns, values):
+        """
+        Write values, a row for each of the slots, on a slice of columns.
+
+        Rows written on X or Y are flagged as moved, so what the robots built
+        from their position is rebuilt the next time it's asked for:
+
+        >>> s = WorldState()
+        >>> s.write([1, 18], slice(X, Y + 1), [(1.0, 2.0), (3.0, 4.0)])
+        >>> s.robots[[1, 18], X:Y + 1].tolist(), s.flags[[1, 18, 2], MOVED].tolist()
+        ([[1.0, 2.0], [3.0, 4.0]], [True, True, False])
+        """
+        self.robots[slots, columns] = values
+        # X and Y are the first columns
+        if columns.start <= Y:
+            self.flags[slots, MOVED] = True
+
+    def update_touches(self, reach, mask=None):
+        """
+        Who touches the ball, among the robots selected by mask, the active
+        ones by default.
+
+        A robot is touching the ball while it is closer than reach. When it
+        stops touching it, it has touched it until the next call and becomes
+        the last toucher of its team, the one closest to the ball if several
+        of a team let go at once. Returns the mask of those that touched it:
+
+        >>> s = WorldState()
+        >>> s.bound[:] = True
+        >>> s.robots[:, ACTIVE] = 1.0
+        >>> s.robots[:, X] = 10.0
+        >>> s.robots[[2, 3], X] = 0.1
+        >>> s.update_touches(0.2).nonzero()[0].tolist()
+        []
+        >>> s.robots[[2, 3], X] = [1.0, 0.5]
+        >>> s.update_touches(0.2).nonzero()[0].tolist(), s.flags[:, LAST_TOUCHER].nonzero()[0].tolist()
+        ([2, 3], [3])
+        """
+        if mask is None:
+            mask = self.mask()
+        distances = hypot(self.robots[:, X] - self.ball[X], self.robots[:, Y] - self.ball[Y])
+        touching = mask & (distances < reach)
+        flags = self.flags
+        touched = mask & flags[:, TOUCHING] & ~touching
+        flags[mask, TOUCHING] = touching[mask]
+        flags[:, TOUCHED] = touched
+        if touched.any():
+            # a row per team, the same layout as the slots
+            released = touched.reshape(2, -1)
+            teams = released.any(axis=1).nonzero()[0]
+            closest = where(released, distances.reshape(2, -1), inf).argmin(axis=1)
+            last = flags[:, LAST_TOUCHER].reshape(2, -1).copy()
+            last[teams] = False
+            last[teams, closest[teams]] = True
+            flags[:, LAST_TOUCHER] = last.ravel()
+        return touched
+
+
+def _frozen(a):
+    a.flags.writeable = False
+    return a
+
+
+class Snapshot(object):
+    """
+    An immutable copy of the state of a world, taken by World.publish.
+
+    Readers on other threads can hold on to a snapshot for as long as they
+    want while the world keeps changing, no locking involved. Along with
+    the names of the skill and tactic of each slot it keeps the skills and
+    tactics themselves, for the views that draw them:
+
+    >>> w = World()
+    >>> w.blue_team[3].update(1.0, 2.0)
+    >>> w.blue_team[3].active = True
+    >>> snap = w.publish()
+    >>> w.blue_team[3].update(0.0, 0.0)
+    >>> snap.robot(Blue, 3)[X:Y + 1]
+    array([1., 2.])
+    >>> [uid for color, uid, row in snap.iterrobots()]
+    [3]
+    >>> snap.active_slots().tolist(), snap.skill_objects[19]
+    ([19], None)
+    >>> snap.frame_number = 2
+    Traceback (most recent call last):
+        ...
+    AttributeError: snapshots are immutable
+    """
+
+    __slots__ = (
+        'timestamp',
+        'frame_number',
+        'robots',
+        'ball',
+        'colors',
+        'uids',
+        'bound',
+        'skills',
+        'tactics',
+        'skill_objects',
+        'tactic_objects',
+        'geometry',
+        'referee_command',
+        'referee_stage',
+    )
+
+    def __init__(self, world):
+        state = world.state
+        objects = lambda attr: tuple(getattr(r, attr, None) for r in state.objects)
+        names = lambda attr: tuple(getattr(o, 'name', None) for o in objects(attr))
+        for attr, value in (
+            ('timestamp', world.timestamp),
+            ('frame_number', world.frame_number),
+            ('robots', _frozen(state.robots.copy())),
+            ('ball', _frozen(state.ball.copy())),
+            ('colors', _frozen(state.colors.copy())),
+            ('uids', _frozen(state.uids.copy())),
+            ('bound', _frozen(state.bound.copy())),
+            ('skills', names('skill')),
+            ('tactics', names('tactic')),
+            ('skill_objects', objects('skill')),
+            ('tactic_objects', objects('tactic')),
+            ('geometry', world.field_geometry()),
+            ('referee_command', world.referee.command),
+            ('referee_stage', world.referee.stage),
+        ):
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('snapshots are immutable')
+
+    def robot(self, color, uid):
+        """The state row of a robot, None if it was never seen."""
+        slot = (0 if color == Yellow else len(self.robots) / 2) + uid
+        if uid < len(self.robots) / 2 and self.bound[slot]:
+            return self.robots[slot]
+
+    def active_slots(self):
+        """Slots of the active robots, to index robots, skills and the like with."""
+        return (self.bound & (self.robots[:, ACTIVE] != 0.0)).nonzero()[0]
+
+    def iterrobots(self, color=None, active=True):
+        """Iterate over (color, uid, row) of the robots, filtered like on World.iterrobots."""
+        for slot in self.bound.nonzero()[0]:
+            row = self.robots[slot]
+            if color is not None and self.colors[slot] != color:
+                continue
+            if active is not None and (row[ACTIVE] != 0.0) != active:
+                continue
+            yield self.colors[slot], self.uids[slot], row
+
+
 class Robot(geom.Point):
 
     max_speed = MAX_ROBOT_SPEED
@@ -173,10 +647,17 @@ class Robot(geom.Point):
         """This class represents a robot, regardless of the team.
 
         Remember to set max_speed and max_ang_speed to reasonable limits.
+
+        Position, angle, speed, acceleration, active and can_kick live on a
+        row of the WorldState of the world of the team, or on a private row
+        when there is no such world, and so do the FLAG_COLUMNS.
         """
+        self._state = zeros(len(STATE_COLUMNS))
+        self._state[ANGLE] = nan
+        self._flags = zeros(len(FLAG_COLUMNS), dtype=bool)
         super(Robot, self).__init__(0.0, 0.0)
         # TODO make a robot builder/factory to abstract these sizes
-        self._radius = 180e-3 / 2
+        self._radius = ROBOT_RADIUS
         self.front_cut = self._radius * 0.7
         if max_speed is not None:
             self.max_speed = max_speed
@@ -184,29 +665,29 @@ class Robot(geom.Point):
         if max_ang_speed is not None:
             self.max_ang_speed = max_ang_speed
 
-        # ideally robot should inherit from a class that has an angle
-        # and some geometry framework can use that angle
-        self.angle = None
-        self.speed = array((0.0, 0.0))
-        self.acceleration = array((0.0, 0.0))
-        self.active = False
-
         # basic
         self.uid = uid
         self.pattern = None
         self.team = team
 
+        # move the state to the world store if there's one
+        if self.world is not None:
+            self.world.state.bind(self)
+
         # components
         self.dribbler = dribbler
-        self.kicker = kicker
+        self._kicker = kicker
+        self._kicker_at = None
         self.wheels = wheels
         self.battery = battery
 
-        # initial body
-        self._body = geom.Circle(self, self._radius)
+        # body, built on demand
+        self._body = None
 
-        # action to be dispatched by a commander
+        # action to be dispatched by a commander, on the action table of the team
         self._action = Action(self)
+        if team is not None:
+            team.actions.bind(self._action)
 
         # last skill, and tactic that was executed
         self.skill = None
@@ -216,7 +697,7 @@ class Robot(geom.Point):
         self.can_kick = True
 
         self.is_touching = False
-        self._has_touched = False
+        self.has_touched_ball = False
         self.is_last_toucher = False
 
         class Steppable(object):
@@ -240,12 +721,84 @@ class Robot(geom.Point):
 
     def update(self, *args, **kwargs):
         """This is just a hook over the original function to cache some data."""
-        super(Robot, self).update(*args, **kwargs)
-        # TODO generate the actual body shape instead of a circle
-        self._body = geom.Circle(self, self._radius)
-        angle = self.angle or 0.0
-        d = array((cos(angle), sin(angle)))
-        self.kicker = geom.Point(array(self) + d * self.front_cut)
+        self._state[X], self._state[Y] = args if len(args) == 2 else args[0]
+        # the shapely point, body and kicker are only rebuilt when someone asks for them
+        self._flags[MOVED] = True
+
+    def _sync(self):
+        """Drop what was built from the position if it was moved since, here or on the store."""
+        if self._flags[MOVED]:
+            self._flags[MOVED] = False
+            self._set_coords(float(self._state[X]), float(self._state[Y]))
+            self._ctypes_data = None
+            self._body = None
+            self._kicker_at = None
+
+    @property
+    def _geom(self):
+        self._sync()
+        return self.__geom__
+
+    @_geom.setter
+    def _geom(self, val):
+        geometry.Point._geom.fset(self, val)
+
+    @property
+    def x(self):
+        return self._state[X]
+
+    @property
+    def y(self):
+        return self._state[Y]
+
+    @property
+    def vec(self):
+        """A new Vec2 with the position of the robot."""
+        x, y = self._state[X:Y + 1].tolist()
+        return geom.Vec2(x, y)
+
+    @property
+    def angle(self):
+        angle = self._state[ANGLE]
+        return None if angle != angle else angle
+
+    @angle.setter
+    def angle(self, angle):
+        self._state[ANGLE] = nan if angle is None else angle
+
+    @property
+    def speed(self):
+        """A view of (vx, vy) on the world state."""
+        return self._state[VX:VY + 1]
+
+    @speed.setter
+    def speed(self, speed):
+        self._state[VX:VY + 1] = speed[:2]
+
+    @property
+    def acceleration(self):
+        """A view of (ax, ay) on the world state."""
+        return self._state[AX:AY + 1]
+
+    @acceleration.setter
+    def acceleration(self, acceleration):
+        self._state[AX:AY + 1] = acceleration[:2]
+
+    @property
+    def active(self):
+        return self._state[ACTIVE] != 0.0
+
+    @active.setter
+    def active(self, active):
+        self._state[ACTIVE] = 1.0 if active else 0.0
+
+    @property
+    def can_kick(self):
+        return self._state[CAN_KICK] != 0.0
+
+    @can_kick.setter
+    def can_kick(self, can_kick):
+        self._state[CAN_KICK] = 1.0 if can_kick else 0.0
 
     @property
     def ball(self):
@@ -269,8 +822,22 @@ class Robot(geom.Point):
 
     @property
     def body(self):
+        # TODO generate the actual body shape instead of a circle
+        self._sync()
+        if self._body is None:
+            self._body = geom.Circle(self, self._radius)
         return self._body
 
+    @property
+    def kicker(self):
+        """Point in front of the robot where the ball is kicked from."""
+        self._sync()
+        angle = self.angle or 0.0
+        if self._kicker_at != angle:
+            self._kicker = geom.Point(self.x + cos(angle) * self.front_cut, self.y + sin(angle) * self.front_cut)
+            self._kicker_at = angle
+        return self._kicker
+
     @property
     def action(self):
         return self._action
@@ -319,18 +886,30 @@ class Robot(geom.Point):
         """Name says it all."""
         return self.team.color != robot.team.color
 
+    @property
+    def is_touching(self):
+        return bool(self._flags[TOUCHING])
+
+    @is_touching.setter
+    def is_touching(self, value):
+        self._flags[TOUCHING] = value
+
     @property
     def has_touched_ball(self):
-        was_touching = self.is_touching
-        self.is_touching = self.distance(self.ball) < self.radius + 2 * self.ball.radius
-        if not self.is_touching and was_touching:
-            self._has_touched = True
-            return True
-        return False
+        """Whether the robot let go of the ball on the last World.update_touches."""
+        return bool(self._flags[TOUCHED])
 
     @has_touched_ball.setter
     def has_touched_ball(self, value):
-        self._has_touched = value
+        self._flags[TOUCHED] = value
+
+    @property
+    def is_last_toucher(self):
+        return bool(self._flags[LAST_TOUCHER])
+
+    @is_last_toucher.setter
+    def is_last_toucher(self, value):
+        self._flags[LAST_TOUCHER] = value
 
     def on_enemy_side(self):
         if self.enemy_goal is not None:
@@ -354,6 +933,9 @@ class Team(keydefaultdict):
         self.color = color
         self.world = world
 
+        # what each robot is going to do, see ActionTable
+        self.actions = ActionTable(self)
+
         # team info attributes
         self.name = None
         self.score = None
@@ -371,6 +953,7 @@ class Team(keydefaultdict):
         # update robots' team
         for r in self.itervalues():
             r.team = self
+            self.actions.bind(r.action)
 
     @property
     def goalie(self):
@@ -431,17 +1014,31 @@ class Team(keydefaultdict):
     def closest_robots_to_point(self, point, **kwargs):
         return self.world.closest_robots_to_point(point, color=self.color, **kwargs)
 
-    def best_indirect_positions(self, target=None, precision=6):
+    def best_indirect_positions(self, target=None, precision=6, costs=(), k=None):
         """
         Discretizes points over the field (respecting a minimum border from the field,
         and without entering none of the defense areas), according to given precision.
         Searches for clear paths between initial position (ball), intermediate position,
         and the target.
 
+        The grid has precision by precision - 2 cells and the cost of a cell
+        is the length of the path through it, plus any costs, (weight, term)
+        pairs as taken by FieldGrid.evaluate. Only the best k are returned
+        when k is given.
+
         Returns a sorted list of tuples (Points that are closer to the target come
         first):
         [(point, distance_to_target), (point, distance_to_target), (point, distance_to_target), ...]
         """
+        return [(geom.Point(x, y), cost) for (x, y), cost in self.indirect_positions_job(target, precision, costs, k)()]
+
+    def indirect_positions_job(self, target=None, precision=6, costs=(), k=None):
+        """
+        best_indirect_positions in two parts: what it needs of the world is
+        taken now, as copies, and the returned function makes the search on
+        them alone, so it can run off the frame. The function returns
+        ((x, y), cost) tuples instead of Points.
+        """
         # TODO: aim for the best spot in the goal, not only to the middle of the enemy goal
 
         #t = self.team
@@ -450,8 +1047,6 @@ class Team(keydefaultdict):
         if target is None:
             target = self.enemy_goal
 
-        candidate = []
-
         safety_margin = 2 * self[0].radius + 0.1
 
         # field params:
@@ -459,28 +1054,23 @@ class Team(keydefaultdict):
         f_w = self.world.width - safety_margin
 
         # candidate points in the field range
-        for x in linspace(-f_l / 2, f_l / 2, precision):
-            for y in linspace(-f_w / 2, f_w / 2, precision - 2):
-                pt = geom.Point(x, y)
-                acceptable = True
-                found = False
-                final_line = geom.Point(0, 0)
-                for enemy in self.world.enemy_team(self.color).iterrobots():
-                    # if the robot -> pt line doesn't cross any enemy body...
-                    found = True
-                    start_line = geom.Line(b, pt)
-                    if not start_line.crosses(enemy.body):
-                        final_line = geom.Line(pt, target)
-                        # if the pt -> target line crosses any enemy body...
-                        if final_line.crosses(enemy.body):
-                            acceptable = False
-                if found and acceptable:
-                    candidate += [(pt, start_line.length + final_line.length)]
-        if not candidate:
-            #goal_point = self.enemy_goal
-            return [(geom.Point(self.enemy_goal.x - sign(self.enemy_goal.x), self.enemy_goal.y), 1)]
-        else:
-            return sorted(candidate, key=lambda tup: tup[1])
+        grid = FieldGrid(self.world, precision, precision - 2, length=f_l, width=f_w)
+        _, centers, radii = self.world.state.discs(color=self.enemy_team.color)
+        ball, goal, radius = (b.x, b.y), target.coords[0], b.radius
+        gx, gy = self.enemy_goal.x, self.enemy_goal.y
+
+        def job():
+            clear = grid.visible_from(ball, centers, radii, radius) & grid.visible_to(goal, centers, radii, radius)
+            candidate = grid.rank([
+                (1.0, lambda g: g.distances(ball)),
+                (1.0, lambda g: g.distances(goal)),
+            ] + list(costs), mask=clear, k=k)
+            if not candidate:
+                #goal_point = self.enemy_goal
+                return [((gx - sign(gx), gy), 1)]
+            else:
+                return candidate
+        return job
 
     def __iter__(self):
         return self.iterrobots(active=True)
@@ -489,22 +1079,74 @@ class Team(keydefaultdict):
 class Ball(geom.Point):
     """Well, a ball."""
 
+    # whether the shapely point is behind the state
+    _stale = False
+
     def __init__(self, world):
+        # the ball state lives on the world store, like the robots'
+        self._state = world.state.ball if world is not None else zeros(len(STATE_COLUMNS))
         super(Ball, self).__init__(0.0, 0.0)
         self._radius = 43e-3 / 2
         self.world = world
-        self.speed = array((0.0, 0.0))
 
-        # initial body
-        self._body = geom.Circle(self, self._radius)
+        # body, built on demand
+        self._body = None
 
     def update(self, *args, **kwargs):
         """This is just a hook over the original function to cache some data."""
-        super(Ball, self).update(*args, **kwargs)
-        self._body = geom.Circle(self, self._radius)
+        self._state[X], self._state[Y] = args if len(args) == 2 else args[0]
+        # like the robots', the shapely point is rebuilt on demand
+        self._stale = True
+        self._ctypes_data = None
+        self._body = None
+
+    @property
+    def _geom(self):
+        if self._stale:
+            self._stale = False
+            self._set_coords(float(self._state[X]), float(self._state[Y]))
+        return self.__geom__
+
+    @_geom.setter
+    def _geom(self, val):
+        geometry.Point._geom.fset(self, val)
+
+    @property
+    def x(self):
+        return self._state[X]
+
+    @property
+    def y(self):
+        return self._state[Y]
+
+    @property
+    def vec(self):
+        """A new Vec2 with the position of the ball."""
+        x, y = self._state[X:Y + 1].tolist()
+        return geom.Vec2(x, y)
+
+    @property
+    def speed(self):
+        """A view of (vx, vy) on the world state."""
+        return self._state[VX:VY + 1]
+
+    @speed.setter
+    def speed(self, speed):
+        self._state[VX:VY + 1] = speed[:2]
+
+    @property
+    def acceleration(self):
+        """A view of (ax, ay) on the world state."""
+        return self._state[AX:AY + 1]
+
+    @acceleration.setter
+    def acceleration(self, acceleration):
+        self._state[AX:AY + 1] = acceleration[:2]
 
     @property
     def body(self):
+        if self._body is None:
+            self._body = geom.Circle(self, self._radius)
         return self._body
 
     @property
@@ -570,20 +1212,25 @@ class Goal(geom.Point):
             array(self) + array((self.depth * (sign(self.x) or 1), -self.width / 2)),
             array(self) + array((0.0, -self.width / 2)),
         ])
-        self._area = None
+        self._shapes = None
+
+    @property
+    def shapes(self):
+        """The GoalShapes of this goal, rebuilt only when the field geometry or the goal changes."""
+        key = self.world.geometry_key()
+        if self._shapes is None or self._shapes.key != key:
+            self._shapes = GoalShapes(self, key)
+        return self._shapes
 
     @property
     def penalty_line(self):
         """A line the robots must not advance on penalty on this goal."""
-        return geom.Line(
-            geom.Point(self.x - (sign(self.x) or 1) * (self.world.penalty_spot_distance + self.world.penalty_line_distance), -self.world.width / 2),
-            geom.Point(self.x - (sign(self.x) or 1) * (self.world.penalty_spot_distance + self.world.penalty_line_distance), self.world.width / 2),
-        )
+        return self.shapes.penalty_line
 
     @property
     def penalty_stop(self):
         """A point where the ball should be on a penalty on this goal."""
-        return geom.Point(array(self) - array(((sign(self.x) or 1) * (self.world.penalty_spot_distance), 0)))
+        return self.shapes.penalty_stop
 
     @property
     def line(self):
@@ -623,27 +1270,80 @@ class Goal(geom.Point):
 
     @property
     def area(self):
-        if self._area:
-            return self._area
-        else:
-            # Area of the goal + radius of the robots
-            self._area = geom.Line([
-                array(self) + array((0, self.world.defense_stretch / 2)),
-                array(self) - array((0, self.world.defense_stretch / 2))
-            ]).buffer(
-                self.world.defense_radius +
-                # Robot radius...
-                180e-3 / 2
-            )
-            return self._area
+        """Defense area grown by the radius of a robot."""
+        return self.shapes.area
 
     def point_outside_area(self, point):
-        # TODO: Select the point better
-        if point.within(self.area):
-            r = point.distance(self.area.exterior)
-            return point.buffer(r + 0.01).intersection(self.area.exterior).centroid
+        """
+        The point itself if it's not inside the area, otherwise the closest point on its border.
+
+        >>> w = World()
+        >>> g = w.right_goal
+        >>> p = g.point_outside_area(geom.Point(g.x - 0.1, 0.0))
+        >>> round(g.x - p.x, 6), p.y, g.point_outside_area(geom.Point(0.0, 0.0)).x
+        (0.59, 0.0, 0.0)
+        """
+        stadium = self.shapes.area_stadium
+        xy = tuple(geom.Vec2.of(point))
+        if stadium.contains(xy):
+            return geom.Point(*stadium.nearest_exterior(xy))
         return point
 
+    def points_outside_area(self, points):
+        """Like point_outside_area for an (n, 2) array of points, returns an array."""
+        return self.shapes.area_stadium.project_out(points)
+
+
+class GoalShapes(object):
+    """
+    Shapes derived from the field geometry around a goal.
+
+    They are built once, Goal.shapes builds a new set when the goal is
+    updated or when key, the field geometry they were built from, changes:
+
+    >>> w = World()
+    >>> w.right_goal.shapes is w.right_goal.shapes
+    True
+    >>> shapes = w.right_goal.shapes
+    >>> w.defense_radius = 0.8
+    >>> w.right_goal.shapes is shapes
+    False
+    """
+
+    def __init__(self, goal, key):
+        self.key = key
+        world = goal.world
+        gx, gy = goal.x, goal.y
+        side = sign(gx) or 1
+        r = world.defense_radius
+        s = world.defense_stretch
+
+        stretch_line = geom.Line([(gx, gy + s / 2), (gx, gy - s / 2)])
+        self.defense_area = stretch_line.buffer(r)
+        # Area of the goal + radius of the robots
+        self.area = stretch_line.buffer(r + 180e-3 / 2)
+        # closed form versions of the above, points on the goal line go to the field
+        self.defense_stadium = Stadium(stretch_line.coords[0], stretch_line.coords[1], r, normal=(-side, 0.0))
+        self.area_stadium = Stadium(stretch_line.coords[0], stretch_line.coords[1], r + 180e-3 / 2, normal=(-side, 0.0))
+
+        l = (2 - sqrt(2)) * r
+        self.augmented_defense_area = geometry.Polygon((
+            (gx, r + s / 2),
+            (gx - side * (r - l), r + s / 2),
+            (gx - side * (r), r + s / 2 - l),
+            (gx - side * (r), l - r - s / 2),
+            (gx - side * (r - l), - r - s / 2),
+            (gx, -r - s / 2),
+            (gx, r + s / 2)
+        ))
+
+        penalty_x = gx - side * (world.penalty_spot_distance + world.penalty_line_distance)
+        self.penalty_line = geom.Line(
+            geom.Point(penalty_x, -world.width / 2),
+            geom.Point(penalty_x, world.width / 2),
+        )
+        self.penalty_stop = geom.Point(gx - side * world.penalty_spot_distance, gy)
+
 
 class Referee(object):
 
@@ -725,11 +1425,28 @@ class World(object):
     goal_depth = 0.18
     goal_wall_width = 0.02
 
+    # how many of the last published snapshots are kept
+    snapshot_ring_size = 16
+
+    # how many samples of the history of each robot and the ball are kept
+    history_size = 64
+
     def __init__(self, right_team=None, left_team=None):
         self.inited = False
         self.timestamp = 0
         self.frame_number = 0
         self.frame_skip = 0
+        # when the last frame was sent by the vision, on its clock, and
+        # received here, on the local monotonic clock
+        self.t_sent = 0
+        self.t_received = 0
+        # hash of the field geometry the goals were last built on, and how many times it changed
+        self.geometry_hash = None
+        self.geometry_version = 0
+        self._field_geometry = None
+
+        # the store backing the state of robots and ball
+        self.state = WorldState()
 
         # objects
         if right_team is None:
@@ -742,6 +1459,8 @@ class World(object):
         else:
             left_team.world = self
             self.left_team = left_team
+        for r in self.iterrobots(active=None):
+            self.state.bind(r)
         self.right_goal = Goal(self, self.length / 2, 0.0)
         self.left_goal = Goal(self, -self.length / 2, 0.0)
         self.referee = None
@@ -750,29 +1469,178 @@ class World(object):
         # the referee
         self.referee = Referee(self)
 
+        # last published snapshots, the latest on the right, appending and
+        # reading from a deque is atomic so readers don't need a lock
+        self.snapshots = deque(maxlen=self.snapshot_ring_size)
+
+        # timestamped samples of each robot slot of the state store, and the ball on the last row
+        self.history = History(2 * self.state.max_robots + 1, self.history_size, HISTORY_COLUMNS)
+
+        # expensive plans of the skills and plays, made off the frame, see Planner
+        self.planner = Planner()
+
+    def history_index(self, obj):
+        """Row of obj, a robot or the ball, on the history, None if it has none."""
+        if obj is self.ball:
+            return 2 * self.state.max_robots
+        return self.state.slot(obj.color, obj.uid)
+
+    def record(self, obj, timestamp):
+        """Push the current pose and speed of obj onto its history."""
+        i = self.history_index(obj)
+        if i is not None:
+            x, y, angle, vx, vy = obj._state[X:VY + 1].tolist()
+            self.history.push(i, (timestamp, x, y, angle if obj is not self.ball else nan, vx, vy))
+
+    def record_slots(self, slots, timestamp):
+        """Push the current pose and speed of the robots on slots of the store onto their history, at once."""
+        samples = zeros((len(slots), len(HISTORY_COLUMNS)))
+        samples[:, H_T] = timestamp
+        samples[:, H_X:H_VY + 1] = self.state.robots[slots, X:VY + 1]
+        self.history.push_many(slots, samples)
+
+    def update_touches(self):
+        """Who touches the ball, on every active robot of the store at once, see WorldState.update_touches."""
+        return self.state.update_touches(ROBOT_RADIUS + 2 * self.ball.radius)
+
+    def last_samples(self, obj, k=None):
+        """
+        The last k samples of obj, all if k is None, oldest first.
+
+        Each sample is an array of HISTORY_COLUMNS.
+        """
+        i = self.history_index(obj)
+        return self.history.last(i, k) if i is not None else zeros((0, len(HISTORY_COLUMNS)))
+
+    def pose_at(self, obj, t):
+        """
+        (x, y, angle) of obj at time t, interpolated from its history.
+
+        Times outside of the history are clamped to it, None if obj has no
+        history. The angle is None if it was never known.
+
+        >>> w = World()
+        >>> r = w.blue_team[0]
+        >>> for t, x, angle in ((0.0, 0.0, 350.0), (1.0, 1.0, 10.0)):
+        ...     r.update(x, 0.0)
+        ...     r.angle = angle
+        ...     w.record(r, t)
+        >>> w.pose_at(r, 0.25)
+        (0.25, 0.0, 355.0)
+        """
+        samples = self.last_samples(obj)
+        if not len(samples):
+            return None
+        times = samples[:, H_T]
+        x, y = interp(t, times, samples[:, H_X]), interp(t, times, samples[:, H_Y])
+        angles = samples[:, H_ANGLE]
+        known = ~isnan(angles)
+        if not known.any():
+            return x, y, None
+        angle = interp(t, times[known], degrees(unwrap(radians(angles[known])))) % 360
+        return x, y, angle
+
+    def latest_sample(self, obj):
+        """The last sample of obj, None if it has never been recorded."""
+        i = self.history_index(obj)
+        if i is not None:
+            return self.history.latest(i)
+
+    def last_seen(self, obj):
+        """Time of the last sample of obj, None if it has never been recorded."""
+        sample = self.latest_sample(obj)
+        if sample is not None:
+            return sample[H_T]
+
+    def velocity(self, obj, window):
+        """Finite difference (vx, vy) of the position of obj over the last window seconds."""
+        i = self.history_index(obj)
+        return self.history.rate(i, window, (H_X, H_Y)) if i is not None else zeros(2)
+
+    def publish(self):
+        """Take a Snapshot of the current state and push it onto the ring."""
+        snapshot = Snapshot(self)
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    @property
+    def snapshot(self):
+        """The latest published Snapshot, None if none was published yet."""
+        try:
+            return self.snapshots[-1]
+        except IndexError:
+            return None
+
     def switch_sides(self):
         self.right_team, self.left_team = self.left_team, self.right_team
 
+    def occlusions(self, starts, ends, width=0.0, exclude=()):
+        """
+        Which robots block which of the segments going from starts to ends.
+
+        Returns a tuple (robots, blocked) where blocked is the (M, N) boolean
+        occlusion matrix of the M segments against the N active robots that
+        are not in exclude. A robot whose body already holds the start of a
+        segment (usually the one kicking) doesn't block it.
+        """
+        slots, centers, radii = self.state.discs(exclude=exclude)
+        radii += width
+        starts = array(starts, dtype=float).reshape(-1, 2)
+        blocked = occlusion_matrix(starts, ends, centers, radii)
+        at_start = hypot(centers[:, X] - starts[:, X, None], centers[:, Y] - starts[:, Y, None]) < radii
+        blocked &= ~at_start
+        return [self.state.objects[i] for i in slots], blocked
+
+    def has_clear_shots(self, points_to_kick):
+        """
+        Array telling for each (x, y) in points_to_kick whether the ball has a clear way there.
+
+        >>> w = World()
+        >>> r = w.blue_team[0]; r.update(0.5, 0.0); r.active = True
+        >>> w.ball.update(0.0, 1.0)
+        >>> w.has_clear_shots([(1.0, -1.0), (0.0, -1.0)]).tolist()
+        [False, True]
+        """
+        _, blocked = self.occlusions((self.ball.x, self.ball.y), points_to_kick, self.ball.radius)
+        return ~blocked.any(axis=1)
+
     def has_clear_shot(self, point_to_kick):
-        shot_line = geom.Line(self.ball, point_to_kick).buffer(self.ball.radius)
-        for robot in self.iterrobots():
-            if shot_line.crosses(robot.body):
-                return False
-        return True
+        return self.has_clear_shots([(point_to_kick.x, point_to_kick.y)])[0]
 
     def has_clear_shot_from_position(self, kicker_position, point_to_kick):
-        shot_line = geom.Line(kicker_position, point_to_kick)
-        for robot in self.iterrobots():
-            if shot_line.crosses(robot.body):
-                return False
-        return True
+        _, blocked = self.occlusions((kicker_position.x, kicker_position.y), (point_to_kick.x, point_to_kick.y))
+        return not blocked.any()
 
     def has_clear_pass(self, receiver):
-        shot_line = geom.Line(self.ball, receiver)
-        for robot in self.iterrobots():
-            if shot_line.crosses(robot.body) and robot != receiver:
-                return False
-        return True
+        _, blocked = self.occlusions((self.ball.x, self.ball.y), (receiver.x, receiver.y), exclude=(receiver,))
+        return not blocked.any()
+
+    def shot_openings(self, p1, p2, start=None, width=None, exclude=()):
+        """
+        Parts of the segment from p1 to p2 with a clear way from start.
+
+        start defaults to the ball and width, the half width of what's
+        traveling, to its radius. Returns the (t0, t1, angle) intervals of
+        utils.lineofsight.open_intervals, widest first, the active robots
+        but the ones in exclude cast the shadows. There are none from the
+        line of the segment or from behind it, seen from the field.
+        """
+        start = self.ball if start is None else start
+        width = self.ball.radius if width is None else width
+        _, centers, radii = self.state.discs(exclude=exclude)
+        # a single read of the coordinates of each point, they're costly on shapely
+        p1, p2 = p1.coords[0], p2.coords[0]
+        # behind the segment is the side away from the center of the field
+        return open_intervals((start.x, start.y), p1, p2, centers, radii, width, front=(0.0, 0.0))
+
+    def best_opening(self, p1, p2, **kwargs):
+        """Middle of the widest of the shot_openings from p1 to p2, None if there's none."""
+        openings = self.shot_openings(p1, p2, **kwargs)
+        if openings:
+            t0, t1, _ = openings[0]
+            t = (t0 + t1) / 2
+            (x1, y1), (x2, y2) = p1.coords[0], p2.coords[0]
+            return geom.Point(x1 + t * (x2 - x1), y1 + t * (y2 - y1))
 
     @property
     def yellow_team(self):
@@ -824,33 +1692,51 @@ class World(object):
 
     def is_in_defense_area(self, robot=None, body=None, color=None):
         if body and color:
+            if isinstance(body, geom.Circle):
+                stadium = self.goal(color).shapes.defense_stadium
+                return stadium.signed_distance((body.center.x, body.center.y)) < body.radius
             return (not self.defense_area(color).intersection(body).is_empty)  # or abs(body.centroid.x) > abs(self.goal(color).x)
         elif robot:
-            return self.defense_area(robot.color).contains(robot) or not self.defense_area(robot.color).intersection(robot.body).is_empty
+            stadium = self.goal(robot.color).shapes.defense_stadium
+            return stadium.signed_distance((robot.x, robot.y)) < robot.radius
+
+    def geometry_key(self):
+        """The current values of GEOMETRY_FIELDS, cached shapes are keyed on it."""
+        return tuple(getattr(self, f) for f in GEOMETRY_FIELDS)
+
+    def update_geometry(self):
+        """
+        Rebuild the goals if the field geometry changed since the last call,
+        returns whether it did. geometry_version counts the changes:
+
+        >>> w = World()
+        >>> w.update_geometry(), w.update_geometry(), w.geometry_version
+        (True, False, 1)
+        >>> w.length = 9.0
+        >>> w.update_geometry(), w.right_goal.x, w.geometry_version
+        (True, 4.5, 2)
+        """
+        geometry_hash = hash(self.geometry_key())
+        if geometry_hash == self.geometry_hash:
+            return False
+        self.geometry_hash = geometry_hash
+        self.geometry_version += 1
+        self.right_goal.update((self.length / 2, 0.0))
+        self.left_goal.update((-self.length / 2, 0.0))
+        return True
+
+    def field_geometry(self):
+        """GEOMETRY_FIELDS to their values, the same dict while they don't change."""
+        key = self.geometry_key()
+        if self._field_geometry is None or self._field_geometry[0] != key:
+            self._field_geometry = key, dict(zip(GEOMETRY_FIELDS, key))
+        return self._field_geometry[1]
 
     def defense_area(self, color):
-        goal = self.goal(color)
-        gx, gy = goal.x, goal.y
-        #goal_width = self.goal_width
-        defense_area_radius = self.defense_radius
-        defense_area_stretch = self.defense_stretch
-        line_to_buffer = geom.Line([(gx, gy + defense_area_stretch / 2), (gx, gy - defense_area_stretch / 2)])
-        return line_to_buffer.buffer(defense_area_radius)
+        return self.goal(color).shapes.defense_area
 
     def augmented_defense_area(self, robot, color):
-        goal = self.goal(color)
-        r = self.defense_radius
-        s = self.defense_stretch
-        l = (2 - sqrt(2)) * r
-        return geometry.Polygon((
-            (goal.x, r + s / 2),
-            (goal.x - sign(goal.x) * (r - l), r + s / 2),
-            (goal.x - sign(goal.x) * (r), r + s / 2 - l),
-            (goal.x - sign(goal.x) * (r), l - r - s / 2),
-            (goal.x - sign(goal.x) * (r - l), - r - s / 2),
-            (goal.x, -r - s / 2),
-            (goal.x, r + s / 2)
-        ))
+        return self.goal(color).shapes.augmented_defense_area
         #goal = self.goal(color)
         #gx, gy = goal.x, goal.y
         ##goal_width = self.goal_width
@@ -862,31 +1748,40 @@ class World(object):
     def closest_robot_to_ball(self, **kwargs):
         return self.closest_robot_to_point(self.ball, **kwargs)
 
-    def closest_robot_to_point(self, point, can_kick=True, color=None):
+    def closest_robot_to_point(self, point, can_kick=True, color=None, active=True):
         """
         Name says almost it all.
         can_kick: By default only robots that can_kick are considered.
           If can_kick is set to False, only robots that cannot kick are considered.
           If you want to consider both set can_kick to None.
         color: If specified will only consider robots from matching color.
+        active: Like can_kick, by default only active robots are considered.
         """
-        distance_robots_list = [(r.distance(point), r) for r in self.iterrobots(can_kick=can_kick, color=color)]
-        if distance_robots_list:
-            d, r = min(distance_robots_list)
-            return r
+        slots, distances = self.state.distances_to_point(point, can_kick=can_kick, color=color, active=active)
+        if len(slots):
+            return self.state.objects[slots[distances.argmin()]]
 
     def closest_robots_to_ball(self, **kwargs):
         return self.closest_robots_to_point(self.ball, **kwargs)
 
-    def closest_robots_to_point(self, point, can_kick=True, color=None):
+    def closest_robots_to_point(self, point, can_kick=True, color=None, active=True, k=None):
         """
         Name says almost it all.
         By default only robots that can_kick are considered.
         If can_kick is set to False, only robots that cannot kick are considered.
         If you want to consider both set can_kick to None.
-        It will return a list sorted by distance
+        It will return a list sorted by distance, with at most k robots if given.
+
+        >>> w = World()
+        >>> for uid, x in ((0, 2.0), (1, -1.0), (2, 0.5)):
+        ...     r = w.blue_team[uid]; r.update(x, 0.0); r.active = True
+        >>> origin = geom.Point(0.0, 0.0)
+        >>> [r.uid for r in w.closest_robots_to_point(origin)], [r.uid for r in w.closest_robots_to_point(origin, k=1)]
+        ([2, 1, 0], [2])
         """
-        return [r for d, r in sorted((r.distance(point), r) for r in self.iterrobots(can_kick=can_kick, color=color))]
+        slots, distances = self.state.distances_to_point(point, can_kick=can_kick, color=color, active=active)
+        objects = self.state.objects
+        return [objects[i] for i in slots[distances.argsort(kind='mergesort')[:k]]]
 
     @property
     def robots(self):
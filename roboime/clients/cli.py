@@ -14,6 +14,7 @@
 from threading import Thread
 from threading import Lock
 from collections import defaultdict
+from collections import deque
 from collections import OrderedDict
 from time import sleep
 from datetime import datetime
@@ -22,8 +23,10 @@ from numpy import mean
 from ..utils.geom import Point
 from ..interface import SimulationInterface
 from ..interface import TxInterface
+from ..interface.ioloop import IOLoop
 from ..base import World
 from ..core import Dummy
+from ..core.worker import SharedWorld, PlayWorker
 from ..core.skills import goto
 from ..core.skills import gotoavoid
 from ..core.skills import drivetoobject
@@ -52,6 +55,7 @@ from ..core.plays import obeyreferee
 from ..core.plays import halt
 from ..core.plays import ifrit
 from ..config import config
+from ..utils.scheduler import Scheduler, monotonic
 
 _individuals = {
     'dummy': lambda r: Dummy(),
@@ -94,6 +98,19 @@ def _get_team(self, team):
     elif team == 'yellow':
         return self.world.yellow_team
 
+def _use_play(self, team, play):
+    """
+    Give team the play named play, or built by play if it's a callable
+    taking the team. With play workers it's built on the worker of the team,
+    which takes the place of the play.
+    """
+    if self.workers is not None:
+        self.workers[team].set_play(play)
+        p = self.plays[team] = self.workers[team]
+    else:
+        p = self.plays[team] = (_plays[play] if isinstance(play, str) else play)(_get_team(self, team))
+    return p
+
 def _get_robot(self, team, robot):
     t = _get_team(self, team)
     if t is not None:
@@ -115,7 +132,7 @@ class _commands(object):
     def use_sim_interface(self):
         """use the simulator interface"""
         self.interface.stop()
-        self.interface = SimulationInterface(self.world)
+        self.interface = SimulationInterface(self.world, ioloop=self.ioloop)
         if self.strip_commanders:
             self.interface.commanders = []
         self.interface.start()
@@ -130,6 +147,7 @@ class _commands(object):
             mapping_blue=self.id_mapping["blue"],
             kick_mapping_yellow=self.kick_mapping["yellow"],
             kick_mapping_blue=self.kick_mapping["blue"],
+            ioloop=self.ioloop,
         )
         if self.strip_commanders:
             self.interface.commanders = []
@@ -160,8 +178,9 @@ class _commands(object):
 
     def halt(self):
         """halts both teams, resets all individuals"""
-        self.plays['blue'] = _plays['halt'](self.world.blue_team)
-        self.plays['yellow'] = _plays['halt'](self.world.yellow_team)
+        with self.step_lock:
+            _use_play(self, 'blue', 'halt')
+            _use_play(self, 'yellow', 'halt')
         for indv in self.individuals.itervalues():
             for i in indv:
                 indv[i] = Dummy()
@@ -170,8 +189,9 @@ class _commands(object):
     def stop(self):
         """stops both teams, resets all individuals"""
         #XXX: let the previous be gc'ed?
-        self.plays['blue'] = _plays['stop'](self.world.blue_team)
-        self.plays['yellow'] = _plays['stop'](self.world.yellow_team)
+        with self.step_lock:
+            _use_play(self, 'blue', 'stop')
+            _use_play(self, 'yellow', 'stop')
         for indv in self.individuals.itervalues():
             for i in indv:
                 indv[i] = Dummy()
@@ -190,15 +210,14 @@ class _commands(object):
         if isinstance(play, str):
             if play in _plays:
                 with self.step_lock:
-                    p = self.plays[team] = _plays[play](_get_team(self, team))
+                    p = _use_play(self, team, play)
                 self.write('ok')
                 return p
             else:
                 self.write('play {} does not exist'.format(play), ok=False)
         else:
             with self.step_lock:
-                p = self.plays[team] = play(_get_team(self, team))
-                return p
+                return _use_play(self, team, play)
 
     def set_individual(self, team, robot, individual):
         """set_individual <blue|yellow> robot individual"""
@@ -290,29 +309,63 @@ class _commands(object):
                 self.write('command "{}" not recognized'.format(cmd), ok=False)
 
     def set_step_delay(self, delay):
-        """set_step_delay delay (ms)"""
+        """set_step_delay delay (ms), the period of the loop, 0 to run as fast as possible"""
         try:
-            self.step_delay = float(delay)
-            self.write('delay set to {}'.format(self.step_delay))
-        except ValueError:
+            delay = float(delay)
+            self.scheduler.rate = 1000.0 / delay if delay else 0
+            self.write('delay set to {}'.format(delay))
+        except (ValueError, ZeroDivisionError):
             self.write('invalid delay {}'.format(delay), ok=False)
 
+    def set_rate(self, rate, policy=None):
+        """set_rate rate (Hz) [skip|catch_up], 0 to run as fast as possible"""
+        try:
+            rate = float(rate)
+            if policy is not None:
+                self.scheduler.policy = policy
+            self.scheduler.rate = rate
+            self.write('rate set to {} Hz, {}'.format(self.scheduler.rate, self.scheduler.policy))
+        except ValueError as e:
+            self.write('invalid rate: {}'.format(e), ok=False)
+
+    def print_rate(self):
+        """shows the loop rate, overruns and jitter"""
+        s = self.scheduler
+        self.write(
+            'rate:        {0.rate:8.1f} Hz ({0.policy})\n'
+            'ticks:       {0.ticks:8d}\n'
+            'overruns:    {0.overruns:8d}\n'
+            'skipped:     {0.skipped:8d}\n'
+            'jitter:      {1:8.3f}\n'
+            'jitter avg:  {2:8.3f}\n'
+            'jitter max:  {3:8.3f}'
+            .format(s, 1e3 * s.jitter, 1e3 * s.mean_jitter, 1e3 * s.max_jitter)
+        )
+
     def print_profile(self):
-        """shows interface, stp and total deltas"""
+        """shows interface, stp and total deltas, and the latency of the frames"""
+        # updater, between updater and commander, commander, missing when the commander didn't run
+        deltas = self.interface.profile_deltas
+        deltas = deltas + [0.0] * (3 - len(deltas))
         self.write(
             'interface delta:     {0.tdelta_interface: 8.3f}\n'
             'interface delta avg: {0.avg_tdelta_interface: 8.3f}\n'
             #'interface delta max: {0.max_tdelta_interface: 8.3f}\n'
             '  updater delta:     {1[0]: 8.3f}\n'
-            '  commander delta:   {1[1]: 8.3f}\n'
+            '  commander delta:   {1[2]: 8.3f}\n'
             'stp delta:           {0.tdelta_stp: 8.3f}\n'
             'stp delta avg:       {0.avg_tdelta_stp: 8.3f}\n'
             #'stp delta max:       {0.max_tdelta_stp: 8.3f}\n'
             'total delta:         {0.tdelta_step: 8.3f}\n'
             'total delta avg:     {0.avg_tdelta_step: 8.3f}\n'
             #'total delta max:     {0.max_tdelta_step: 8.3f}'
-            .format(self, self.interface.profile_deltas)
+            .format(self, deltas)
         )
+        percentiles = self.interface.latency.percentiles()
+        self.write('latency (ms)                p50      p90      p99      max\n' + '\n'.join(
+            '  {:22}'.format(name + ':') + ''.join('{: 9.3f}'.format(ms) for ms in q)
+            for name, q in percentiles.iteritems()
+        ))
 
     def print_max_deltas(self):
         """shows interface, stp and total deltas"""
@@ -327,9 +380,14 @@ class _commands(object):
             self.write('invalid speed {}'.format(speed), ok=False)
 
 
+# how long to wait for the next frame before looking again when stepping on the vision
+VISION_IDLE = 0.001
+
+
 class CLI(Thread):
 
-    step_delay = 0
+    # something to poll for commands, the ioloop reads them when set
+    command_source = None
     tdelta_interface = 0
     tdelta_stp = 0
     tdelta_step = 0
@@ -351,12 +409,27 @@ class CLI(Thread):
         self.strip_commanders = strip_commanders
         self.world = World()
 
+        # the play of each team on a worker process of its own, see core.worker, forked
+        # before the ioloop and the interface so they inherit none of their sockets
+        self.workers = None
+        if config['cli']['play_workers']:
+            self.shared_world = SharedWorld()
+            self.workers = {team: PlayWorker(_get_team(self, team).color, self.shared_world, _plays) for team in ('blue', 'yellow')}
+            for worker in self.workers.itervalues():
+                worker.start()
+
+        # with an ioloop everything runs on a single thread
+        self.ioloop = IOLoop() if config['cli']['io_loop'] else None
+        self.scheduler = Scheduler(config['cli']['rate'], config['cli']['rate_policy'])
+        self.trigger = config['cli']['trigger']
+        self.commands = deque()
+
         # initial interface:
         default_interface = config['interface']['default']
         if default_interface == 'sim':
-            self.interface = SimulationInterface(self.world)
+            self.interface = SimulationInterface(self.world, ioloop=self.ioloop)
         elif default_interface == 'tx':
-            self.interface = TxInterface(self.world)
+            self.interface = TxInterface(self.world, ioloop=self.ioloop)
         else:
             #TODO: proper exception
             raise RuntimeError('interface {} not recognized'.format(default_interface))
@@ -381,7 +454,6 @@ class CLI(Thread):
         self.individuals = {"blue": {i: Dummy() for i in range(max_robots)}, "yellow": {i: Dummy() for i in range(max_robots)}}
         self.step_lock = Lock()
 
-
     def read(self):
         raise NotImplementedError('This is what you get for trying to instance an abstract class.')
 
@@ -389,19 +461,38 @@ class CLI(Thread):
         raise NotImplementedError('This is what you get for trying to instance an abstract class.')
 
     def step(self):
+        """
+        Update the world, run the plays and send the commands. When stepping
+        on the vision, nothing runs until there's a new frame. Returns whether
+        it ran.
+        """
+        interface = self.interface
         t0 = datetime.now()
-        self.interface.step()
+        fresh = interface.update()
+        if not fresh and self.trigger == 'vision':
+            return False
+        filtered = monotonic()
         t1 = datetime.now()
         with self.step_lock:
-            for p in self.plays.itervalues():
-                p.step()
+            if self.workers is not None:
+                self.step_workers()
+            else:
+                for p in self.plays.itervalues():
+                    p.step()
+            # individuals still override what the plays did
             for t in self.individuals.itervalues():
                 for i in t.itervalues():
                     i.step()
+        planned = monotonic()
         t2 = datetime.now()
-        self.tdelta_interface = (t1 - t0).microseconds / 1000.0
+        interface.command()
+        if fresh:
+            w = self.world
+            interface.latency.stamp(w.timestamp, w.t_sent, w.t_received, filtered, planned, monotonic())
+        t3 = datetime.now()
+        self.tdelta_interface = ((t1 - t0) + (t3 - t2)).microseconds / 1000.0
         self.tdelta_stp = (t2 - t1).microseconds / 1000.0
-        self.tdelta_step = (t2 - t0).microseconds / 1000.0
+        self.tdelta_step = (t3 - t0).microseconds / 1000.0
         if self.tdelta_interface > self.max_tdelta_interface:
             self.max_tdelta_interface = self.tdelta_interface
         if self.tdelta_stp > self.max_tdelta_stp:
@@ -417,6 +508,22 @@ class CLI(Thread):
         self.window_tdelta_step.pop(0)
         self.window_tdelta_step.append(self.tdelta_step)
         self.avg_tdelta_step = mean(self.window_tdelta_step)
+        return True
+
+    def step_workers(self):
+        """Step the play of each team on its worker, both at once, and merge the actions they leave."""
+        frame = self.shared_world.write(self.world)
+        for team, worker in self.workers.iteritems():
+            worker.step(frame, _get_team(self, team))
+        # every worker is collected, or the next step would get the replies of this one
+        errors = []
+        for team, worker in self.workers.iteritems():
+            try:
+                worker.collect(_get_team(self, team))
+            except RuntimeError as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
 
     def cli_loop(self):
         """
@@ -428,38 +535,59 @@ class CLI(Thread):
         sleep(1)
         self.write("hello, intel is up!")
 
-        while True:
-            _cmd = self.read()
-            cmd, args = _cmd['cmd'], _cmd['args']
+        while not self.quit:
+            self.command(self.read())
 
-            if cmd == 'q' or cmd == 'quit' or cmd == 'exit':
-                # quit is special because it breaks the loop
-                self.quit = True
-                self.write('bye...')
-                break
+    def command(self, _cmd):
+        cmd, args = _cmd['cmd'], _cmd['args']
+
+        if cmd == 'q' or cmd == 'quit' or cmd == 'exit':
+            # quit is special because it breaks the loop
+            self.quit = True
+            self.write('bye...')
+        else:
+            if cmd in self.cmd_dict:
+                cmd_func = self.cmd_dict[cmd].im_func
+                try:
+                    cmd_func(self, *args)
+                except TypeError as e:
+                    self.write('{}: {}'.format(e.__class__.__name__, e), ok=False)
+                    self.write('{0.func_name}: {0.func_doc}'.format(cmd_func), ok=False)
+                except Exception as e:
+                    self.write('{}: {}'.format(e.__class__.__name__, e), ok=False)
             else:
-                if cmd in self.cmd_dict:
-                    cmd_func = self.cmd_dict[cmd].im_func
-                    try:
-                        cmd_func(self, *args)
-                    except TypeError as e:
-                        self.write('{}: {}'.format(e.__class__.__name__, e), ok=False)
-                        self.write('{0.func_name}: {0.func_doc}'.format(cmd_func), ok=False)
-                    except Exception as e:
-                        self.write('{}: {}'.format(e.__class__.__name__, e), ok=False)
-                else:
-                    self.write('command "{}" not recognized'.format(cmd), ok=False)
+                self.write('command "{}" not recognized'.format(cmd), ok=False)
 
     def interface_loop(self):
+        self.scheduler.start()
         while True:
-            sleep(self.step_delay / 1000)
-            self.step()
+            stepped = self.step()
+            # commands read on the ioloop run between steps
+            while self.commands:
+                self.command(self.commands.popleft())
             if self.quit:
                 self.stop()
                 break
+            if self.trigger == 'vision':
+                if not stepped:
+                    self.idle(VISION_IDLE)
+            else:
+                self.scheduler.wait(self.idle)
+
+    def idle(self, seconds):
+        """Wait, whatever arrives meanwhile is read right away on the ioloop, which returns early then."""
+        if self.ioloop is None:
+            sleep(seconds)
+        else:
+            self.ioloop.poll(1e3 * seconds)
 
     def start(self):
         self.interface.start()
+        if self.ioloop is not None and self.command_source is not None:
+            self.ioloop.register(self.command_source, lambda: self.commands.append(self.read()))
+            self.write("hello, intel is up!")
+            self.interface_loop()
+            return
         super(CLI, self).start()
         if self.cli_main:
             self.cli_loop()
@@ -474,6 +602,10 @@ class CLI(Thread):
 
     def stop(self):
         self.interface.stop()
+        self.world.planner.close()
+        if self.workers is not None:
+            for worker in self.workers.itervalues():
+                worker.stop()
 
     def mainloop(self):
         try:
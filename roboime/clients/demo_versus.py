@@ -59,3 +59,4 @@ class Demo(object):
                 self.loop()
         except KeyboardInterrupt:
             self.interface.stop()
+            self.world.planner.close()
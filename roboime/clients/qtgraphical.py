@@ -506,6 +506,7 @@ class Intelligence(QtCore.QThread):
         finally:
             self.interface.stop()
             self.tx_interface.stop()
+            self.world.planner.close()
 
 
 class App(QtGui.QApplication):
@@ -26,6 +26,7 @@ class Server(CLI):
         self.puller = ctx.socket(zmq.PULL)
         self.publisher.bind(config['zmq']['pub'])
         self.puller.bind(config['zmq']['pull'])
+        self.command_source = self.puller
         print 'cli publishing to {}'.format(config['zmq']['pub'])
         print 'cli pulling on {}'.format(config['zmq']['pull'])
 
@@ -144,3 +144,4 @@ class Simple(object):
                 self.loop()
         except KeyboardInterrupt:
             self.interface.stop()
+            self.world.planner.close()
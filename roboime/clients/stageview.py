@@ -94,45 +94,50 @@ class StageView(QGraphicsView):
     def redraw(self):
         scene = self.scene()
 
-        with self.world as w:
-            # Update robot skills
-            skills = set(map(lambda r: r.skill, w.robots))
-            prev_skills = set(self.scene_skills.keys())
-
-            for skill in (skills & prev_skills):
-                if not self.scene_skills[skill].isVisible():
-                    self.scene_skills[skill].show()
-
-            for skill in (prev_skills - skills):
-                if self.scene_skills[skill].isVisible():
-                    self.scene_skills[skill].hide()
-
-            for skill in (skills - prev_skills):
-                view = skillviews.view_selector(skill)
-                if view is not None:
-                    scene.addItem(view)
-                    self.scene_skills[skill] = view
-
-            # Update robot tactics
-            tactics = set(map(lambda r: r.tactic, w.robots))
-            prev_tactics = set(self.scene_tactics.keys())
-
-            for tactic in (tactics & prev_tactics):
-                if not self.scene_tactics[tactic].isVisible():
-                    self.scene_tactics[tactic].show()
-
-            for tactic in (prev_tactics - tactics):
-                if self.scene_tactics[tactic].isVisible():
-                    self.scene_tactics[tactic].hide()
-
-            for tactic in (tactics - prev_tactics):
-                view = tacticviews.view_selector(tactic)
-                if view is not None:
-                    scene.addItem(view)
-                    self.scene_tactics[tactic] = view
-
-            for i in scene.items():
-                i.position()
+        # no locking here, nor any reading of the world, the skills and tactics of the active
+        # robots come from the latest snapshot published by the intelligence thread and the
+        # world views read from it too
+        snapshot = self.world.snapshot
+        slots = snapshot.active_slots() if snapshot is not None else []
+
+        # Update robot skills
+        skills = set(snapshot.skill_objects[i] for i in slots)
+        prev_skills = set(self.scene_skills.keys())
+
+        for skill in (skills & prev_skills):
+            if not self.scene_skills[skill].isVisible():
+                self.scene_skills[skill].show()
+
+        for skill in (prev_skills - skills):
+            if self.scene_skills[skill].isVisible():
+                self.scene_skills[skill].hide()
+
+        for skill in (skills - prev_skills):
+            view = skillviews.view_selector(skill)
+            if view is not None:
+                scene.addItem(view)
+                self.scene_skills[skill] = view
+
+        # Update robot tactics
+        tactics = set(snapshot.tactic_objects[i] for i in slots)
+        prev_tactics = set(self.scene_tactics.keys())
+
+        for tactic in (tactics & prev_tactics):
+            if not self.scene_tactics[tactic].isVisible():
+                self.scene_tactics[tactic].show()
+
+        for tactic in (prev_tactics - tactics):
+            if self.scene_tactics[tactic].isVisible():
+                self.scene_tactics[tactic].hide()
+
+        for tactic in (tactics - prev_tactics):
+            view = tacticviews.view_selector(tactic)
+            if view is not None:
+                scene.addItem(view)
+                self.scene_tactics[tactic] = view
+
+        for i in scene.items():
+            i.position()
 
         scene.update()
 
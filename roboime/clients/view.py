@@ -61,6 +61,7 @@ class FieldCanvas(Canvas):
         self['height'] = 100 * (self.field_width + 2 * self.field_margin)
         self.robots = {}
         self.balls = {}
+        self.closest_robot = None
 
         self.fps = self.create_text(50, 20, fill=BLACK)
 
@@ -94,7 +95,7 @@ class FieldCanvas(Canvas):
             self._cy(robot.y + robot.radius),
         )
         self.itemconfig(r, start=(robot.angle + 180 - self.anglespan / 2))
-        if robot is self.world.closest_robot_to_ball():
+        if robot is self.closest_robot:
             self.itemconfig(r, outline=BLACK)
         else:
             self.itemconfig(r, outline=FIELD_GREEN)
@@ -169,6 +170,7 @@ class FieldCanvas(Canvas):
         if self.has_field:
             self.draw_ball(world.ball)
             # draw all robots on the field
+            self.closest_robot = world.closest_robot_to_ball()
             for r in world.iterrobots():
                 self.draw_robot(r)
             # remove missing robots
@@ -273,3 +275,4 @@ class View(Tk):
         self.redraw()
         Tk.mainloop(self)
         self.interface.stop()
+        self.world.planner.close()
@@ -19,6 +19,7 @@ from .qtutils import draw_arc
 from .qtutils import BLACK, BLUE, GREEN, YELLOW, LIGHT_GREY, ORANGE, WHITE
 
 from ..utils.mathutils import acos
+from ..base import X, Y, ANGLE
 
 
 # some known uuids
@@ -26,6 +27,29 @@ BALL = 0xba11
 FIELD = 0xf1e1d
 
 
+def robot_pose(robot):
+    """
+    (x, y, angle) of robot on the latest snapshot of its world.
+
+    Reading from the snapshot doesn't race with the intelligence thread,
+    the live robot is only used until a snapshot is published.
+    """
+    snapshot = robot.world.snapshot if robot.world is not None else None
+    row = snapshot.robot(robot.color, robot.uid) if snapshot is not None else None
+    if row is None:
+        return robot.x, robot.y, robot.angle or 0.0
+    angle = row[ANGLE]
+    return row[X], row[Y], 0.0 if angle != angle else angle
+
+
+def ball_position(ball):
+    """(x, y) of ball on the latest snapshot of its world."""
+    snapshot = ball.world.snapshot
+    if snapshot is None:
+        return ball.x, ball.y
+    return snapshot.ball[X], snapshot.ball[Y]
+
+
 class RobotIdView(QGraphicsItem):
     def __init__(self, robot):
         super(RobotIdView, self).__init__()
@@ -35,7 +59,8 @@ class RobotIdView(QGraphicsItem):
         return QRectF(-80, -80, 160, 160)
 
     def position(self):
-        x, y = s(self.robot)
+        x, y, _ = robot_pose(self.robot)
+        x, y = s(x, y)
         self.setPos(x, -y)
 
     def paint(self, painter, option, widget=None):
@@ -56,6 +81,7 @@ class RobotView(QGraphicsItem):
         self.robot = robot
         self.outline = QPainterPath()
         self.cut_angle = 0.0
+        self.rotation = 0.0
         self.setFlags(QGraphicsItem.ItemIsSelectable)
 
     @property
@@ -74,7 +100,8 @@ class RobotView(QGraphicsItem):
             return BLACK
 
     def position(self):
-        x, y, width, height = s(self.robot.x, self.robot.y, self.robot.world.length, self.robot.world.width)
+        x, y, self.rotation = robot_pose(self.robot)
+        x, y, width, height = s(x, y, self.robot.world.length, self.robot.world.width)
         radius = s(self.robot.radius)
 
         self.cut_angle = acos(self.robot.front_cut / self.robot.radius)
@@ -100,7 +127,7 @@ class RobotView(QGraphicsItem):
         painter.setBrush(color)
         painter.setPen(color)
 
-        robot_rotation = self.robot.angle or 0.0
+        robot_rotation = self.rotation
         # Draw robot shape
         painter.rotate(-self.cut_angle - robot_rotation)
         painter.drawPath(self.outline)
@@ -225,7 +252,8 @@ class BallView(QGraphicsItem):
         return QRectF(-radius, -radius, 2 * radius, 2 * radius)
 
     def position(self):
-        x, y, width, height = s(self.ball.x, self.ball.y, self.ball.world.length, self.ball.world.width)
+        x, y = ball_position(self.ball)
+        x, y, width, height = s(x, y, self.ball.world.length, self.ball.world.width)
         self.setPos(x, -y)
 
     def paint(self, painter, option, widget=None):
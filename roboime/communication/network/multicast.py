@@ -12,9 +12,13 @@
 # GNU Affero General Public License for more details.
 #
 import socket
+from errno import EAGAIN, EWOULDBLOCK
 
 MULTICAST_TTL = 20
-MAX_BUFFER_SIZE = 1024
+MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0)
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+# the largest datagram there can be
+MAX_BUFFER_SIZE = 65536
 
 
 class Multicast(object):
@@ -26,6 +30,12 @@ class Multicast(object):
     def close(self):
         self._sock.close()
 
+    def fileno(self):
+        return self._sock.fileno()
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+
     @property
     def group(self):
         return self.address[0]
@@ -58,10 +68,22 @@ class MulticastSender(Multicast):
 
 
 class MulticastReceiver(Multicast):
-    """Extension of socket for receiving multicast messages."""
+    """
+    Extension of socket for receiving multicast messages.
 
-    def __init__(self, address, intf):
+    Datagrams are read into buffers allocated once, buffer_size bytes each,
+    as many as can be drained at a time. Those that don't fit are dropped
+    and counted as truncated. rcvbuf sets the size of the socket receive
+    buffer, the kernel default when None.
+    """
+
+    def __init__(self, address, intf, buffer_size=MAX_BUFFER_SIZE, buffers=1, rcvbuf=None):
         Multicast.__init__(self, address)
+        self.buffers = [bytearray(buffer_size) for _ in xrange(buffers)]
+        self._views = [memoryview(b) for b in self.buffers]
+        self.received = 0
+        self.truncated = 0
+        self.drains = 0
 
         # Set some options to make it multicast-friendly
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -72,6 +94,8 @@ class MulticastReceiver(Multicast):
             pass
         self._sock.setsockopt(socket.SOL_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
         self._sock.setsockopt(socket.SOL_IP, socket.IP_MULTICAST_LOOP, 1)
+        if rcvbuf:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
 
         # Bind to the port
         self._sock.bind(('', self.port))
@@ -80,11 +104,50 @@ class MulticastReceiver(Multicast):
         self._sock.setsockopt(socket.SOL_IP, socket.IP_MULTICAST_IF, socket.inet_aton(intf) + socket.inet_aton('0.0.0.0'))
         self._sock.setsockopt(socket.SOL_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(self.group) + socket.inet_aton('0.0.0.0'))
 
-    def recv(self, buf_size=MAX_BUFFER_SIZE):
-
-        # Receive the data, then unregister multicast receive membership, then close the port
-        data, sender_addr = self._sock.recvfrom(buf_size)
-        return data
+    def recv_into(self, view, flags=0):
+        """
+        Read a datagram into view. Returns its size, None if it didn't fit.
+
+        With MSG_TRUNC the size is the one of the whole datagram, not of
+        what fit. Without it, on systems that lack it, a datagram that
+        fills the buffer is taken as truncated.
+        """
+        size = self._sock.recv_into(view, 0, flags | MSG_TRUNC)
+        self.received += 1
+        if size > len(view) or (not MSG_TRUNC and size == len(view)):
+            self.truncated += 1
+            return None
+        return size
+
+    def recv(self):
+        """The next datagram that fits the buffer, blocking until there's one."""
+        while True:
+            size = self.recv_into(self._views[0])
+            if size is not None:
+                return self._views[0][:size].tobytes()
+
+    def drain(self, block=False):
+        """
+        The datagrams waiting on the socket, up to one per buffer. When block
+        is set waits for the first one.
+
+        These are views on the buffers, valid until the next drain.
+        """
+        datagrams = []
+        flags = 0 if block else MSG_DONTWAIT
+        self.drains += 1
+        for view in self._views:
+            try:
+                size = self.recv_into(view, flags)
+            except socket.error as e:
+                if e.errno in (EAGAIN, EWOULDBLOCK):
+                    break
+                raise
+            flags = MSG_DONTWAIT
+            if size is not None:
+                datagrams.append(view[:size])
+        return datagrams
 
     def close(self):
         self._sock.setsockopt(socket.SOL_IP, socket.IP_DROP_MEMBERSHIP, socket.inet_aton(self.group) + socket.inet_aton('0.0.0.0'))
+        Multicast.close(self)
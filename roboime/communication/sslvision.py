@@ -13,7 +13,7 @@
 #
 from google.protobuf.message import DecodeError
 
-from .network.multicast import MulticastReceiver
+from .network.multicast import MulticastReceiver, MAX_BUFFER_SIZE
 from .protos.messages_robocup_ssl_wrapper_pb2 import SSL_WrapperPacket as Wrapper
 
 
@@ -28,13 +28,28 @@ class VisionReceiver(MulticastReceiver):
     >>> packet = receiver.get_packet()
     """
 
-    def __init__(self, address, intf):
-        MulticastReceiver.__init__(self, address, intf)
+    def __init__(self, address, intf, buffer_size=MAX_BUFFER_SIZE, buffers=1, rcvbuf=None):
+        MulticastReceiver.__init__(self, address, intf, buffer_size, buffers, rcvbuf)
+        # datagrams that could not be decoded
+        self.dropped = 0
 
     def get_packet(self):
         wrapper = Wrapper()
         try:
             wrapper.ParseFromString(self.recv())
         except DecodeError:
-            pass
+            self.dropped += 1
         return wrapper
+
+    def get_packets(self, block=True):
+        """The packets drained from the socket, see drain."""
+        packets = []
+        for data in self.drain(block):
+            wrapper = Wrapper()
+            try:
+                wrapper.ParseFromString(data)
+            except DecodeError:
+                self.dropped += 1
+                continue
+            packets.append(wrapper)
+        return packets
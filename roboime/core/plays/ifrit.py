@@ -11,7 +11,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array, sign
+from numpy import array, sign, ones
+from numpy.linalg import norm
 
 from .. import Play
 from ..tactics.goalkeeper import Goalkeeper
@@ -21,10 +22,9 @@ from ..tactics.defender import Defender
 from ..tactics.executepass import ExecutePass
 #from ..tactics.receivepass import ReceivePass
 from ..tactics.receivepassandkick import ReceivePassAndKick
-from ...utils.mathutils import angle_between
+from ...utils.mathutils import angle_between, cos
 from ...utils.geom import Point, Line
-
-from numpy import linspace
+from ...utils.fieldgrid import FieldGrid
 
 
 class Ifrit(Play):
@@ -87,8 +87,15 @@ class Ifrit(Play):
 
         # Here we split from autoretaliate.
         # We'll find now the best position for our pivot to receive a possible pass.
-        #self.best_position = self.best_receiver_positions(self.team[atk_id], self.last_passer)[0][0]
-        self.best_position = self.crude_receiver_positions(self.team[atk_id], self.last_passer)[0][0]
+        # the best position is too slow for the frame, it's planned off it when the planner has threads
+        # and the crude one is used until there's a recent one, or when there's none
+        passer = self.team[atk_id]
+        best = self.world.planner.plan(self, 'receiver', self.world.frame_number,
+                                       lambda: self.receiver_positions_job(passer, self.last_passer), lambda: [(None, 0)])
+        if best[0][0] is not None:
+            self.best_position = Point(*best[0][0])
+        else:
+            self.best_position = self.crude_receiver_positions(passer, self.last_passer)[0][0]
         if self.best_position:
             robots_closest_to_bathtub = self.team.closest_robots_to_point(point=self.best_position)
             if self.team[atk_id] in robots_closest_to_bathtub:
@@ -168,6 +175,22 @@ class Ifrit(Play):
             print angle1, angle2
         return abs(angle1) < 70 and abs(angle2) < 70 and (not Line(point, passer.enemy_goal.p1).crosses(passer.body)) and (not Line(point, passer.enemy_goal.p2).crosses(passer.body))
 
+    def valid_positions(self, grid, ball, passer, radius, posts):
+        """
+        Like is_valid_position, for all the cells of a FieldGrid at once, on
+        plain values: the (x, y) of the ball and of the passer, its radius,
+        and the (x, y) of the posts of the goal it's kicking to.
+        """
+        ball = array(ball)
+        valid = ones(len(grid), dtype=bool)
+        incoming = grid.points - ball
+        for post in posts:
+            outgoing = array(post) - grid.points
+            cos_angle = (incoming * outgoing).sum(axis=1) / (norm(incoming, axis=1) * norm(outgoing, axis=1))
+            valid &= cos_angle > cos(70)
+            valid &= grid.visible_to(post, [passer], radius)
+        return valid
+
     def crude_receiver_positions(self, passer, current_position, target=None):
         """
         Effectly does what the method below should do, except using a stupid approach.
@@ -193,6 +216,16 @@ class Ifrit(Play):
         first):
         [(point, distance_to_target), (point, distance_to_target), (point, distance_to_target), ...]
         """
+        job = self.receiver_positions_job(passer, current_position, target, precision)
+        return [(Point(*xy) if xy is not None else None, cost) for xy, cost in job()]
+
+    def receiver_positions_job(self, passer, current_position, target=None, precision=6):
+        """
+        best_receiver_positions in two parts: what it needs of the world is
+        taken now, as copies, and the returned function makes the search on
+        them alone, so it can run off the frame. The function returns
+        ((x, y), cost) tuples instead of Points.
+        """
         # TODO: aim for the best spot in the goal, not only to the middle of the enemy goal
 
         #t = self.team
@@ -201,8 +234,6 @@ class Ifrit(Play):
         if target is None:
             target = self.team.enemy_goal
 
-        candidate = []
-        #candidate_no_vision = []
         safety_margin = 2 * self.team[0].radius + 0.1
 
         # field params:
@@ -210,31 +241,23 @@ class Ifrit(Play):
         f_w = self.world.width - safety_margin
 
         # candidate points in the field range
-        for x in linspace(-f_l / 2, f_l / 2, precision):
-            for y in linspace(-f_w / 2, f_w / 2, precision - 2):
-                pt = Point(x, y)
-                if not self.is_valid_position(pt, passer):
-                    acceptable = False
-                else:
-                    acceptable = True
-                final_line = Point(0, 0)
-                for enemy in self.team.enemy_team.iterrobots():
-                    # if the robot -> pt line doesn't cross any enemy body...
-                    start_line = Line(b, pt)
-                    if start_line is not None and not start_line.crosses(enemy.body):
-                        final_line = Line(pt, target)
-                        # if the pt -> target line crosses any enemy body...
-                        if final_line.crosses(enemy.body):
-                            acceptable = False
-                if acceptable:
-                    if current_position is not None:
-                        candidate += [(pt, pt.distance(current_position))]
-                    else:
-                        candidate += [(pt, 0)]
-        if not candidate and current_position is not None:
-            #goal_point = self.enemy_goal
-            return [(None, 0)]
-        elif current_position is None:
-            return [(Point(self.team.goal.x - sign(self.team.goal.x) * 1.5, self.team.goal.y - 1), 0)]
-        else:
-            return sorted(candidate, key=lambda tup: tup[1])
+        grid = FieldGrid(self.world, precision, precision - 2, length=f_l, width=f_w, avoid_defense_areas=False)
+        _, centers, radii = self.world.state.discs(color=self.team.enemy_team.color)
+        ball, goal, ball_radius = (b.x, b.y), target.coords[0], b.radius
+        passer_xy, radius = (passer.x, passer.y), passer.radius
+        posts = [post.coords[0] for post in (passer.enemy_goal.p1, passer.enemy_goal.p2)]
+        current = tuple(current_position.vec) if current_position is not None else None
+        own_goal = self.team.goal.x, self.team.goal.y
+
+        def job():
+            if current is None:
+                return [((own_goal[0] - sign(own_goal[0]) * 1.5, own_goal[1] - 1), 0)]
+            acceptable = grid.visible_from(ball, centers, radii, ball_radius)
+            acceptable &= grid.visible_to(goal, centers, radii)
+            acceptable &= self.valid_positions(grid, ball, passer_xy, radius, posts)
+            candidate = grid.rank([(1.0, lambda g: g.distances(current))], mask=acceptable)
+            if not candidate:
+                #goal_point = self.enemy_goal
+                return [(None, 0)]
+            return candidate
+        return job
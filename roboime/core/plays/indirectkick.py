@@ -16,6 +16,7 @@ from ..tactics.zickler43 import Zickler43
 #from ..skills.sampledchipkick import SampledChipKick
 from ..tactics.executepass import ExecutePass
 from ..tactics.receivepass import ReceivePass
+from ...utils.geom import Point
 from ...utils.statemachine import Machine as StateMachine, State, Transition
 
 
@@ -26,6 +27,9 @@ class IndirectKick(Stop, StateMachine):
     a pass to it.
     """
 
+    # precision of the grid the receiver spot is planned on
+    fine_precision = 30
+
     def __init__(self, team, **kwargs):
         super(IndirectKick, self).__init__(team, deterministic=True, **kwargs)
         #Stop.__init__(self, team, **kwargs)
@@ -75,11 +79,24 @@ class IndirectKick(Stop, StateMachine):
             return l[0]
         return None
 
+    def plan_position(self):
+        """
+        The best spot for the receiver on a fine grid, planned off the frame
+        when the planner has threads, on the coarse one while there's none
+        recent, or when it has none.
+        """
+        planned = self.world.planner.plan(
+            self, 'position', self.world.frame_number,
+            lambda: self.team.indirect_positions_job(precision=self.fine_precision, k=1),
+            lambda: self.team.indirect_positions_job(k=1)(),
+        )
+        return Point(*planned[0][0])
+
     def setup_tactics(self):
         Stop.setup_tactics(self)
         self.log.debug(self.current_state)
         if self.current_state == self.states['starting']:
-            self.best_position = self.team.best_indirect_positions()[0][0]
+            self.best_position = self.plan_position()
             robots_closest_to_ball = self.team.closest_robots_to_ball()
             # TODO: Think of a better name
             robots_closest_to_bathtub = self.team.closest_robots_to_point(point=self.best_position)
@@ -117,7 +134,7 @@ class IndirectKick(Stop, StateMachine):
             #        robot.current_tactic = Steppable()
 
         elif self.current_state == self.states['pass']:
-            self.best_position = self.team.best_indirect_positions()[0][0]
+            self.best_position = self.plan_position()
 
             self.players[self.passer.uid]['passer'].companion = self.players[self.receiver.uid]['receiver']
             self.players[self.receiver.uid]['receiver'].companion = self.players[self.passer.uid]['passer']
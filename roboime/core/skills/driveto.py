@@ -12,12 +12,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array
-from numpy.linalg import norm
-
 from .goto import Goto
-from ...utils.mathutils import cos, sin
-from ...utils.geom import Point
+from ...utils.geom import Point, Vec2
 
 
 class DriveTo(Goto):
@@ -81,12 +77,12 @@ class DriveTo(Goto):
         self._base_point = point
 
     def _step(self):
-        # make numpy arrays out of base_point and threshold with base_angle direction so we can sum them
-        p1 = array(self.base_point)
-        p2 = array([cos(self.base_angle), sin(self.base_angle)]) * self.threshold
+        # the base point plus threshold in the base_angle direction
+        p1 = Vec2.of(self.base_point)
+        p2 = Vec2.polar(self.threshold, self.base_angle)
 
         # sum'em and let Goto do its thing
-        self.target = Point(p1 + p2)
+        self.target = (p1 + p2).point()
         super(DriveTo, self)._step()
 
     def bad_position(self):
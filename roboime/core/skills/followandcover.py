@@ -11,11 +11,8 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array
-from numpy.linalg import norm
-
 from .goto import Goto
-from ...utils.geom import Point
+from ...utils.geom import Vec2
 
 
 class FollowAndCover(Goto):
@@ -46,12 +43,11 @@ class FollowAndCover(Goto):
         self.distance = distance
 
     def _step(self):
-        # vector from follow to cover:
-        f2c = array(self.cover) - array(self.follow)
-        # normalized:
-        vec = f2c / norm(f2c)
+        follow = Vec2.of(self.follow)
+        # vector from follow to cover, normalized:
+        vec = (Vec2.of(self.cover) - follow).normalized()
         # target is follow displaced of distance over vec
-        self.target = Point(array(self.follow) + vec * self.distance)
+        self.target = (follow + vec * self.distance).point()
 
         # let Goto do its thing
         super(FollowAndCover, self)._step()
@@ -11,11 +11,10 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array, linspace
-from numpy.linalg import norm
+from numpy import linspace, column_stack
 
 from .. import Skill
-from ...utils.geom import Point
+from ...utils.geom import Point, Vec2
 from ...utils.pidcontroller import PidController
 from ...base import Action
 
@@ -28,6 +27,8 @@ class Goto(Skill):
     min_dist = 0.25
     max_recursive = 3
     divisions = 10
+    # how far the target may move before a path planned for it is dropped
+    replan_distance = 0.05
 
     # distance to consider target arrival
     arrive_distance = 1e-3
@@ -60,16 +61,38 @@ class Goto(Skill):
         self.collision_distance = self.robot.radius * 1.5
 
     def arrived(self):
-        dist = array(self.robot) - array(self.target)
-        return norm(dist) <= self.arrive_distance
+        return self.robot.vec.distance(Vec2.of(self.target)) <= self.arrive_distance
 
     def oriented(self):
         angle = (180 + self.angle - self.robot.angle) % 360 - 180
         return abs(angle) <= self.max_angle_error
 
     def _step(self):
+        """
+        Head to the target planned for the final one, standing still once
+        on it:
+
+        >>> from ...base import World
+        >>> from ...utils.geom import Point
+        >>> w = World()
+        >>> r = w.blue_team[0]; r.update(1.0, 0.5); r.angle = 0.0; r.active = True
+        >>> goto = Goto(r, target=Point(1.0, 0.5))
+        >>> goto._step(); r.action.absolute_speeds
+        (0.0, 0.0, 0.0)
+        """
         final = self.final_target if self.ignore_defense_area else self.robot.goal.point_outside_area(self.final_target)
-        self.target = self.path_planner(final)
+        # planned off the frame on copies of what the world is now, a shallower plan is made
+        # here when it's too old or was made for a target farther than replan_distance, the
+        # full one when the planner has no threads
+        goal, position, robots = Vec2.of(final), self.robot.vec, [r.vec for r in self.get_robots()]
+        final_target = Vec2.of(self.final_target)
+        stadium = None if self.ignore_defense_area else self.robot.goal.shapes.area_stadium
+        plan = lambda depth: lambda: self.path_planner(goal, depth, robots, position, final_target, stadium)
+        self.target = self.world.planner.plan(
+            self, 'path', self.world.frame_number, lambda: plan(0),
+            plan(self.max_recursive - 1) if self.world.planner.threads else plan(0),
+            key=(round(goal.x / self.replan_distance), round(goal.y / self.replan_distance)),
+        )
 
         if self.decoupled:
             a = self.angle or r.angle or 0.0
@@ -86,41 +109,55 @@ class Goto(Skill):
         else:
             va = 0.0
 
-        diff_to_final = array(final) - array(self.robot)
-        diff = array(self.target) - array(self.robot)
-        vel = self.robot.max_speed if norm(diff_to_final) > self.deaccel_dist else self.robot.max_speed * norm(diff)
-        v = vel * diff / norm(diff)
-        self.robot.action.absolute_speeds = v[0], v[1], va
-
-    def path_planner(self, target, depth=0):
-        diff = array(target) - array(self.robot)
-
-        if self.avoid_collisions and depth < self.max_recursive and norm(diff) > self.min_dist:
-
-            # TODO: Rewrite the python's way
-            points = []
-            x = linspace(target.x, self.robot.x, self.divisions)
-            y = linspace(target.y, self.robot.y, self.divisions)
-            for i in xrange(self.divisions):
-                if self.ignore_defense_area:
-                    points.append(Point(x[i], y[i]))
-                else:
-                    points.append(self.robot.goal.point_outside_area(Point(x[i], y[i])))
-            points.pop(0)
-
-            robots = self.get_robots()
-            for point in points:
+        position = self.robot.vec
+        diff_to_final = Vec2.of(final) - position
+        diff = Vec2.of(self.target) - position
+        vel = self.robot.max_speed if diff_to_final.norm() > self.deaccel_dist else self.robot.max_speed * diff.norm()
+        # right on the target there's nowhere to head to
+        v = diff.normalized() * vel
+        self.robot.action.absolute_speeds = v.x, v.y, va
+
+    def path_planner(self, target, depth=0, robots=None, position=None, final=None, stadium=None):
+        """
+        Where to head to on the way to target, around the robots in between.
+
+        What's not given is read from the world: the Vec2s of the robots to
+        avoid and of this one, the final target and the Stadium to keep out
+        of, unless ignore_defense_area. Given all of them it reads nothing
+        else and can run off the frame. Detours are Vec2s.
+        """
+        if position is None:
+            position = self.robot.vec
+        if final is None:
+            final = Vec2.of(self.final_target)
+        if stadium is None and not self.ignore_defense_area:
+            stadium = self.robot.goal.shapes.area_stadium
+        goal = Vec2.of(target)
+        diff = goal - position
+
+        if self.avoid_collisions and depth < self.max_recursive and diff.norm() > self.min_dist:
+
+            xy = column_stack((
+                linspace(goal.x, position.x, self.divisions),
+                linspace(goal.y, position.y, self.divisions),
+            ))
+            if stadium is not None:
+                xy = stadium.project_out(xy)
+
+            if robots is None:
+                robots = [r.vec for r in self.get_robots()]
+            for x, y in xy[1:].tolist():
+                point = Vec2(x, y)
                 if self.point_inside_robot(point, robots):
                     # TODO: Rewrite the python's way
-                    n = diff * self.collision_distance / norm(diff)
-                    temp = Point(-n[1] + point.x, n[0] + point.y)
-                    target1 = self.path_planner(temp, depth + 1)
-                    diff1 = norm(array(self.final_target) - array(target1))
+                    n = diff * (self.collision_distance / diff.norm())
+
+                    target1 = self.path_planner(Vec2(point.x - n.y, point.y + n.x), depth + 1, robots, position, final, stadium)
+                    diff1 = final.distance(target1)
                     free1 = not self.point_inside_robot(target1, robots)
 
-                    temp = Point(n[1] + point.x, -n[0] + point.y)
-                    target2 = self.path_planner(temp, depth + 1)
-                    diff2 = norm(array(self.final_target) - array(target2))
+                    target2 = self.path_planner(Vec2(point.x + n.y, point.y - n.x), depth + 1, robots, position, final, stadium)
+                    diff2 = final.distance(target2)
                     free2 = not self.point_inside_robot(target2, robots)
 
                     if free1 and free2:
@@ -133,9 +170,10 @@ class Goto(Skill):
         return [r for r in self.world.robots if r.uid != self.robot.uid]
 
     def point_inside_robot(self, point, robots):
+        """Whether point is within a robot diameter of any of robots, given as Vec2s."""
+        min_dist = 2 * self.robot.radius
         for r in robots:
-            diff = norm(array(point) - array(r))
-            if diff <= 2 * self.robot.radius:
+            if point.distance(r) <= min_dist:
                 return True
         return False
 
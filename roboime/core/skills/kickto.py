@@ -11,8 +11,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import pi, sign, array, sin
-from numpy.linalg import norm
+from numpy import pi, sign, sin
 
 from ...utils.mathutils import sqrt
 from ...utils.pidcontroller import PidController
@@ -104,7 +103,7 @@ class KickTo(Skill):
         self.angle_controller.step()
 
         #d = self.robot.front_cut + self.ball.radius
-        d = norm(array(self.robot) - array(self.ball))
+        d = self.robot.vec.distance(self.ball.vec)
         r = self.robot.radius
 
         w = self.angle_controller.output
@@ -11,8 +11,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import pi, sign, array
-from numpy.linalg import norm
+from numpy import pi, sign
 
 #from ...utils.mathutils import sqrt
 from ...utils.pidcontroller import PidController
@@ -59,7 +58,7 @@ class OrientTo(Skill):
         self.angle_controller.step()
 
         #d = self.robot.front_cut + self.ball.radius
-        d = norm(array(self.robot) - array(self.ball))
+        d = self.robot.vec.distance(self.ball.vec)
         r = self.robot.radius
 
         w = self.angle_controller.output
@@ -11,15 +11,10 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array
-
 from .. import Tactic
-from ...utils.geom import Point
+from ...utils.geom import Vec2
 from ..skills.gotolooking import GotoLooking
 
-from ...utils.mathutils import sin
-from ...utils.mathutils import cos
-
 
 class Blocker(Tactic):
     """
@@ -45,9 +40,7 @@ class Blocker(Tactic):
         self.dist = distance
 
     def _step(self):
-        base_angle = self.ball.angle_to_point(self.goal)
-        self.goto.target = Point(
-            array((self.dist * cos(base_angle + self.arc),
-            self.dist * sin(base_angle + self.arc))) + array(self.blockpoint)
-        )
+        base_angle = self.ball.vec.angle_to(self.goal.vec)
+        target = Vec2.of(self.blockpoint) + Vec2.polar(self.dist, base_angle + self.arc)
+        self.goto.target = target.point()
         self.goto.step()
@@ -11,16 +11,12 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array
 from .. import Tactic
 from ...utils.statemachine import Transition
 from ..skills.followandcover import FollowAndCover
-from ...utils.geom import Point
+from ...utils.geom import Vec2
 from ..skills.gotolooking import GotoLooking
 
-from ...utils.mathutils import sin
-from ...utils.mathutils import cos
-
 
 class Defender(Tactic):
     """
@@ -89,13 +85,10 @@ class Defender(Tactic):
         )
 
     def _step(self):
-        base_angle = self.cover.angle_to_point(self.enemy)
-        self.goto.target = Point(
-            array(
-                (self.distance * cos(base_angle + self.arc),
-                self.distance * sin(base_angle + self.arc))
-            ) + array(self.cover)
-        )
+        cover = Vec2.of(self.cover)
+        base_angle = cover.angle_to(Vec2.of(self.enemy))
+        target = cover + Vec2.polar(self.distance, base_angle + self.arc)
+        self.goto.target = target.point()
         super(Defender, self)._step()
     @property
     def enemy(self):
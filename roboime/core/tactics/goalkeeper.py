@@ -15,8 +15,6 @@ from numpy import array
 #from numpy import cross
 #from numpy import dot
 from numpy import sign
-from numpy import linspace
-from itertools import groupby
 
 from ...utils.mathutils import sin, cos
 from ...utils.geom import Line, Point
@@ -69,6 +67,8 @@ class Goalkeeper(Tactic):
         # should parametrize these
         # time in seconds to predict future ball position
         self.look_ahead_time = 4.0
+        # time in seconds over which the ball speed is averaged for that
+        self.ball_speed_window = 0.1
         self.domination_radius = 0.135
         #self.safety_ratio = 0.9
         self.safety_ratio = 2.0
@@ -172,7 +172,7 @@ class Goalkeeper(Tactic):
         # if the ball is moving fast* torwards the goal, defend it: THE CATCH
         #*: define fast
 
-        future_ball = array(self.ball) + self.ball.speed * self.look_ahead_time
+        future_ball = array(self.ball) + self.world.velocity(self.ball, self.ball_speed_window) * self.look_ahead_time
         ball_now, ball_then = Point(self.ball), Point(future_ball)
         ball_line = Line(ball_now, ball_then)
 
@@ -202,18 +202,10 @@ class Goalkeeper(Tactic):
         goal line to the base line.
         """
         our_goal = self.team.goal
-        max_hole = []
+        opening = self.world.best_opening(our_goal.p2, our_goal.p1)
 
-        possible_points = [(y, self.world.has_clear_shot(Point(our_goal.x, y))) for y in linspace(our_goal.p2.y, our_goal.p1.y, 10)]
-
-        for has_clear_shot, group in groupby(possible_points, lambda (point, has): has):
-            if has_clear_shot:
-                hole = list(group)
-                if len(hole) > len(max_hole):
-                    max_hole = hole
-
-        if len(max_hole) != 0:
-            y = (max_hole[0][0] + max_hole[-1][0]) / 2
+        if opening is not None:
+            y = opening.y
             #return Point(our_goal.x, y)
             # The following calculation transports the point from the goal line
             # to the base line
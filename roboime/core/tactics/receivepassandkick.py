@@ -11,9 +11,6 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import linspace
-from itertools import groupby
-
 from .. import Tactic
 from ...utils.statemachine import Transition
 from ..skills.drivetoball import DriveToBall
@@ -75,18 +72,10 @@ class ReceivePassAndKick(Tactic):
 
     def point_to_kick(self):
         enemy_goal = self.robot.enemy_goal
-        max_hole = []
-
-        possible_points = [(y, self.world.has_clear_shot(Point(enemy_goal.x, y))) for y in linspace(enemy_goal.p2.y, enemy_goal.p1.y, 5)]
-
-        for has_clear_shot, group in groupby(possible_points, lambda (point, has): has):
-            if has_clear_shot:
-                hole = list(group)
-                if len(hole) > len(max_hole):
-                    max_hole = hole
+        opening = self.world.best_opening(enemy_goal.p2, enemy_goal.p1)
 
-        if len(max_hole) != 0:
-            y = (max_hole[0][0] + max_hole[-1][0]) / 2
+        if opening is not None:
+            y = opening.y
             return Point(enemy_goal.x, y)
         else:
             return Point(enemy_goal.x, enemy_goal.y)
@@ -11,8 +11,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import linspace, array
-from itertools import groupby
+from numpy import array
 
 from .. import Tactic
 from ...utils.statemachine import Transition
@@ -106,16 +105,8 @@ class Zickler43(Tactic):
 
     def point_to_kick(self):
         enemy_goal = self.robot.enemy_goal
-        max_hole = []
+        opening = self.world.best_opening(enemy_goal.p2, enemy_goal.p1)
 
-        possible_points = [(y, self.world.has_clear_shot(Point(enemy_goal.x, y))) for y in linspace(enemy_goal.p2.y, enemy_goal.p1.y, 5)]
-
-        for has_clear_shot, group in groupby(possible_points, lambda (point, has): has):
-            if has_clear_shot:
-                hole = list(group)
-                if len(hole) > len(max_hole):
-                    max_hole = hole
-
-        if len(max_hole) != 0:
-            y = (max_hole[0][0] + max_hole[-1][0]) / 2
+        if opening is not None:
+            y = opening.y
             return Point(enemy_goal.x, y)
@@ -0,0 +1,229 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Plays stepped on processes of their own, one per team.
+
+Plays only read the world and write the actions of their team, so the
+plays of both teams can be stepped at the same time. Each step the main
+process writes its world to a SharedWorld, which the PlayWorkers copy to
+worlds of their own before stepping their plays. The action table of each
+team goes to its worker and comes back on shared memory, to be merged
+before the commanders run.
+
+Workers are forked with whatever the main process has at that time, they
+don't see later changes to module level parameters (like set_goto_param)
+nor to attributes of the robots that are not on the world state.
+"""
+from ctypes import c_char
+from multiprocessing import Process, Pipe
+from multiprocessing.sharedctypes import RawArray
+from traceback import format_exc
+
+import numpy as np
+
+from ..base import World, X, Y, MOVED, MAX_ROBOTS, STATE_COLUMNS, FLAG_COLUMNS, ACTION_COLUMNS, GEOMETRY_FIELDS
+from . import Dummy
+
+
+STOP_TIMEOUT = 1
+
+# the world state as it is shared, see WorldState
+WORLD_STATE = np.dtype([
+    ('robots', 'f8', (2 * MAX_ROBOTS, len(STATE_COLUMNS))),
+    ('flags', '?', (2 * MAX_ROBOTS, len(FLAG_COLUMNS))),
+    ('bound', '?', (2 * MAX_ROBOTS,)),
+    ('ball', 'f8', (len(STATE_COLUMNS),)),
+])
+
+# what else of the world goes along with each step, pickled
+WORLD_FIELDS = ('timestamp', 'frame_number', 'frame_skip', 'inited')
+REFEREE_FIELDS = ('timestamp', 'stage', 'stage_time_left', 'command', 'command_timestamp')
+TEAM_FIELDS = ('name', 'score', 'red_cards', 'yellow_cards', 'yellow_card_times', 'timeouts', 'timeout_time', '_goalie', '_default_goalie')
+
+
+def _shared(dtype, shape=()):
+    """A zeroed numpy array of dtype and shape on shared memory, to be allocated before forking."""
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) if shape else 1
+    return np.frombuffer(RawArray(c_char, size * dtype.itemsize), dtype=dtype).reshape(shape or (1,))
+
+
+class SharedWorld(object):
+
+    def __init__(self):
+        """
+        The state of a world on shared memory, and how to bring another
+        world up to it:
+
+        >>> w, copy = World(), World()
+        >>> r = w.blue_team[3]
+        >>> r.update(1.0, 2.0); r.active = True
+        >>> w.referee.command = 1; w.length = 9.0
+        >>> shared = SharedWorld()
+        >>> shared.read(copy, shared.write(w))
+        >>> copy.blue_team[3].x, copy.blue_team[3].active, copy.referee.command, copy.right_goal.x
+        (1.0, True, 1, 4.5)
+        """
+        self.record = _shared(WORLD_STATE)[0]
+
+    def write(self, world):
+        """
+        Copy the state of world, returns the rest of what read needs, which
+        is small enough to be pickled.
+        """
+        state, record = world.state, self.record
+        record['robots'] = state.robots
+        record['flags'] = state.flags
+        record['bound'] = state.bound
+        record['ball'] = state.ball
+        referee = world.referee
+        return (
+            tuple(getattr(world, f) for f in WORLD_FIELDS),
+            world.geometry_key(),
+            tuple(getattr(referee, f) for f in REFEREE_FIELDS),
+            dict((team.color, tuple(getattr(team, f) for f in TEAM_FIELDS)) for team in (world.right_team, world.left_team)),
+            world.right_team.color,
+        )
+
+    def read(self, world, frame):
+        """Bring world up to the one written along with frame."""
+        world_values, geometry, referee_values, teams, right = frame
+        state, record = world.state, self.record
+
+        # robots the world doesn't have yet are created on their slots
+        for slot in (record['bound'] & ~state.bound).nonzero()[0]:
+            world.team(state.colors[slot])[int(state.uids[slot])]
+        state.robots[:] = record['robots']
+        state.flags[:] = record['flags']
+        # whatever the robots built from their position is stale
+        state.flags[:, MOVED] = True
+        state.ball[:] = record['ball']
+        world.ball.update(state.ball[X], state.ball[Y])
+
+        previous = world.timestamp
+        for f, v in zip(WORLD_FIELDS, world_values):
+            setattr(world, f, v)
+        for f, v in zip(GEOMETRY_FIELDS, geometry):
+            setattr(world, f, v)
+        world.update_geometry()
+        for f, v in zip(REFEREE_FIELDS, referee_values):
+            setattr(world.referee, f, v)
+        for color, values in teams.iteritems():
+            team = world.team(color)
+            for f, v in zip(TEAM_FIELDS, values):
+                setattr(team, f, v)
+        if world.right_team.color != right:
+            world.switch_sides()
+
+        # speeds estimated from the history need a sample per frame
+        if world.timestamp != previous:
+            world.record_slots(state.mask().nonzero()[0], world.timestamp)
+            world.record(world.ball, world.timestamp)
+
+
+class PlayWorker(Process):
+
+    def __init__(self, color, shared, plays):
+        """
+        Steps the play of the team of color on a process of its own, over
+        the world written to shared, a SharedWorld. Plays are given by name,
+        the callables on plays build them from a team.
+
+        Every call waits for the worker, but step and collect, between which
+        the worker runs on its own. Errors on the worker are raised here as
+        RuntimeErrors with its traceback.
+
+        The actions the play leaves are merged onto the team, the rows of the
+        robots it didn't touch come back as they went:
+
+        >>> from .plays.halt import Halt
+        >>> w = World()
+        >>> for uid in (0, 1):
+        ...     r = w.blue_team[uid]; r.update(float(uid), 0.0); r.angle = 0.0; r.active = True
+        >>> for uid in (0, 2):
+        ...     w.blue_team[uid].action.speeds = (1.0, 0.0, 0.0)
+        >>> shared = SharedWorld()
+        >>> worker = PlayWorker(w.blue_team.color, shared, {'halt': Halt})
+        >>> worker.start(); worker.set_play('halt')
+        >>> worker.step(shared.write(w), w.blue_team); worker.collect(w.blue_team)
+        >>> w.blue_team.actions.data[:3, :3].tolist()
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [1.0, 0.0, 0.0]]
+        >>> try:
+        ...     worker.set_play('nope')
+        ... except RuntimeError as e:
+        ...     print str(e).splitlines()[-1]
+        KeyError: 'nope'
+        >>> worker.stop(); worker.is_alive()
+        False
+        """
+        super(PlayWorker, self).__init__()
+        self.daemon = True
+        self.color = color
+        self.shared = shared
+        self.plays = plays
+        self.conn, self._conn = Pipe()
+        # the action table of the team, both ways
+        self.actions = _shared('f8', (MAX_ROBOTS, len(ACTION_COLUMNS)))
+
+    def _call(self, command, arg=None):
+        self.conn.send((command, arg))
+        self._reply()
+
+    def _reply(self):
+        error = self.conn.recv()
+        if error is not None:
+            raise RuntimeError('{} play worker failed:\n{}'.format(self.color, error))
+
+    def set_play(self, play):
+        """Build the play named play, or with play itself if it is a picklable callable taking the team."""
+        self._call('play', play)
+
+    def step(self, frame, team):
+        """Start stepping the play on frame, as returned by SharedWorld.write, with the actions of team."""
+        self.actions[:] = team.actions.data
+        self.conn.send(('step', frame))
+
+    def collect(self, team):
+        """Wait for the step to end and merge the actions the play left onto team."""
+        self._reply()
+        team.actions.data[:] = self.actions
+
+    def stop(self):
+        if self.is_alive():
+            self.conn.send(('stop', None))
+            self.join(STOP_TIMEOUT)
+        if self.is_alive():
+            self.terminate()
+
+    def run(self):
+        world = World()
+        team = world.team(self.color)
+        play = Dummy()
+        while True:
+            command, arg = self._conn.recv()
+            if command == 'stop':
+                break
+            error = None
+            try:
+                if command == 'play':
+                    play = (self.plays[arg] if isinstance(arg, basestring) else arg)(team)
+                elif command == 'step':
+                    self.shared.read(world, arg)
+                    team.actions.data[:] = self.actions
+                    play.step()
+                    self.actions[:] = team.actions.data
+            except Exception:
+                error = format_exc()
+            self._conn.send(error)
+        world.planner.close()
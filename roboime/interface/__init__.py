@@ -13,14 +13,15 @@
 #
 import sys
 import struct
-import math
 
 from multiprocessing import Process, Event
 from . import updater
 from . import commander
 from . import filter
+from . import worldstream
 from ..config import config
-from ..utils.profile import Profile
+from ..utils.profile import Profile, Latency
+from ..utils.scheduler import monotonic
 from ..utils import to_short
 from ..utils.keydefaultdict import keydefaultdict
 import zmq
@@ -68,10 +69,13 @@ class Interface(Process, Profile):
     instace of a World.
     """
 
-    def __init__(self, world, updaters=[], commanders=[], filters=[], callback=lambda: None):
+    def __init__(self, world, updaters=[], commanders=[], filters=[], callback=lambda: None, ioloop=None):
         """
         The callback function will be called whenever an update arrives,
         after the world is updated.
+
+        With an ioloop the updaters receive on it, polled at each step,
+        instead of on processes of their own.
         """
         super(Interface, self).__init__()
         self.control_active_only = config['interface']['control_active_only']
@@ -81,15 +85,29 @@ class Interface(Process, Profile):
         self.updaters = updaters
         self.commanders = commanders
         self.filters = filters
+        for fi in self.filters:
+            fi.bind(world)
         self.callback = callback
+        self.ioloop = ioloop
+        # stamps of the frames, pushed by whoever runs the steps
+        self.latency = Latency()
         self._exit = Event()
         self.forward_vision = config['interface']['forward_vision']
         self._forward_vision_on = config['interface']['forward_vision_on']
         ctx = zmq.Context()
-        self.zmq_socket = ctx.socket(zmq.PUB)
+        # a PUB socket that also tells about new subscribers, so they get the geometry right away
+        self.zmq_socket = ctx.socket(zmq.XPUB)
+        self.zmq_socket.setsockopt(zmq.XPUB_VERBOSE, 1)
         self.zmq_socket.bind(self._forward_vision_on)
-        self.geometry_frame_skip = 1
-        self._geometry_counter = 0
+        # the geometry is forwarded when it changes, when someone subscribes and
+        # otherwise every keep alive seconds, (version, when) of the last one sent
+        self.geometry_keep_alive = config['interface']['forward_geometry_keep_alive']
+        self._forwarded_geometry = (0, 0.0)
+        # the world goes out packed, up to forward_rate times a second with 0 for every frame
+        self.stream = worldstream.Encoder(config['interface']['forward_key_interval'])
+        self.forward_rate = config['interface']['forward_rate']
+        self._forwarded_at = 0.0
+        self._forward_key = False
 
         # XXX: ugly but what the heck
         self.blue_commander = None
@@ -98,27 +116,37 @@ class Interface(Process, Profile):
     def start(self):
         #super(Interface, self).start()
         for p in self.processes():
-            p.start()
+            if self.ioloop is not None:
+                p.attach(self.ioloop)
+            else:
+                p.start()
 
     def stop(self):
         for p in self.processes():
-            p.stop()
+            if self.ioloop is not None:
+                p.detach(self.ioloop)
+            else:
+                p.stop()
 
     def step(self):
+        """Apply the updates and send the actions, returns whether there was a new detection."""
+        fresh = self.update()
+        self.command()
+        return fresh
+
+    def update(self):
+        """Apply what arrived since the last update, returns whether there was a new detection."""
         # updates injection phase
         self.profile_reset()
         self.profile_stamp()
 
         has_detection_update = False
-        has_geometry_update = False
+        geometry_version = self.world.geometry_version
 
+        if self.ioloop is not None:
+            self.ioloop.poll(0)
         for up in self.updaters:
-            if not up.queue.empty():
-                #uu = up.queue.get_nowait()
-                for _ in xrange(15):
-                    uu = up.queue.get()
-                    if up.queue.empty():
-                        break
+            for uu in up.poll():
                 for fi in reversed(self.filters):
                     _uu = fi.filter_update(uu)
                     if _uu is not None:
@@ -126,8 +154,6 @@ class Interface(Process, Profile):
                 uu.apply(self.world)
                 if uu.has_detection_data():
                     has_detection_update = True
-                if uu.has_geometry_data():
-                    has_geometry_update = True
 
             ##with up.queue_lock:
             ##    print 'Queue size: ', up.queue.qsize()
@@ -144,6 +170,9 @@ class Interface(Process, Profile):
             #if count > 0:
             #    self.callback()
 
+        # repeated geometry packets don't count, only actual changes
+        has_geometry_update = self.world.geometry_version != geometry_version
+
         # update the robots with their positions
         if has_detection_update or has_geometry_update:
             w = self.world
@@ -154,65 +183,59 @@ class Interface(Process, Profile):
             if self.yellow_commander is not None:
                 send_update(self.yellow_commander, w, w.yellow_team)
 
-            if self.forward_vision:
-                wrapper = {}
-
-                if has_detection_update:
-                    detection = {
-                        'camera_id': 'intel',
-                        'frame_number': w.frame_number,
-                        'balls': [],
-                        'robots_blue': [],
-                        'robots_yellow': [],
-                    }
-
-                    detection['balls'].append({
-                        'x': 1000 * w.ball.x,
-                        'y': 1000 * w.ball.y,
-                    })
-                    for t, k in [(w.blue_team, 'robots_blue'), (w.yellow_team, 'robots_yellow')]:
-                        for r in t:
-                            robot = {
-                                'robot_id': r.uid,
-                                'x': 1000 * r.x,
-                                'y': 1000 * r.y,
-                                'orientation': math.radians(r.angle),
-                            }
-                            if r.skill is not None:
-                                robot['skill'] = {
-                                    'name': r.skill.name,
-                                }
-                            if r.tactic is not None:
-                                robot['tactic'] = {
-                                    'name': r.tactic.name,
-                                }
-
-                            detection[k].append(robot)
-                    wrapper['detection'] = detection
-
-                if has_geometry_update:
-                    geometry = {
-                        'line_width': w.line_width,
-                        'field_length': w.length,
-                        'field_width': w.width,
-                        'boundary_width': w.boundary_width,
-                        'referee_width': w.referee_width,
-                        'goal_width': w.goal_width,
-                        'goal_depth': w.goal_depth,
-                        'goal_wall_width': w.goal_wall_width,
-                        'center_circle_radius': w.center_radius,
-                        'defense_radius': w.defense_radius,
-                        'defense_stretch': w.defense_stretch,
-                        'free_kick_from_defense_dist': w.free_kick_distance,
-                        'penalty_spot_from_field_line_dist': w.penalty_spot_distance,
-                        'penalty_line_from_spot_dist': w.penalty_line_distance,
-                    }
-
-                    wrapper['geometry'] = geometry
-
-                self.zmq_socket.send_json(wrapper)
+        if self.forward_vision:
+            self.forward(has_detection_update)
 
+        self.profile_stamp()
+        return has_detection_update
+
+    def subscribers_joined(self):
+        """Whether anyone subscribed to the forwarded stream since the last call."""
+        joined = False
+        while True:
+            try:
+                message = self.zmq_socket.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                return joined
+            # subscriptions start with a 1, unsubscriptions with a 0
+            if message[:1] == '\x01':
+                joined = True
+
+    def geometry_due(self, joined=False):
+        """
+        Whether to forward the geometry now: it changed since the last time,
+        someone joined or it's time for a keep alive. Never before the
+        vision sends one.
+        """
+        version, at = self._forwarded_geometry
+        if not self.world.geometry_version:
+            return False
+        return joined or version != self.world.geometry_version or monotonic() - at >= self.geometry_keep_alive
 
+    def forward(self, has_detection_update):
+        """
+        Publish the world on the forwarded stream, see worldstream, at most
+        forward_rate times a second. Whoever joins gets a key frame with
+        the geometry on the next message.
+        """
+        if self.subscribers_joined():
+            self._forward_key = True
+        now = monotonic()
+        if self.forward_rate and now - self._forwarded_at < 1.0 / self.forward_rate:
+            return
+        geometry = self.geometry_due(self._forward_key)
+        if not (has_detection_update or geometry):
+            return
+        # of the last frame that got to be commanded
+        latency = self.latency.last()
+        self.zmq_socket.send(self.stream.encode(self.world, geometry, latency, self._forward_key))
+        self._forwarded_at = now
+        self._forward_key = False
+        if geometry:
+            self._forwarded_geometry = (self.world.geometry_version, now)
+
+    def command(self):
+        """Send the actions of the robots."""
         # actions extraction phase
         # TODO filtering
         self.profile_stamp()
@@ -234,6 +257,9 @@ class Interface(Process, Profile):
             #co.queue.put(actions)
             co.send(actions)
 
+        # let the readers on other threads know about this step
+        self.world.publish()
+
         self.profile_stamp()
 
     def processes(self):
@@ -247,12 +273,23 @@ class TxInterface(Interface):
         debug = config['interface']['debug']
         vision_address = (config['interface']['tx']['vision-addr'], config['interface']['tx']['vision-port'])
         vision_intf = config['interface']['tx']['vision-intf']
+        vision_cameras = config['interface']['vision-cameras']
+        vision_stale_after = config['interface']['vision-stale-after']
+        vision_fusion_window = config['interface']['vision-fusion-window']
+        vision_merge_distance = config['interface']['vision-merge-distance']
+        vision_buffer_size = config['interface']['vision-buffer-size']
+        vision_buffers = config['interface']['vision-buffers']
+        vision_rcvbuf = config['interface']['vision-rcvbuf']
         referee_address = (config['interface']['tx']['referee-addr'], config['interface']['tx']['referee-port'])
         robots_onthefield  = config['interface']['robots-onthefield']
         super(TxInterface, self).__init__(
             world,
             updaters=[
-                updater.VisionUpdater(vision_address, vision_intf),
+                updater.VisionUpdater(
+                    vision_address, vision_intf, cameras=vision_cameras, stale_after=vision_stale_after,
+                    fusion_window=vision_fusion_window, merge_distance=vision_merge_distance,
+                    buffer_size=vision_buffer_size, buffers=vision_buffers, rcvbuf=vision_rcvbuf,
+                ),
                 updater.RefereeUpdater(referee_address, vision_intf),
             ],
             filters=filters + [
@@ -263,7 +300,7 @@ class TxInterface(Interface):
                 filter.Acceleration(),
                 filter.Speed(),  # second speed is more precise due to Kalman, size=2
                 filter.Kalman(),
-                filter.Speed(3),  # first speed used to predict speed for Kalman
+                filter.Speed(3),  # first speed used to predict speed for Kalman, on raw positions
                 filter.RegisterPosition("input"),
                 filter.Scale(),
             ],
@@ -300,12 +337,23 @@ class SimulationInterface(Interface):
         #debug = config['interface']['debug']
         vision_address = (config['interface']['sim']['vision-addr'], config['interface']['sim']['vision-port'])
         vision_intf = config['interface']['sim']['vision-intf']
+        vision_cameras = config['interface']['vision-cameras']
+        vision_stale_after = config['interface']['vision-stale-after']
+        vision_fusion_window = config['interface']['vision-fusion-window']
+        vision_merge_distance = config['interface']['vision-merge-distance']
+        vision_buffer_size = config['interface']['vision-buffer-size']
+        vision_buffers = config['interface']['vision-buffers']
+        vision_rcvbuf = config['interface']['vision-rcvbuf']
         referee_address = (config['interface']['sim']['referee-addr'], config['interface']['sim']['referee-port'])
         grsim_address = (config['interface']['sim']['grsim-addr'], config['interface']['sim']['grsim-port'])
         super(SimulationInterface, self).__init__(
             world,
             updaters=[
-                updater.VisionUpdater(vision_address, vision_intf),
+                updater.VisionUpdater(
+                    vision_address, vision_intf, cameras=vision_cameras, stale_after=vision_stale_after,
+                    fusion_window=vision_fusion_window, merge_distance=vision_merge_distance,
+                    buffer_size=vision_buffer_size, buffers=vision_buffers, rcvbuf=vision_rcvbuf,
+                ),
                 updater.RefereeUpdater(referee_address, vision_intf),
             ],
             commanders=[
@@ -320,7 +368,7 @@ class SimulationInterface(Interface):
                 filter.Speed(),  # second speed is more precise due to Kalman, size=2
                 #filter.CommandUpdateLog(options.cmdupd_filename),
                 filter.Kalman(),
-                filter.Speed(3),  # first speed used to predict speed for Kalman
+                filter.Speed(3),  # first speed used to predict speed for Kalman, on raw positions
                 #Noise should be enabled during simulation, to allow real noise simulation
                 #filter.Noise(options.noise_var_x,options.noise_var_y,options.noise_var_angle),
                 filter.RegisterPosition("input"),
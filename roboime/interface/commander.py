@@ -19,9 +19,11 @@ import sys
 #from multiprocessing import Process, Queue, Event, Lock
 from collections import defaultdict
 from time import time
-from math import isnan
 from math import radians
 
+from numpy import array, asarray, dot, newaxis, isnan, where, sign, trunc
+
+from ..base import A_VX, A_VY, A_VA, A_KICK, A_CHIP, A_DRIBBLE, A_HAS_SPEEDS, A_HAS_TARGET, A_TX, A_TA
 from ..config import config
 from ..communication import grsim
 from ..communication.network import unicast
@@ -54,6 +56,15 @@ class Commander(object):
         #self._exit = Event()
         self.team = team
 
+    # FIXME: chassis values, should be on the robot prototype, each commander sets its own
+    wheel_angles = ()
+    wheel_distance = None
+    wheel_radius = None
+    # wheel speeds of a robot are scaled down to this one, when set
+    max_speed = None
+    # built from the values above, see wheel_matrix
+    _wheel_matrix = None
+
     #def start(self):
     #    super(Commander, self).start()
     #    self.conn = self._sendr
@@ -70,6 +81,74 @@ class Commander(object):
     def send(self, actions):
         raise NotImplemented
 
+    def action_block(self, actions):
+        """
+        The actions that do something, with their uids and rows.
+
+        The rows come from the action table of the team, see ActionTable.block,
+        so the speeds on them are all on the robot frame.
+        """
+        uids, rows = self.team.actions.block(actions)
+        keep = (rows[:, A_HAS_SPEEDS] + rows[:, A_HAS_TARGET]).tolist()
+        if all(keep):
+            return actions, uids, rows
+        return (
+            [a for a, k in zip(actions, keep) if k],
+            [u for u, k in zip(uids, keep) if k],
+            rows[array(keep, dtype=bool)],
+        )
+
+    def wheel_matrix(self):
+        """
+        The (3, len(wheel_angles)) matrix taking robot frame speeds, with va
+        in degrees/s, to speeds of the wheels.
+        """
+        key = tuple(self.wheel_angles), self.wheel_distance, self.wheel_radius
+        if self._wheel_matrix is None or self._wheel_matrix[0] != key:
+            self._wheel_matrix = key, array([
+                [-sin(a) / self.wheel_radius for a in self.wheel_angles],
+                [cos(a) / self.wheel_radius for a in self.wheel_angles],
+                [self.wheel_distance * pi / 180 / self.wheel_radius] * len(self.wheel_angles),
+            ])
+        return self._wheel_matrix[1]
+
+    def omniwheel_speeds(self, speeds):
+        """
+        Speeds of the wheels, one row per robot, for an (n, 3) array of
+        robot frame vx, vy and va, va in degrees/s as on the action rows.
+
+        Robots with speeds that are not numbers get their wheels stopped.
+        """
+        wheels = dot(speeds, self.wheel_matrix())
+        # a wheel that is not a number means all of them are not
+        wheels[isnan(wheels)] = 0.0
+        if self.max_speed is not None:
+            largest = abs(wheels).max(axis=1)
+            over = largest > self.max_speed
+            if any(over.tolist()):
+                wheels[over] *= self.max_speed / largest[over, newaxis]
+        return wheels
+
+    def prepare_byte(self, x, max_speed=None):
+        """Values over an array, as signed bytes with 127 for max_speed."""
+        if max_speed is None:
+            max_speed = self.max_speed
+        x = asarray(x, dtype=float)
+        x = where(abs(x) > max_speed, sign(x), x / max_speed)
+        return trunc(127 * x).astype(int) & 255
+
+    def kick_byte(self, uids, rows):
+        """The kick byte of each row, chip kicks are negative."""
+        power = array([self.kicking_power_dict[uid] for uid in uids], dtype=float)
+        powered = power > 0
+        power[~powered] = 1.0
+        kick, chip = rows[:, A_KICK], rows[:, A_CHIP]
+        return where(
+            (kick > 0) & powered,
+            self.prepare_byte(kick * 100 / power, 1),
+            where((chip > 0) & powered, self.prepare_byte(-chip * 100 / power, 1), 0),
+        )
+
 
 class ControlCommander(Commander):
     """
@@ -85,24 +164,24 @@ class ControlCommander(Commander):
 
     def send(self, actions):
         control = {'actions_blue': [], 'actions_yellow': []}
-        for a in actions:
+        uids, rows = self.team.actions.block(actions)
+        for a, uid, row in zip(actions, uids, rows.tolist()):
             if a.robot.is_blue:
                 ac = control['actions_blue']
             else:
                 ac = control['actions_yellow']
-            if a.has_speeds:
-                sx, sy, sa = a.speeds
+            if row[A_HAS_SPEEDS]:
                 ac.append({
                     'type': 'move',
-                    'uid': a.uid,
+                    'uid': uid,
                     'speeds': {
-                        'vx': 1000 * sx,
-                        'vy': 1000 * sy,
-                        'va': radians(sa),
+                        'vx': 1000 * row[A_VX],
+                        'vy': 1000 * row[A_VY],
+                        'va': radians(row[A_VA]),
                     },
-                    'kick': a.kick or 0.0,
-                    'chip': a.chipkick or 0.0,
-                    'dribble': a.dribble or 0.0,
+                    'kick': row[A_KICK],
+                    'chip': row[A_CHIP],
+                    'dribble': row[A_DRIBBLE],
                 })
 
         self.zmq_socket.send_json({'control': control})
@@ -141,24 +220,6 @@ class Tx2014Commander(Commander):
         self.wheel_radius = 0.0285
         self.max_speed = 64.0
 
-    def omniwheel_speeds(self, vx, vy, va):
-        if isnan(vx) or isnan(vy) or isnan(va):
-            return [0.0, 0.0, 0.0, 0.0]
-        speeds = [(vy * cos(a) - vx * sin(a) + va * self.wheel_distance) / self.wheel_radius for a in self.wheel_angles]
-        largest = max(abs(x) for x in speeds)
-        if largest > self.max_speed:
-            speeds = [x * self.max_speed / largest for x in speeds]
-        return speeds
-
-    def prepare_byte(self, x, max_speed=None):
-        if max_speed == None:
-            max_speed = self.max_speed
-        if abs(x) > max_speed:
-            x = x / abs(x)
-        else:
-            x = x / max_speed
-        return int(127 * x) & 255
-
     def send(self, actions):
         actions_dict = keydefaultdict(lambda x: '\x7f\x00\x00\x00\x00\x00\x00')
 
@@ -166,46 +227,29 @@ class Tx2014Commander(Commander):
         has_action = False
 
         if len(actions) > 0:
-            for a in actions:
-                if not a:
-                    continue
-                has_action = True
+            actions, uids, rows = self.action_block(actions)
+            has_action = len(actions) > 0
 
-                if a.has_speeds:
-                    # this is the old move skill and default fallback
+            wheels = self.prepare_byte(-self.omniwheel_speeds(rows[:, A_VX:A_VA + 1]))
+            dribbles = trunc(rows[:, A_DRIBBLE] * 255).astype(int)
+            kicks = self.kick_byte(uids, rows)
 
-                    vx, vy, va = a.speeds
-                    # Convert va to angular speed.
-                    va = va * pi / 180
-
-                    if self.default_map or a.uid in self.mapping_dict:
-                        uid = self.mapping_dict[a.uid] | 128
-                    else:
+            sent = []
+            for a, uid, row, wheel, dribble, kick in zip(actions, uids, rows.tolist(), wheels.tolist(), dribbles.tolist(), kicks.tolist()):
+                if row[A_HAS_SPEEDS]:
+                    # this is the old move skill and default fallback
+                    if not (self.default_map or uid in self.mapping_dict):
                         continue
-
-                    s1, s2, s3, s4 = tuple(self.prepare_byte(-x) for x in self.omniwheel_speeds(vx, vy, va))
-                    dribble = int((a.dribble or 0) * 255)
-
-                    if a.kick > 0 and self.kicking_power_dict[a.uid] > 0:
-                        kick = self.prepare_byte(a.kick * 100 / self.kicking_power_dict[a.uid] or 0.0, 1)
-                    elif a.chipkick > 0 and self.kicking_power_dict[a.uid] > 0:
-                        kick = self.prepare_byte(-a.chipkick * 100 / self.kicking_power_dict[a.uid] or 0.0, 1)
-                    else:
-                        kick = 0
-
-                    robot_packet = struct.pack('!BBBBBBB', uid, s1, s2, s3, s4, dribble, kick)
-                    actions_dict[self.mapping_dict[a.uid]] = robot_packet
-                    a.reset()
+                    robot_packet = struct.pack('!BBBBBBB', self.mapping_dict[uid] | 128, *(wheel + [dribble, kick]))
 
                 else:
                     # this is the goto skill that is now implemented in-robot
+                    tx, ty, ta = row[A_TX:A_TA + 1]
+                    robot_packet = struct.pack('<bhhh', self.mapping_dict[uid], to_short(1000 * tx), to_short(1000 * ty), to_short(100 * ta))
 
-                    tx, ty, ta = a.target
-                    #print a.target, a.robot.uid, a.robot.skill
-                    robot_packet = struct.pack('<bhhh', self.mapping_dict[a.uid], to_short(1000 * tx), to_short(1000 * ty), to_short(100 * ta))
-                    actions_dict[self.mapping_dict[a.uid]] = robot_packet
-                    a.reset()
-
+                actions_dict[self.mapping_dict[uid]] = robot_packet
+                sent.append(a)
+            self.team.actions.reset(sent)
 
             if has_action:
                 # header [254, 0, 88]
@@ -251,24 +295,6 @@ class Tx2013Commander(Commander):
         self.wheel_radius = 0.0289
         self.max_speed = 54. #64.0
 
-    def omniwheel_speeds(self, vx, vy, va):
-        if isnan(vx) or isnan(vy) or isnan(va):
-            return [0.0, 0.0, 0.0, 0.0]
-        speeds = [(vy * cos(a) - vx * sin(a) + va * self.wheel_distance) / self.wheel_radius for a in self.wheel_angles]
-        largest = max(abs(x) for x in speeds)
-        if largest > self.max_speed:
-            speeds = [x * self.max_speed / largest for x in speeds]
-        return speeds
-
-    def prepare_byte(self, x, max_speed=None):
-        if max_speed == None:
-            max_speed = self.max_speed
-        if abs(x) > max_speed:
-            x = x / abs(x)
-        else:
-            x = x / max_speed
-        return int(127 * x) & 255
-
     def send(self, actions):
         actions_dict = keydefaultdict(lambda x: [x | 128, 0, 0, 0, 0, 0, 0])
 
@@ -276,38 +302,20 @@ class Tx2013Commander(Commander):
         has_action = False
 
         if len(actions) > 0:
-            for a in actions:
-                if not a:
-                    continue
-                has_action = True
-                vx, vy, va = a.speeds
-                # Convert va to angular speed.
+            actions, uids, rows = self.action_block(actions)
+            has_action = len(actions) > 0
 
-                va = va * pi / 180
-                # TESTING
-                #va = 0 
-                robot_packet = []
+            wheels = self.prepare_byte(-self.omniwheel_speeds(rows[:, A_VX:A_VA + 1]))
+            dribbles = trunc(rows[:, A_DRIBBLE].clip(max=1.0) * 255).astype(int)
+            kicks = self.kick_byte(uids, rows)
 
-                if self.default_map or a.uid in self.mapping_dict:
-                    robot_packet.append(self.mapping_dict[a.uid])
-                else:
+            sent = []
+            for a, uid, wheel, dribble, kick in zip(actions, uids, wheels.tolist(), dribbles.tolist(), kicks.tolist()):
+                if not (self.default_map or uid in self.mapping_dict):
                     continue
-                #if a.uid == 3:
-                #    print self.omniwheel_speeds(vx, vy, va)
-                robot_packet.extend([self.prepare_byte(-x) for x in self.omniwheel_speeds(vx, vy, va)])
-                dribble = a.dribble or 0
-                if dribble > 1.0:
-                    dribble = 1.0
-                robot_packet.append(int(dribble * 255))
-                if a.kick > 0 and self.kicking_power_dict[a.uid] > 0:
-                    robot_packet.append(self.prepare_byte(a.kick * 100 / self.kicking_power_dict[a.uid] or 0.0, 1))
-                elif a.chipkick > 0 and self.kicking_power_dict[a.uid] > 0:
-                    robot_packet.append(self.prepare_byte(-a.chipkick * 100 / self.kicking_power_dict[a.uid] or 0.0, 1))
-                else:
-                    robot_packet.append(0)
-
-                actions_dict[self.mapping_dict[a.uid]] = robot_packet
-                a.reset()
+                actions_dict[self.mapping_dict[uid]] = [self.mapping_dict[uid]] + wheel + [dribble, kick]
+                sent.append(a)
+            self.team.actions.reset(sent)
 
             if has_action:
                 packet = [254, 0, 44]  # 44 means there are 1 (44) + 6*7 +  1 (55) bytes to be transmitted!
@@ -370,43 +378,36 @@ class Tx2012Commander(Commander):
         self.wheel_radius = 0.0289
         self.wheel_distance = 0.0806
 
-    def omniwheel_speeds(self, vx, vy, va):
-        return [(vy * cos(a) - vx * sin(a) + va * self.wheel_distance) / self.wheel_radius for a in self.wheel_angles]
-
     def send(self, actions):
         actions_dict = defaultdict(lambda:['0', '0', '0', '0', '0', '0', '0'])
         has_action = False
         if len(actions) > 0:
-            for a in actions:
-                string_list = []
-                if not a:
-                    continue
-                has_action = True
-                vx, vy, va = a.speeds
-                # Convert va to angular speed.
-                va = va * pi / 180
-                if self.default_map or a.uid in self.mapping_dict:
-                    pass
-                    #string_list.append(str(self.mapping_dict[a.uid]))
-                else:
-                    continue
+            actions, uids, rows = self.action_block(actions)
+            has_action = len(actions) > 0
 
-                string_list.extend([str(i) for i in self.omniwheel_speeds(vx, vy, -va)])
-                string_list.append(str((a.dribble or 0.0)))
-                if a.kick > 0 and self.kicking_power_dict[a.uid] > 0:
-                    string_list.append(str((a.kick * 100 / self.kicking_power_dict[a.uid] or 0.0)))
-                    #string_list.append(str((a.kick or 0.0)))
+            # the firmware turns the other way around
+            wheels = self.omniwheel_speeds(rows[:, A_VX:A_VA + 1] * (1.0, 1.0, -1.0))
+
+            sent = []
+            for a, uid, row, wheel in zip(actions, uids, rows.tolist(), wheels.tolist()):
+                if not (self.default_map or uid in self.mapping_dict):
+                    continue
+                string_list = [str(i) for i in wheel]
+                string_list.append(str(row[A_DRIBBLE]))
+                power = self.kicking_power_dict[uid]
+                if row[A_KICK] > 0 and power > 0:
+                    string_list.append(str(row[A_KICK] * 100 / power))
                     string_list.append('0')
-                elif a.chipkick > 0 and self.kicking_power_dict[a.uid] > 0:
+                elif row[A_CHIP] > 0 and power > 0:
                     string_list.append('0')
-                    string_list.append(str((a.chipkick * 100 / self.kicking_power_dict[a.uid] or 0.0)))
-                    #string_list.append(str((a.chipkick or 0.0)))
+                    string_list.append(str(row[A_CHIP] * 100 / power))
                 else:
                     string_list.append('0')
                     string_list.append('0')
 
-                actions_dict[self.mapping_dict[a.uid]] = string_list
-                a.reset()
+                actions_dict[self.mapping_dict[uid]] = string_list
+                sent.append(a)
+            self.team.actions.reset(sent)
             if has_action:
                 string_list = []
                 for i in xrange(6):
@@ -438,47 +439,39 @@ class SimCommander(Commander):
         self.wheel_distance = 0.0850
         self.wheel_radius = 0.0289
 
-    def omniwheel_speeds(self, vx, vy, va):
-        if isnan(vx) or isnan(vy) or isnan(va):
-            return [0.0, 0.0, 0.0, 0.0]
-        return [(vy * cos(a) - vx * sin(a) + va * self.wheel_distance) / self.wheel_radius for a in self.wheel_angles]
-
     def send(self, actions):
         packet = self.sender.new_packet()
 
         if len(actions) > 0:
             packet.commands.isteamyellow = self.team.is_yellow
             packet.commands.timestamp = time()
-            for a in actions:
-                if not a:
-                    continue
-                vx, vy, va = a.speeds
+            actions, uids, rows = self.action_block(actions)
+            if self.send_omni:
+                wheels = self.omniwheel_speeds(rows[:, A_VX:A_VA + 1]).tolist()
+            chip_angle = 45
+            chip_z, chip_x = sin(chip_angle), cos(chip_angle)
+            for i, (uid, row) in enumerate(zip(uids, rows.tolist())):
                 c = packet.commands.robot_commands.add()
-                c.id = a.uid
-                chip_angle = 45
-                if a.chipkick is not None: a.chipkick = a.chipkick * 3.
-                c.kickspeedz = (a.chipkick or 0.0) * sin(chip_angle)
+                c.id = uid
+                chipkick = row[A_CHIP] * 3.
+                c.kickspeedz = chipkick * chip_z
                 if c.kickspeedz > 0:
                     # XXX FIXME this should be tested,
                     # we don't know at what angle we
                     # will be able to chipkick
-                    c.kickspeedx = a.chipkick * cos(chip_angle)
+                    c.kickspeedx = chipkick * chip_x
                 else:
-                    c.kickspeedx = (a.kick or 0.0) * 5
-                c.veltangent = vx
-                c.velnormal = vy
-                c.velangular = va * pi / 180
-                c.spinner = (a.dribble or 0.0) > 0
+                    c.kickspeedx = row[A_KICK] * 5
+                c.veltangent = row[A_VX]
+                c.velnormal = row[A_VY]
+                c.velangular = row[A_VA] * pi / 180
+                c.spinner = row[A_DRIBBLE] > 0
                 c.wheelsspeed = False
                 if self.send_omni:
                     c.wheelsspeed = True
-                    speeds = self.omniwheel_speeds(vx, vy, va * pi / 180)
-                    c.wheel1 = speeds[0]
-                    c.wheel2 = speeds[1]
-                    c.wheel3 = speeds[2]
-                    c.wheel4 = speeds[3]
-
-                # reset action values
-                a.reset()
+                    c.wheel1, c.wheel2, c.wheel3, c.wheel4 = wheels[i]
+
+            # reset action values
+            self.team.actions.reset(actions)
 
         self.sender.send_packet(packet)
@@ -11,12 +11,13 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
-from numpy import array
+from numpy import array, errstate
 from numpy.random import normal
 from math import degrees, sqrt
 from collections import defaultdict
 
 from model import Model
+from ..base import Blue, Yellow
 
 
 class Filter(object):
@@ -34,8 +35,28 @@ class Filter(object):
 
     Please avoid returning lists, an iterator will generally
     have better performance and memory usage.
+
+    Filters are bound to the world the interface updates, so
+    they can look at its history instead of keeping their own.
     """
 
+    world = None
+
+    def bind(self, world):
+        self.world = world
+
+    def latest_sample(self, uid):
+        """Last sample on the bound world history of what an update uid refers to, if any."""
+        if self.world is None:
+            return None
+        path, i = uid
+        if path == 'balls':
+            index = 2 * self.world.state.max_robots if i == 0 else None
+        else:
+            index = self.world.state.slot(Blue if path == 'blue_team' else Yellow, i)
+        if index is not None:
+            return self.world.history.latest(index)
+
     def filter_update(self, updates):
         pass
 
@@ -149,52 +170,69 @@ class Scale(Filter):
 
 class Speed(Filter):
     """
-    This filter infers speed based on memorization of packages
-    with smaller timestamps.
+    This filter infers speed based on the last time each object was
+    seen, on the history of the world it is bound to.
 
     The process per se is really stupid, speed = delta_space / delta_time,
     but in the lack of an smarter filter this should do fine.
 
     It seems a good idea to filter the data coming from this filter
     with something smarter.
+
+    The history has the positions the world was given, which are
+    the ones every Speed of the interfaces sees, nothing between
+    Scale and the world changes positions. Unbound there's no
+    history and speeds are zero:
+
+    >>> from ..base import World
+    >>> from .updater import Update
+    >>> w, speed = World(), Speed()
+    >>> speed.bind(w)
+    >>> for t, x in ((1.0, 0.0), (1.1, 0.1)):
+    ...     u = Update({'__detection_data__': 1, 'timestamp': t, 'balls': {},
+    ...                 'blue_team': {'__robots__': {0: {'x': x, 'y': 0.0}}}, 'yellow_team': {'__robots__': {}}})
+    ...     speed.filter_update(u); u.apply(w)
+    >>> u['blue_team']['__robots__'][0]['speed'].round(6).tolist()
+    [1.0, 0.0]
     """
 
     def __init__(self, size=2):
         super(Speed, self).__init__()
-        self.previous = {'timestamp': 0}
         self.size = size
         #FIXME: size is a hack, because speeds should be 3-shaped
         # (x, y, w), where w is angular speed
         # since too many places use speeds as a 2-element array, I'm just
         # shrinking it at the end
 
-    def remember_update(self, update):
-        self.previous['timestamp'] = update['timestamp']
-        for uid, u in update.uobjects():
-            if u is not '__delete__':
-                self.previous[uid] = u
+    def previous_pose(self, uid):
+        """(timestamp, x, y, angle) of the last time uid was seen, None if never."""
+        sample = self.latest_sample(uid)
+        if sample is not None:
+            pt, px, py, pa = sample[:4].tolist()
+            return pt, px, py, 0.0 if pa != pa else pa
 
     def filter_update(self, update):
         if update.has_detection_data():
-            pt = self.previous['timestamp']
             t = update['timestamp']
             for uid, u in update.uobjects():
                 if u is not '__delete__':
-                    if uid in self.previous:
-                        pu = self.previous[uid]
-                        px, py, pa = pu['x'], pu['y'], pu.get('angle', 0.0)
+                    previous = self.previous_pose(uid)
+                    # even though dt is not supposed to be 0 at any
+                    # time it's sane to check
+                    if previous is not None and t > previous[0]:
+                        pt, px, py, pa = previous
                         x, y, a = u['x'], u['y'], u.get('angle', 0.0)
                         speed = array((x - px, y - py, a - pa)) / (t - pt)
                         u['speed'] = speed[:self.size]
                     else:
                         u['speed'] = array((0.0, 0.0, 0.0))[:self.size]
-            self.remember_update(update)
 
 
 class Acceleration(Filter):
     """
-    This filter infers acceleration based on memorization of packages
-    with smaller timestamps.
+    This filter infers acceleration based on the speed each object
+    had the last time it was seen, on the history of the world it
+    is bound to.
 
     The process per se is really stupid, accel = delta_speed / delta_time,
     but in the lack of an smarter filter this should do fine.
@@ -205,37 +243,33 @@ class Acceleration(Filter):
 
     def __init__(self, size=2):
         super(Acceleration, self).__init__()
-        self.previous = {'timestamp': 0}
         self.size = size
         #FIXME: size is a hack, because speeds should be 3-shaped
         # (x, y, w), where w is angular speed
         # since too many places use speeds as a 2-element array, I'm just
         # shrinking it at the end
 
-    def remember_update(self, update):
-        self.previous['timestamp'] = update['timestamp']
-        for uid, u in update.uobjects():
-            if u is not '__delete__':
-                self.previous[uid] = u
+    def previous_speed(self, uid):
+        """(timestamp, speed) of the last time uid was seen, None if never."""
+        sample = self.latest_sample(uid)
+        if sample is not None:
+            return sample[0], sample[4:6]
 
     def filter_update(self, update):
         if update.has_detection_data():
-            pt = self.previous['timestamp']
             t = update['timestamp']
-            dt = t - pt
             for uid, u in update.uobjects():
                 if u is not '__delete__':
-                    if uid in self.previous:
-                        pu = self.previous[uid]
-                        ps = pu['speed']
+                    previous = self.previous_speed(uid)
+                    if previous is not None:
+                        pt, ps = previous
                         s = u['speed']
                         # even though dt is not supposed to be 0 at any
                         # time it's sane to check
-                        if dt != 0.0:
-                            u['acceleration'] = (s - ps) / dt
+                        if t > pt:
+                            u['acceleration'] = (s[:len(ps)] - ps) / (t - pt)
                     else:
                         u['acceleration'] = array((0.0, 0.0, 0.0))[:self.size]
-            self.remember_update(update)
 
 
 class MovingAverage(Filter):
@@ -524,30 +558,26 @@ class Kalman(Filter):
 class DeactivateInactives(Filter):
     """
     This filter will deactivate robots which are not seen after a given time.
+
+    The last time each active robot was seen is taken from the history
+    of the world it is bound to, unbound it does nothing.
     """
 
     def __init__(self, timeout=1.0):
         self.timeout = timeout
-        self.previous = {}
-
-    def remember_update(self, update):
-        t = update['timestamp']
-        for uid, u in update.uobjects():
-            if u is not '__delete__':
-                self.previous[uid] = t
-            else:
-                del self.previous[uid]
 
     def filter_update(self, update):
-        if update.has_detection_data():
+        if update.has_detection_data() and self.world is not None:
             t = update['timestamp']
-            for (uid, pt) in self.previous.iteritems():
-                path, i = uid
-                d = update[path] if path == 'balls' else update[path]['__robots__']
-                #t = d[i]
-                if t - pt > self.timeout:
-                    d[i] = '__delete__'
-            self.remember_update(update)
+            state = self.world.state
+            seen = self.world.history.latest_times()[:2 * state.max_robots]
+            # nan times (never recorded) compare as False
+            with errstate(invalid='ignore'):
+                stale = state.mask() & (t - seen > self.timeout)
+            for slot in stale.nonzero()[0]:
+                path = 'blue_team' if state.colors[slot] == Blue else 'yellow_team'
+                robots = update.setdefault(path, {}).setdefault('__robots__', {})
+                robots.setdefault(int(state.uids[slot]), '__delete__')
 
 
 #class IgnoreSide(Filter):
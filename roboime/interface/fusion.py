@@ -0,0 +1,144 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Fusion of the detection frames of all cameras into one frame per cycle.
+
+SSL-Vision sends each camera on its own, and fields of view overlap, so
+the same robot or ball can come from more than one camera. Frames are
+DETECTION_RECORDs, in meters and degrees.
+"""
+import numpy as np
+
+# the camera of a fused frame
+FUSED_CAMERA = -1
+
+
+class Fusion(object):
+
+    def __init__(self, window=0.017, merge_distance=0.1, ignore_cameras=()):
+        """
+        Fuses the latest frame of each camera captured within window seconds
+        of the newest one.
+
+        Detections of the same robot, or balls, closer than merge_distance
+        are averaged weighted by their confidence. Farther ones are taken
+        as misdetections and only the most confident is kept. Frames of
+        ignore_cameras are left out.
+        """
+        self.window = window
+        self.merge_distance = merge_distance
+        self.ignore_cameras = set(ignore_cameras)
+        self.frames = {}
+        self.count = 0
+        self._fused = None
+
+    def push(self, record):
+        """Take record as the latest frame of its camera."""
+        camera = int(record['camera'])
+        if camera not in self.ignore_cameras:
+            self.frames[camera] = record
+            if self._fused is None:
+                self._fused = np.zeros(1, dtype=record.dtype)
+
+    def fuse(self):
+        """One frame with everything on the current cycle, None if there are no frames."""
+        if not self.frames:
+            return None
+        frames = np.array(self.frames.values())
+        newest = frames['t_capture'].max()
+        frames = frames[frames['t_capture'] >= newest - self.window]
+
+        fused = self._fused[0]
+        self.count += 1
+        fused['camera'] = FUSED_CAMERA
+        fused['frame_number'] = self.count
+        fused['t_capture'] = newest
+        fused['t_sent'] = frames['t_sent'].max()
+        fused['t_received'] = frames['t_received'].max()
+        for color, detected in (('yellow', self.merge_robots), ('blue', self.merge_robots), ('balls', self.merge_balls)):
+            # the detections of all frames, without the unused places
+            places = frames[color]
+            merged = detected(places[np.arange(places.shape[1]) < frames['n_' + color][:, np.newaxis]])[:places.shape[1]]
+            fused['n_' + color] = len(merged)
+            fused[color][:len(merged)] = merged
+        return fused.copy()
+
+    def merge_robots(self, robots):
+        """
+        One detection for each id on robots, a DETECTED_ROBOT array.
+
+        >>> from .updater import DETECTED_ROBOT
+        >>> robots = np.array([
+        ...     (1, 0.0, 0.0, 0.0, 0.9),
+        ...     (1, 0.03, 0.0, 20.0, 0.3),
+        ...     (1, 0.9, 0.0, 170.0, 0.5),
+        ...     (0, 0.5, 0.5, 60.0, 0.8),
+        ... ], dtype=DETECTED_ROBOT)
+        >>> [(i, round(x, 4), round(a, 1), c) for i, x, y, a, c in Fusion().merge_robots(robots).tolist()]
+        [(0, 0.5, 60.0, 0.8), (1, 0.0075, 5.0, 0.9)]
+        """
+        if len(robots) < 2:
+            return robots
+        # most confident detection of each id first
+        order = np.lexsort((-robots['confidence'], robots['id']))
+        ids = robots['id'][order]
+        x, y, angle, confidence = (robots[c][order] for c in ('x', 'y', 'angle', 'confidence'))
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = ids[1:] != ids[:-1]
+        group = np.cumsum(first) - 1
+
+        near = np.hypot(x - x[first][group], y - y[first][group]) <= self.merge_distance
+        w = np.where(near, np.maximum(confidence, 1e-6), 0.0)
+        total = np.bincount(group, w)
+        merged = robots[order[first]]
+        merged['x'] = np.bincount(group, w * x) / total
+        merged['y'] = np.bincount(group, w * y) / total
+        angle = np.radians(angle)
+        merged['angle'] = np.degrees(np.arctan2(np.bincount(group, w * np.sin(angle)), np.bincount(group, w * np.cos(angle))))
+        return merged
+
+    def merge_balls(self, balls):
+        """
+        The balls on balls, a DETECTED_BALL array, the same ball seen by
+        more than one camera merged, the most confident first.
+
+        >>> from .updater import DETECTED_BALL
+        >>> balls = np.array([(0.0, 0.0, 0.5), (1.0, 0.0, 0.9), (0.02, 0.0, 0.5)], dtype=DETECTED_BALL)
+        >>> Fusion().merge_balls(balls).tolist()
+        [(1.0, 0.0, 0.9), (0.01, 0.0, 0.5)]
+
+        Merges don't chain, a ball near one that was merged is kept apart:
+
+        >>> chain = np.array([(0.16, 0.0, 0.5), (0.08, 0.0, 0.7), (0.0, 0.0, 0.9)], dtype=DETECTED_BALL)
+        >>> [(round(x, 3), y, round(c, 1)) for x, y, c in Fusion().merge_balls(chain).tolist()]
+        [(0.035, 0.0, 0.9), (0.16, 0.0, 0.5)]
+        """
+        if len(balls) < 2:
+            return balls
+        balls = balls[np.argsort(-balls['confidence'], kind='mergesort')]
+        x, y = balls['x'], balls['y']
+        # from the most confident, each ball not taken yet takes those near it that aren't
+        # either, so a ball near one that was taken starts a group of its own
+        near = np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y) <= self.merge_distance
+        group = np.full(len(balls), -1, dtype=int)
+        for i in xrange(len(balls)):
+            if group[i] < 0:
+                group[near[i] & (group < 0)] = i
+        heads = np.unique(group)
+        w = np.maximum(balls['confidence'], 1e-6)
+        total = np.bincount(group, w)[heads]
+        merged = balls[heads].copy()
+        merged['x'] = np.bincount(group, w * x)[heads] / total
+        merged['y'] = np.bincount(group, w * y)[heads] / total
+        return merged
@@ -0,0 +1,69 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Non-blocking I/O on the main loop, as an alternative to one process per
+receiver.
+
+zmq sockets and anything with a fileno(), like the multicast receivers,
+are polled together and the handler of each one that is readable is
+called in place, so what arrives goes straight to the next step.
+"""
+import zmq
+
+
+class IOLoop(object):
+
+    def __init__(self):
+        """
+        Sources with handlers to be called when they have something to read:
+
+        >>> from socket import socket, AF_INET, SOCK_DGRAM
+        >>> loop, got = IOLoop(), []
+        >>> sock = socket(AF_INET, SOCK_DGRAM)
+        >>> sock.bind(('127.0.0.1', 0))
+        >>> loop.register(sock, lambda: got.append(sock.recv(16)))
+        >>> socket(AF_INET, SOCK_DGRAM).sendto('hello', sock.getsockname())
+        5
+        >>> loop.poll(1000), got
+        (1, ['hello'])
+        >>> loop.poll(0)
+        0
+        """
+        self.poller = zmq.Poller()
+        self.handlers = {}
+
+    def register(self, source, handler):
+        self.poller.register(source, zmq.POLLIN)
+        self.handlers[_key(source)] = handler
+
+    def unregister(self, source):
+        if _key(source) in self.handlers:
+            self.poller.unregister(source)
+            del self.handlers[_key(source)]
+
+    def poll(self, timeout=0):
+        """
+        Call the handlers of the sources that are readable, waiting up to
+        timeout milliseconds for the first one, None waits forever. Returns
+        how many were handled.
+        """
+        ready = self.poller.poll(timeout)
+        for source, _ in ready:
+            self.handlers[source]()
+        return len(ready)
+
+
+def _key(source):
+    """What the poller reports source as, the socket for zmq ones and the file descriptor for others."""
+    return source if isinstance(source, zmq.Socket) else source.fileno()
@@ -11,16 +11,66 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU Affero General Public License for more details.
 #
+from collections import deque
+from ctypes import c_ulonglong
+from errno import EAGAIN, EWOULDBLOCK
+from math import degrees
 from multiprocessing import Process, Queue, Event, Lock
+from multiprocessing.sharedctypes import RawArray, RawValue
+from Queue import Empty, Full
+from socket import error as socket_error
 
+from google.protobuf.message import DecodeError
+import numpy as np
+
+from ..base import X, Y, ANGLE, VX, VY, AX, AY, ACTIVE
 from ..config import config
 from ..communication import sslvision
 from ..communication import sslrefbox
+from ..communication.protos.messages_robocup_ssl_wrapper_pb2 import SSL_WrapperPacket
 from ..utils.log import Log
+from ..utils.ring import RecordRing
+from ..utils.scheduler import monotonic
+from .fusion import Fusion
 
 
 STOP_TIMEOUT = 1
 
+# camera ids the VisionUpdater has a slot for, frames of other cameras are dropped
+MAX_CAMERAS = 8
+
+# what the receiver of the VisionUpdater counts
+RECEIVER_COUNTS = ('received', 'truncated', 'dropped', 'drains')
+
+# fixed layout of a detection frame as it is shared by the VisionUpdater, in
+# meters and degrees, robots and balls beyond these are dropped
+MAX_DETECTED_ROBOTS = 16
+MAX_DETECTED_BALLS = 8
+DETECTED_ROBOT = [('id', 'i4'), ('x', 'f8'), ('y', 'f8'), ('angle', 'f8'), ('confidence', 'f8')]
+DETECTED_BALL = [('x', 'f8'), ('y', 'f8'), ('confidence', 'f8')]
+DETECTION_RECORD = [
+    ('camera', 'i4'),
+    ('frame_number', 'i8'),
+    ('t_capture', 'f8'),
+    ('t_sent', 'f8'),
+    # local monotonic time the frame was read at, not from the vision
+    ('t_received', 'f8'),
+    ('n_balls', 'i4'),
+    ('n_yellow', 'i4'),
+    ('n_blue', 'i4'),
+    ('balls', DETECTED_BALL, MAX_DETECTED_BALLS),
+    ('yellow', DETECTED_ROBOT, MAX_DETECTED_ROBOTS),
+    ('blue', DETECTED_ROBOT, MAX_DETECTED_ROBOTS),
+]
+
+
+# robot properties on updates that are written in bulk, and their columns on the world state
+ROBOT_COLUMNS = {
+    'angle': slice(ANGLE, ANGLE + 1),
+    'speed': slice(VX, VY + 1),
+    'acceleration': slice(AX, AY + 1),
+}
+
 
 class Update(dict):
 
@@ -53,6 +103,10 @@ class Update(dict):
         super(Update, self).__init__(data)
 
     def apply(self, world):
+        # robots and ball seen on this update, recorded on the world history at the end,
+        # the robots on the store by their slots and the rest one by one
+        slots = []
+        seen = []
         for prop, value in self.iteritems():
             if prop in ('blue_team', 'yellow_team'):
                 team = getattr(world, prop)
@@ -63,33 +117,9 @@ class Update(dict):
 
                     # let's check if we have robot data
                     if team_prop == '__robots__':
-                        for robot_id, robot_data in team_value.iteritems():
-                            robot = team[robot_id]
-                            #robot_data = team_value
-
-                            # if instead of a dict the data is __delete__ it's used to signale
-                            # that the robot is not seen anymore and should be deactivated
-                            if robot_data == '__delete__':
-                                robot.active = False
-
-                            else:
-                                robot.active = True
-                                # x and y properties have a caveat, they cannot be set directly
-                                # thus they must be set through the update method
-                                robot.update(robot_data['x'], robot_data['y'])
-
-                                # set all other properties the natuarl way
-                                for prop, val in robot_data.iteritems():
-                                    if prop not in ('x', 'y'):
-                                        setattr(robot, prop, val)
-
-                                #FIXME find the right place to do this:
-                                if robot.has_touched_ball:
-                                    for r in robot.team:
-                                        r.is_last_toucher = False
-                                        r.has_touched_ball = False
-                                    robot.is_last_toucher = True
-                                    robot.has_touched_ball = False
+                        team_slots, team_seen = self.apply_robots(world, team, team_value)
+                        slots.extend(team_slots)
+                        seen.extend(team_seen)
 
                     else:
                         setattr(team, team_prop, team_value)
@@ -110,6 +140,7 @@ class Update(dict):
                         pass
                     else:
                         world.ball.update(ball_data['x'], ball_data['y'])
+                        seen.append(world.ball)
                         for ball_prop, ball_prop_value in ball_data.iteritems():
                             if ball_prop not in ('x', 'y'):
                                 setattr(world.ball, ball_prop, ball_prop_value)
@@ -127,10 +158,98 @@ class Update(dict):
                 setattr(world, prop, value)
 
         if self.has_geometry_data():
-            world.right_goal.update((world.length / 2, 0.0))
-            world.left_goal.update((-world.length / 2, 0.0))
+            # the vision repeats the geometry, the goals are only rebuilt when it changes
+            world.update_geometry()
             world.inited = True
 
+        if slots or seen:
+            t = self.get('timestamp', world.timestamp)
+            if slots:
+                world.record_slots(slots, t)
+            for obj in seen:
+                world.record(obj, t)
+
+        # with everything in place, see who touched the ball
+        if self.has_detection_data():
+            world.update_touches()
+
+    def apply_robots(self, world, team, robots):
+        """
+        Write the robots of team on an update to the world state, a column
+        at a time for all of them.
+
+        Returns the slots written, and the robots seen that have no slot on
+        the store, which are written one by one.
+
+        The world ends up as if each robot was applied on its own, with
+        apply_robot, and the touches updated after:
+
+        >>> from ..base import World
+        >>> def detection(robots):
+        ...     return Update({'__detection_data__': 1, 'timestamp': 1.0, 'balls': [{'x': 0.0, 'y': 0.0}], 'blue_team': {'__robots__': robots}})
+        >>> def single(world, robots):
+        ...     for uid, data in robots.iteritems():
+        ...         apply_robot(world.blue_team[uid], data)
+        ...     world.ball.update(0.0, 0.0)
+        ...     world.update_touches()
+        >>> bulk, one_by_one = World(), World()
+        >>> same = lambda: (np.allclose(bulk.state.robots, one_by_one.state.robots, equal_nan=True),
+        ...                 (bulk.state.flags == one_by_one.state.flags).all(), bulk.state.bound.tolist() == one_by_one.state.bound.tolist())
+        >>> robots = {
+        ...     0: {'x': 0.05, 'y': 0.0, 'angle': 90.0, 'speed': (1.0, 0.5, 10.0)},
+        ...     3: {'x': -2.0, 'y': 1.0, 'angle': None},
+        ...     20: {'x': 1.0, 'y': 1.0},
+        ... }
+        >>> detection(robots).apply(bulk); single(one_by_one, robots)
+        >>> same()
+        (True, True, True)
+        >>> bulk.state.robots[[16, 19], X:VY + 1].tolist(), bulk.state.flags[16].tolist()
+        ([[0.05, 0.0, 90.0, 1.0, 0.5], [-2.0, 1.0, nan, 0.0, 0.0]], [True, True, False, False])
+        >>> robots = {0: {'x': 0.5, 'y': 0.0, 'angle': 0.0}, 3: '__delete__'}
+        >>> detection(robots).apply(bulk); single(one_by_one, robots)
+        >>> same(), bulk.blue_team[3].active, bulk.state.flags[16].tolist()
+        ((True, True, True), False, [True, False, True, True])
+        """
+        state = world.state
+        offset = state.slot(team.color, 0)
+        slots, datas, deleted, seen = [], [], [], []
+        for uid, data in robots.iteritems():
+            if not 0 <= uid < state.max_robots:
+                if apply_robot(team[uid], data):
+                    seen.append(team[uid])
+                continue
+            slot = offset + uid
+            if not state.bound[slot]:
+                # robots are built the first time they are seen, binding them to their slot
+                team[uid]
+            # if instead of a dict the data is __delete__ it's used to signal
+            # that the robot is not seen anymore and should be deactivated
+            if data == '__delete__':
+                deleted.append(slot)
+            else:
+                slots.append(slot)
+                datas.append(data)
+
+        if deleted:
+            state.robots[deleted, ACTIVE] = 0.0
+        if datas:
+            rows = np.array(slots)
+            state.robots[rows, ACTIVE] = 1.0
+            state.write(rows, slice(X, Y + 1), [(d['x'], d['y']) for d in datas])
+            for prop in set().union(*datas):
+                if prop in ('x', 'y'):
+                    continue
+                columns = ROBOT_COLUMNS.get(prop)
+                if columns is not None and all(prop in d for d in datas):
+                    # None angles become nan, speeds may have an angular one to be left out
+                    values = np.array([d[prop] for d in datas], dtype=float).reshape(len(datas), -1)
+                    state.write(rows, columns, values[:, :columns.stop - columns.start])
+                else:
+                    for slot, data in zip(slots, datas):
+                        if prop in data:
+                            setattr(state.objects[slot], prop, data[prop])
+        return slots, seen
+
     #def __str__(self):
     #    return "<{}: data={}>".format(type(self), super(Update, self))
 
@@ -175,27 +294,212 @@ class Update(dict):
         for urobot in self.urobots():
             yield urobot
 
+    @classmethod
+    def from_detection(cls, record):
+        """
+        The update of a DETECTION_RECORD, already in meters so the Scale
+        filter leaves it alone.
+        """
+        # one call for all the scalars, in the order of DETECTION_RECORD
+        camera, frame_number, t_capture, t_sent, t_received, n_balls, n_yellow, n_blue, balls, yellow, blue = record.item()
+        robot = lambda uid, x, y, angle, _: (uid, {'x': x, 'y': y, 'angle': angle})
+        return cls({
+            'timestamp': t_capture,
+            '__detection_data__': 1,
+            '__unit__': 'm',
+            'camera': camera,
+            'frame_number': frame_number,
+            't_sent': t_sent,
+            't_received': t_received,
+            'balls': dict((i, {'x': x, 'y': y}) for i, (x, y, _) in enumerate(balls[:n_balls].tolist())),
+            'yellow_team': {'__robots__': dict(robot(*r) for r in yellow[:n_yellow].tolist())},
+            'blue_team': {'__robots__': dict(robot(*r) for r in blue[:n_blue].tolist())},
+        })
+
+
+def apply_robot(robot, data):
+    """Apply the data of a single robot on an update, returns whether it was seen."""
+    if data == '__delete__':
+        robot.active = False
+        return False
+    robot.active = True
+    # x and y properties have a caveat, they cannot be set directly
+    # thus they must be set through the update method
+    robot.update(data['x'], data['y'])
+    # set all other properties the natural way
+    for prop, val in data.iteritems():
+        if prop not in ('x', 'y'):
+            setattr(robot, prop, val)
+    return True
+
+
+def write_detection(record, detection, received=0.0):
+    """
+    Fill a DETECTION_RECORD in place from an SSL_DetectionFrame read at
+    received, millimeters and radians converted as they are copied.
+    """
+    record['camera'] = detection.camera_id
+    record['frame_number'] = detection.frame_number
+    record['t_capture'] = detection.t_capture
+    record['t_sent'] = detection.t_sent
+    record['t_received'] = received
+    balls = detection.balls[:MAX_DETECTED_BALLS]
+    record['n_balls'] = len(balls)
+    record['balls'][:len(balls)] = [(1e-3 * b.x, 1e-3 * b.y, b.confidence) for b in balls]
+    for color, robots in (('yellow', detection.robots_yellow), ('blue', detection.robots_blue)):
+        robots = robots[:MAX_DETECTED_ROBOTS]
+        record['n_' + color] = len(robots)
+        record[color][:len(robots)] = [(r.robot_id, 1e-3 * r.x, 1e-3 * r.y, degrees(r.orientation), r.confidence) for r in robots]
+
+
+def decode_packet(data, record, received=0.0):
+    """
+    Parse a serialized SSL_WrapperPacket, as received or from a log, writing
+    its detection frame, if any, to record. Returns the packet, None if it
+    couldn't be decoded.
+
+    >>> from math import pi
+    >>> packet = SSL_WrapperPacket()
+    >>> d = packet.detection
+    >>> d.frame_number, d.t_capture, d.t_sent, d.camera_id = 7, 1.0, 1.0, 2
+    >>> r = d.robots_blue.add()
+    >>> r.robot_id, r.x, r.y, r.orientation, r.confidence, r.pixel_x, r.pixel_y = 3, 1500.0, -500.0, pi, 1.0, 0.0, 0.0
+    >>> record = np.zeros(1, dtype=DETECTION_RECORD)[0]
+    >>> decode_packet(packet.SerializeToString(), record) is not None, decode_packet('garbage', record)
+    (True, None)
+    >>> record['camera'], record['n_blue'], [round(v, 3) for v in record['blue'][0].tolist()]
+    (2, 1, [3.0, 1.5, -0.5, 180.0, 1.0])
+    """
+    packet = SSL_WrapperPacket()
+    try:
+        packet.ParseFromString(data)
+    except DecodeError:
+        return None
+    if packet.HasField('detection'):
+        write_detection(record, packet.detection, received)
+    return packet
+
+
+def geometry_data(geometry):
+    """The data of an update of an SSL_GeometryData, in meters."""
+    f = geometry.field
+    return {
+        '__geometry_data__': 1,
+        '__unit__': 'm',
+        'width': 1e-3 * f.field_width,
+        'length': 1e-3 * f.field_length,
+        'line_width': 1e-3 * f.line_width,
+        'boundary_width': 1e-3 * f.boundary_width,
+        'referee_width': 1e-3 * f.referee_width,
+        'center_radius': 1e-3 * f.center_circle_radius,
+        'defense_radius': 1e-3 * f.defense_radius,
+        'defense_stretch': 1e-3 * f.defense_stretch,
+        'free_kick_distance': 1e-3 * f.free_kick_from_defense_dist,
+        'penalty_spot_distance': 1e-3 * f.penalty_spot_from_field_line_dist,
+        'penalty_line_distance': 1e-3 * f.penalty_line_from_spot_dist,
+        'goal_width': 1e-3 * f.goal_width,
+        'goal_depth': 1e-3 * f.goal_depth,
+        'goal_wall_width': 1e-3 * f.goal_wall_width,
+    }
+
 
 class Updater(Process):
+    """
+    Receives on a process of its own, or on the main process when attached
+    to an IOLoop, in which case updates are kept on a local deque instead
+    of the queue.
+    """
 
     def __init__(self, maxsize=15):
         Process.__init__(self)
-        #self.queue = Queue(maxsize)
-        self.queue = Queue()
+        self.maxsize = maxsize
+        self.queue = Queue(maxsize)
+        self.local = None
         self.queue_lock = Lock()
         self._exit = Event()
         self.log = Log('interface')
+        # updates dropped for newer ones, by the updater when the queue is full
+        # and by poll when there's more than one queued
+        self._dropped = RawValue(c_ulonglong, 0)
+        self.skipped = 0
+
+    @property
+    def overwritten(self):
+        """How many updates never got to be polled because newer ones came."""
+        return int(self._dropped.value) + self.skipped
 
     def run(self):
+        self.open()
         while not self._exit.is_set():
-            #with self.queue_lock:
-            self.queue.put(self.receive())
-            #self.queue.put_nowait(self.receive())
-            #if self.queue.full():
-            #    try:
-            #        self.queue.get_nowait()
-            #    except:
-            #        pass
+            self.read()
+
+    def open(self):
+        """Create the receiver, on the process that will use it."""
+        raise NotImplementedError
+
+    def read(self):
+        """Receive one packet, blocking if there's none unless attached."""
+        self.put(self.receive())
+
+    def attach(self, ioloop):
+        """Receive on ioloop instead of starting the process."""
+        self.open()
+        self.receiver.setblocking(False)
+        self.local = deque()
+        ioloop.register(self.receiver, self.drain)
+
+    def detach(self, ioloop):
+        if self.local is None:
+            return
+        ioloop.unregister(self.receiver)
+        self.receiver.close()
+        self.local = None
+
+    def drain(self):
+        """Read every packet waiting on the receiver."""
+        while True:
+            try:
+                self.read()
+            except socket_error as e:
+                if e.errno in (EAGAIN, EWOULDBLOCK):
+                    return
+                raise
+
+    def put(self, update):
+        """Queue update, the oldest queued one makes room for it when the queue is full."""
+        if self.local is not None:
+            if len(self.local) == self.maxsize:
+                self.local.popleft()
+                self._dropped.value += 1
+            self.local.append(update)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(update)
+                return
+            except Full:
+                try:
+                    self.queue.get_nowait()
+                    self._dropped.value += 1
+                except Empty:
+                    pass
+
+    def poll(self):
+        """
+        The updates that arrived since the last poll, to be applied in order.
+
+        Only the newest of the queued ones is kept, the others are outdated.
+        """
+        update = None
+        while True:
+            try:
+                queued = self.local.popleft() if self.local is not None else self.queue.get_nowait()
+            except (Empty, IndexError):
+                break
+            if update is not None:
+                self.skipped += 1
+            update = queued
+        return [] if update is None else [update]
 
     def stop(self):
         self._exit.set()
@@ -210,75 +514,113 @@ class Updater(Process):
 
 
 class VisionUpdater(Updater):
-
-    def __init__(self, address, intf):
+    """
+    Each camera has a slot with its latest detection frame, a RecordRing of
+    two records so that one is always complete while the other is written.
+    Frames overwritten before being polled are counted, as are the ones
+    polled too late, more than stale_after seconds behind the newest frame
+    seen. Anything else goes through the queue, as with the other updaters.
+
+    The frames polled are fused with the latest ones of the other cameras,
+    within fusion_window seconds, into one frame, see Fusion.
+
+    Every datagram waiting is read at once, up to buffers of buffer_size
+    bytes, see MulticastReceiver.
+    """
+
+    def __init__(self, address, intf, cameras=MAX_CAMERAS, stale_after=0.1, fusion_window=0.017, merge_distance=0.1,
+                 buffer_size=sslvision.MAX_BUFFER_SIZE, buffers=8, rcvbuf=None):
         super(VisionUpdater, self).__init__()
         self.address = address
         self.intf = intf
-
-    def run(self):
-        self.receiver = sslvision.VisionReceiver(self.address, self.intf)
-        super(VisionUpdater, self).run()
+        self.buffer_size = buffer_size
+        self.buffers = buffers
+        self.rcvbuf = rcvbuf
+        self._receiver_counts = RawArray(c_ulonglong, len(RECEIVER_COUNTS))
+        self.slots = [RecordRing(DETECTION_RECORD, 2) for _ in xrange(cameras)]
+        self.fusion = Fusion(fusion_window, merge_distance)
+        self.stale_after = stale_after
+        self.stale_frames = [0] * cameras
+        self.newest_capture = float('-inf')
+        self._record = np.zeros(1, dtype=DETECTION_RECORD)[0]
+
+    @property
+    def overwritten_frames(self):
+        """Frames of each camera that were replaced by the next before being polled."""
+        return [slot.lost for slot in self.slots]
+
+    @property
+    def receiver_counts(self):
+        """The counters of the receiver, wherever it runs."""
+        return dict(zip(RECEIVER_COUNTS, map(int, self._receiver_counts)))
+
+    def open(self):
+        self.receiver = sslvision.VisionReceiver(self.address, self.intf, self.buffer_size, self.buffers, self.rcvbuf)
+
+    def read(self, block=True):
+        """Handle the packets waiting, returns how many datagrams were read."""
+        received = self.receiver.received
+        packets = self.receiver.get_packets(block)
+        t = monotonic()
+        for packet in packets:
+            if packet.HasField('detection') and packet.detection.camera_id < len(self.slots):
+                with self.slots[packet.detection.camera_id].writing() as record:
+                    write_detection(record, packet.detection, t)
+            if packet.HasField('geometry'):
+                self.put(Update(geometry_data(packet.geometry)))
+        self._receiver_counts[:] = [getattr(self.receiver, c) for c in RECEIVER_COUNTS]
+        return self.receiver.received - received
+
+    def drain(self):
+        while self.read(block=False) == self.buffers:
+            pass
+
+    def poll(self):
+        """
+        The queued update, if any, then a frame fused from the new frames of
+        the cameras. Frames too far behind the newest are dropped, and none
+        is fused when all of them are:
+
+        >>> updater = VisionUpdater(('224.5.23.2', 10002), '0.0.0.0', cameras=2, stale_after=0.1)
+        >>> def detect(camera, t_capture):
+        ...     with updater.slots[camera].writing() as record:
+        ...         record['camera'], record['t_capture'] = camera, t_capture
+        >>> detect(0, 10.0); detect(1, 10.05)
+        >>> [u['timestamp'] for u in updater.poll()], updater.stale_frames
+        ([10.05], [0, 0])
+        >>> detect(0, 10.5); detect(1, 10.3)
+        >>> [u['timestamp'] for u in updater.poll()], updater.stale_frames
+        ([10.5], [0, 1])
+        >>> detect(1, 10.35)
+        >>> updater.poll(), updater.stale_frames
+        ([], [0, 2])
+        """
+        updates = super(VisionUpdater, self).poll()
+        records = [r for r in (slot.latest() for slot in self.slots) if r is not None]
+        if records:
+            self.newest_capture = max(self.newest_capture, max(r['t_capture'] for r in records))
+            fresh = False
+            for record in records:
+                if record['t_capture'] < self.newest_capture - self.stale_after:
+                    self.stale_frames[record['camera']] += 1
+                else:
+                    self.fusion.push(record)
+                    fresh = True
+            if fresh:
+                updates.append(Update.from_detection(self.fusion.fuse()))
+        return updates
 
     def receive(self):
+        """The update of the next packet, not fused with the other cameras."""
         packet = self.receiver.get_packet()
         data = {}
 
         if packet.HasField('geometry'):
-            f = packet.geometry.field
-            data.update({
-                '__geometry_data__': 1,
-                'width': f.field_width,
-                'length': f.field_length,
-                'line_width': f.line_width,
-                'boundary_width': f.boundary_width,
-                'referee_width': f.referee_width,
-                'center_radius': f.center_circle_radius,
-                'defense_radius': f.defense_radius,
-                'defense_stretch': f.defense_stretch,
-                'free_kick_distance': f.free_kick_from_defense_dist,
-                'penalty_spot_distance': f.penalty_spot_from_field_line_dist,
-                'penalty_line_distance': f.penalty_line_from_spot_dist,
-                'goal_width': f.goal_width,
-                'goal_depth': f.goal_depth,
-                'goal_wall_width': f.goal_wall_width,
-            })
+            data.update(geometry_data(packet.geometry))
 
         if packet.HasField('detection'):
-            data.update({
-                'timestamp': packet.detection.t_capture,
-                '__detection_data__': 1,
-                'yellow_team': {'__robots__': {}},
-                'blue_team': {'__robots__': {}},
-                'balls': {},
-                'camera': 0
-            })
-
-            data['camera'] = packet.detection.camera_id
-            data['frame_number'] = packet.detection.frame_number
-
-            balls = data['balls']
-            for i, b in enumerate(packet.detection.balls):
-                balls.update({i: {
-                    'x': b.x,
-                    'y': b.y,
-                }})
-
-            yellow_team = data['yellow_team']['__robots__']
-            for r in packet.detection.robots_yellow:
-                yellow_team.update({r.robot_id: {
-                    'x': r.x,
-                    'y': r.y,
-                    'angle': r.orientation,
-                }})
-
-            blue_team = data['blue_team']['__robots__']
-            for r in packet.detection.robots_blue:
-                blue_team.update({r.robot_id: {
-                    'x': r.x,
-                    'y': r.y,
-                    'angle': r.orientation,
-                }})
+            write_detection(self._record, packet.detection, monotonic())
+            data.update(Update.from_detection(self._record))
 
         return Update(data)
 
@@ -291,9 +633,8 @@ class RefereeUpdater(Updater):
         self.intf = intf
         self.counter = 0
 
-    def run(self):
+    def open(self):
         self.receiver = sslrefbox.RefboxReceiver(self.address, self.intf)
-        super(RefereeUpdater, self).run()
 
     def receive(self):
         referee = self.receiver.get_packet()
@@ -0,0 +1,242 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+The world as it is forwarded to subscribers, packed with struct.
+
+A message is a HEADER followed by sections, the optional ones are flagged
+on the header:
+
+    HEADER    magic, version, flags, sequence, base, frame_number, timestamp
+    BALL      x, y
+    robots    a COUNT, then a ROBOT for each: slot, x, y, angle, state bits
+    names     a COUNT, then the slot, skill and tactic names of each robot
+              whose names changed, as strings prefixed by their length
+    GEOMETRY  the GEOMETRY_FIELDS, with FLAG_GEOMETRY
+    LATENCY   the LATENCY_NAMES spans in milliseconds, with FLAG_LATENCY
+
+Positions are in meters and angles in degrees, NaN when unknown, all as
+single precision floats. Slots are those of the WorldState, yellow robots
+first, robots without a slot are not forwarded.
+
+Key frames, with FLAG_KEY, have every active robot and all their names.
+The other frames are deltas on the frame numbered base, with only the
+robots that changed since, those gone are sent once as inactive.
+
+Messages start with MAGIC, subscribe to it to get only these.
+"""
+from struct import Struct
+
+import numpy as np
+
+from ..base import X, Y, ANGLE, ACTIVE, CAN_KICK, MAX_ROBOTS, GEOMETRY_FIELDS
+from ..utils.profile import LATENCY_SPANS
+
+MAGIC = 'RIWS'
+VERSION = 1
+
+FLAG_KEY = 1
+FLAG_GEOMETRY = 2
+FLAG_LATENCY = 4
+
+# state bits of a robot
+BIT_ACTIVE = 1
+BIT_CAN_KICK = 2
+
+HEADER = Struct('<4sBBIIqd')
+BALL = Struct('<ff')
+COUNT = Struct('<B')
+ROBOT = np.dtype([('slot', 'u1'), ('x', '<f4'), ('y', '<f4'), ('angle', '<f4'), ('bits', 'u1')])
+GEOMETRY = Struct('<{}f'.format(len(GEOMETRY_FIELDS)))
+LATENCY_NAMES = tuple(LATENCY_SPANS) + ('capture to command',)
+LATENCY = Struct('<{}f'.format(len(LATENCY_NAMES)))
+
+
+def _name(obj):
+    return getattr(obj, 'name', None) or ''
+
+
+class Encoder(object):
+
+    def __init__(self, key_interval=60):
+        """
+        Packs a world into messages, every key_interval-th one is a key frame.
+
+        >>> from ..base import World
+        >>> w = World()
+        >>> r = w.blue_team[2]
+        >>> r.update(1.0, -0.5); r.angle = 90.0; r.active = True
+        >>> encoder, decoder = Encoder(), Decoder()
+        >>> frame = decoder.decode(encoder.encode(w, geometry=True))
+        >>> frame['robots'][('blue', 2)]['x'], frame['geometry']['length']
+        (1.0, 6.0)
+        >>> r.update(1.5, -0.5)
+        >>> message = encoder.encode(w)
+        >>> len(message) < 60, decoder.decode(message)['robots'][('blue', 2)]['x']
+        (True, 1.5)
+        >>> r.active = False
+        >>> decoder.decode(encoder.encode(w))['robots']
+        {}
+        """
+        self.key_interval = key_interval
+        self.sequence = 0
+        self.since_key = 0
+        # the robots on the last message and the names sent for each slot
+        self.previous = None
+        self.active = None
+        self.names = {}
+
+    def encode(self, world, geometry=False, latency=None, key=False):
+        """
+        The message of the current state of world, with its geometry and the
+        latency spans if given. key forces a key frame, as for a subscriber
+        that just joined.
+        """
+        state = world.state
+        rows = state.robots
+        current = np.zeros(len(rows), dtype=ROBOT)
+        current['slot'] = np.arange(len(rows))
+        current['x'] = rows[:, X]
+        current['y'] = rows[:, Y]
+        current['angle'] = rows[:, ANGLE]
+        current['bits'] = BIT_ACTIVE * (rows[:, ACTIVE] != 0.0) + BIT_CAN_KICK * (rows[:, CAN_KICK] != 0.0)
+        active = state.bound & (rows[:, ACTIVE] != 0.0)
+
+        key = key or self.previous is None or self.since_key + 1 >= self.key_interval
+        if key:
+            sent = active
+            self.names = {}
+            self.since_key = 0
+        else:
+            # compared byte by byte, so unknown angles are equal
+            changed = (current.view(np.uint8).reshape(len(rows), -1) != self.previous.view(np.uint8).reshape(len(rows), -1)).any(axis=1)
+            sent = changed & (active | self.active)
+            self.since_key += 1
+        self.previous = current
+        self.active = active
+
+        # those gone get their names again when they come back
+        for slot in (sent & ~active).nonzero()[0]:
+            self.names.pop(slot, None)
+        names = []
+        for slot in active.nonzero()[0]:
+            robot = state.objects[slot]
+            pair = (_name(robot.skill)[:255], _name(robot.tactic)[:255])
+            if self.names.get(slot) != pair:
+                self.names[slot] = pair
+                names.append(COUNT.pack(slot) + ''.join(COUNT.pack(len(n)) + n for n in pair))
+
+        self.sequence += 1
+        flags = (FLAG_KEY if key else 0) | (FLAG_GEOMETRY if geometry else 0) | (FLAG_LATENCY if latency is not None else 0)
+        parts = [
+            HEADER.pack(MAGIC, VERSION, flags, self.sequence, self.sequence if key else self.sequence - 1,
+                        int(world.frame_number), float(world.timestamp)),
+            BALL.pack(state.ball[X], state.ball[Y]),
+            COUNT.pack(int(sent.sum())),
+            current[sent].tobytes(),
+            COUNT.pack(len(names)),
+        ] + names
+        if geometry:
+            parts.append(GEOMETRY.pack(*world.geometry_key()))
+        if latency is not None:
+            parts.append(LATENCY.pack(*[latency[n] for n in LATENCY_NAMES]))
+        return ''.join(parts)
+
+
+class Decoder(object):
+
+    def __init__(self):
+        """
+        Keeps what the messages of an Encoder say about the world.
+
+        Deltas on a frame that was missed can't be applied, they are counted
+        on out_of_sync and dropped until the next key frame.
+        """
+        self.sequence = None
+        self.robots = {}
+        self.names = {}
+        self.geometry = None
+        self.out_of_sync = 0
+
+    def decode(self, message):
+        """
+        The frame of message, None if it was dropped. A frame is a dict with
+        the header values, the ball position, the active robots by (color,
+        uid), the last geometry received and the latency spans, if any.
+        """
+        magic, version, flags, sequence, base, frame_number, timestamp = HEADER.unpack_from(message)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version {} world stream message'.format(VERSION))
+        offset = HEADER.size
+        ball = BALL.unpack_from(message, offset)
+        offset += BALL.size
+        count, = COUNT.unpack_from(message, offset)
+        offset += COUNT.size
+        robots = np.frombuffer(message, ROBOT, count, offset)
+        offset += count * ROBOT.itemsize
+        count, = COUNT.unpack_from(message, offset)
+        offset += COUNT.size
+        names = []
+        for _ in xrange(count):
+            slot, = COUNT.unpack_from(message, offset)
+            offset += COUNT.size
+            pair = []
+            for _ in xrange(2):
+                length, = COUNT.unpack_from(message, offset)
+                offset += COUNT.size
+                pair.append(message[offset:offset + length] or None)
+                offset += length
+            names.append((slot, tuple(pair)))
+        if flags & FLAG_GEOMETRY:
+            self.geometry = dict(zip(GEOMETRY_FIELDS, GEOMETRY.unpack_from(message, offset)))
+            offset += GEOMETRY.size
+        latency = None
+        if flags & FLAG_LATENCY:
+            latency = dict(zip(LATENCY_NAMES, LATENCY.unpack_from(message, offset)))
+
+        if flags & FLAG_KEY:
+            self.robots = {}
+            self.names = {}
+        elif base != self.sequence:
+            self.out_of_sync += 1
+            return None
+        self.sequence = sequence
+        for slot, x, y, angle, bits in robots.tolist():
+            if bits & BIT_ACTIVE:
+                self.robots[slot] = (x, y, None if angle != angle else angle, bool(bits & BIT_CAN_KICK))
+            else:
+                self.robots.pop(slot, None)
+                self.names.pop(slot, None)
+        self.names.update(names)
+
+        frame = {
+            'sequence': sequence,
+            'frame_number': frame_number,
+            'timestamp': timestamp,
+            'ball': ball,
+            'robots': {},
+            'geometry': self.geometry,
+            'latency': latency,
+        }
+        for slot, (x, y, angle, can_kick) in self.robots.iteritems():
+            skill, tactic = self.names.get(slot, (None, None))
+            color = 'yellow' if slot < MAX_ROBOTS else 'blue'
+            frame['robots'][(color, slot % MAX_ROBOTS)] = {
+                'x': x,
+                'y': y,
+                'angle': angle,
+                'can_kick': can_kick,
+                'skill': skill,
+                'tactic': tactic,
+            }
+        return frame
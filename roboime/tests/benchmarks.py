@@ -0,0 +1,856 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Micro benchmarks for the hot paths of the intelligence.
+
+Run with `python -m roboime.tests.benchmarks`.
+"""
+import json
+import math
+import sys
+from copy import deepcopy
+from cPickle import dumps, HIGHEST_PROTOCOL
+from multiprocessing import Queue
+from Queue import Empty
+from random import Random
+from socket import socket, AF_INET, SOCK_DGRAM
+from time import time, sleep
+
+import numpy
+from numpy import array, linspace
+from google.protobuf.message import DecodeError
+from shapely.geometry.base import BaseGeometry
+from shapely.geometry.point import geos_point_from_py
+import zmq
+
+from ..base import World, Blue, Yellow, X
+from ..config import config
+from ..core.plays.autoretaliate import AutoRetaliate
+from ..core.plays.ifrit import Ifrit
+from ..core.plays.indirectkick import IndirectKick
+from ..core.skills.goto import Goto
+from ..core.worker import SharedWorld, PlayWorker
+from ..interface import filter
+from ..interface.commander import SimCommander, Tx2012Commander
+from ..interface.ioloop import IOLoop
+from ..interface import Interface, worldstream
+from ..interface.updater import Update, VisionUpdater, write_detection, decode_packet, geometry_data, DETECTION_RECORD
+from ..communication.protos.messages_robocup_ssl_wrapper_pb2 import SSL_WrapperPacket
+from ..communication.sslvision import VisionReceiver
+from ..utils import geom
+from ..utils.planner import Planner
+from ..utils.scheduler import Scheduler, monotonic
+
+
+def populated_world(robots_per_team=6, seed=0):
+    """A world with robots_per_team active robots on each side and a ball."""
+    rand = Random(seed)
+    world = World()
+    for color in (Blue, Yellow):
+        team = world.team(color)
+        for uid in xrange(robots_per_team):
+            r = team[uid]
+            r.update(rand.uniform(-3.0, 3.0), rand.uniform(-2.0, 2.0))
+            r.active = True
+    world.ball.update(rand.uniform(-3.0, 3.0), rand.uniform(-2.0, 2.0))
+    return world
+
+
+def timeit(func, times=1000, repeat=1):
+    """Average time in microseconds of func() over times runs, the best of repeat tries."""
+    best = None
+    for _ in xrange(repeat):
+        t0 = time()
+        for _ in xrange(times):
+            func()
+        elapsed = (time() - t0) * 1e6 / times
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def compare(title, variants, sizes=(6, 11), times=1000, repeat=1):
+    """
+    Print the time of each of the (name, func) pairs variants(world, n)
+    returns for a populated_world with n robots a team, for each n in sizes.
+    """
+    for n in sizes:
+        world = populated_world(n)
+        print '{0}v{0} {1}: {2}'.format(n, title, ', '.join(
+            '{} {:.1f}us'.format(name, timeit(func, times, repeat)) for name, func in variants(world, n)))
+
+
+def closest_robots_shapely(world, point, can_kick=True, color=None, active=True):
+    """The previous list/sort based query, kept as the reference."""
+    robots = world.iterrobots(can_kick=can_kick, active=active, color=color)
+    return [r for d, r in sorted((r.distance(point), r) for r in robots)]
+
+
+def bench_closest_robots(times=1000):
+    compare('closest robots to the ball', lambda world, n: [
+        ('shapely', lambda: closest_robots_shapely(world, world.ball)),
+        ('numpy', lambda: world.closest_robots_to_point(world.ball)),
+        ('closest_robot', lambda: world.closest_robot_to_point(world.ball)),
+    ], times=times)
+
+
+def has_clear_shot_shapely(world, point_to_kick):
+    """The previous buffered line against polygon bodies test, kept as the reference."""
+    shot_line = geom.Line(world.ball, point_to_kick).buffer(world.ball.radius)
+    for robot in world.iterrobots():
+        if shot_line.crosses(robot.body):
+            return False
+    return True
+
+
+def bench_clear_shots(times=1000):
+    def variants(world, n):
+        goal = world.right_goal
+        points = [(goal.x, y) for y in linspace(goal.p2.y, goal.p1.y, 5)]
+        return [
+            ('shapely', lambda: [has_clear_shot_shapely(world, geom.Point(x, y)) for x, y in points]),
+            ('analytic', lambda: world.has_clear_shots(points)),
+        ]
+    compare('clear shots to 5 goal points', variants, times=times)
+
+
+def detection_update(robots_per_team=6, seed=0):
+    """An Update with one detection of every robot and of the ball, already in meters."""
+    rand = Random(seed)
+
+    def robots():
+        return dict((uid, {
+            'x': rand.uniform(-3.0, 3.0),
+            'y': rand.uniform(-2.0, 2.0),
+            'angle': rand.uniform(0.0, 360.0),
+        }) for uid in xrange(robots_per_team))
+
+    return Update({
+        '__detection_data__': 1,
+        'blue_team': {'__robots__': robots()},
+        'yellow_team': {'__robots__': robots()},
+        'balls': {0: {'x': rand.uniform(-3.0, 3.0), 'y': rand.uniform(-2.0, 2.0)}},
+    })
+
+
+def count_geometries(func):
+    """How many shapely geometries func() creates."""
+    count = [0]
+    init = BaseGeometry.__init__
+
+    def counting_init(self, *args, **kwargs):
+        count[0] += 1
+        init(self, *args, **kwargs)
+
+    BaseGeometry.__init__ = counting_init
+    try:
+        func()
+    finally:
+        BaseGeometry.__init__ = init
+    return count[0]
+
+
+def filtered_update(robots_per_team=6, seed=0):
+    """A detection_update with the speeds and accelerations the filters add."""
+    update = detection_update(robots_per_team, seed)
+    for _, data in update.uobjects():
+        data['speed'] = numpy.array((0.5, -0.5))
+        data['acceleration'] = numpy.array((0.1, 0.1))
+    return update
+
+
+def bench_update_apply(times=1000):
+    def variants(world, n):
+        raw, filtered = detection_update(n), filtered_update(n)
+        return [('raw', lambda: raw.apply(world)), ('filtered', lambda: filtered.apply(world))]
+    compare('Update.apply', variants, sizes=(6, 11, 16), times=times, repeat=3)
+
+
+def count_allocations(func):
+    """
+    What func() allocates: calls to numpy.array, shapely geometries, GEOS
+    points built from coordinates and Vec2 vectors.
+    """
+    counts = dict.fromkeys(('arrays', 'geos points', 'vectors'), 0)
+    codes = {geos_point_from_py.__code__: 'geos points'}
+    if hasattr(geom, 'Vec2'):
+        codes[geom.Vec2.__init__.__code__] = 'vectors'
+
+    def profile(frame, event, arg):
+        if event == 'c_call' and arg is numpy.array:
+            counts['arrays'] += 1
+        elif event == 'call' and frame.f_code in codes:
+            counts[codes[frame.f_code]] += 1
+
+    def profiled():
+        sys.setprofile(profile)
+        try:
+            func()
+        finally:
+            sys.setprofile(None)
+
+    counts['geometries'] = count_geometries(profiled)
+    return counts
+
+
+def bench_goto_step(times=1000):
+    world = populated_world(6)
+    robot = world.blue_team[0]
+    for blocked in (False, True):
+        robot.update(-2.0, 0.0)
+        # a robot right on the way to the target makes the planner detour
+        world.yellow_team[1].update(0.2, 0.0 if blocked else 1.5)
+        goto = Goto(robot, target=geom.Point(2.0, 0.0))
+        goto._step()
+        counts = count_allocations(goto._step)
+        step_time = timeit(goto._step, times)
+        print 'Goto._step, {}: {:.1f}us, {}'.format(
+            'detouring' if blocked else 'clear path', step_time,
+            ', '.join('{} {}'.format(v, k) for k, v in sorted(counts.items())))
+
+
+def point_outside_area_shapely(goal, point):
+    """The previous buffer/intersection/centroid projection, kept as the reference."""
+    if point.within(goal.area):
+        r = point.distance(goal.area.exterior)
+        return point.buffer(r + 0.01).intersection(goal.area.exterior).centroid
+    return point
+
+
+def bench_defense_area(times=1000):
+    def variants(world, n):
+        goal = world.left_goal
+        rand = Random(1)
+        points = [geom.Point(goal.x + rand.uniform(0.0, 0.8), rand.uniform(-0.8, 0.8)) for _ in xrange(10)]
+        xy = array([(p.x, p.y) for p in points])
+        return [
+            ('shapely', lambda: [point_outside_area_shapely(goal, p) for p in points]),
+            ('stadium', lambda: [goal.point_outside_area(p) for p in points]),
+            ('batched', lambda: goal.points_outside_area(xy)),
+        ]
+    compare('10 points out of the defense area', variants, sizes=(6,), times=times)
+
+
+def point_to_kick_sampled(world, goal, samples=5):
+    """The previous sampled goal opening search, kept as the reference."""
+    ys = linspace(goal.p2.y, goal.p1.y, samples)
+    clear = world.has_clear_shots([(goal.x, y) for y in ys])
+    best, run = [], []
+    for y, c in zip(ys, clear):
+        run = run + [y] if c else []
+        if len(run) > len(best):
+            best = run
+    if best:
+        return geom.Point(goal.x, (best[0] + best[-1]) / 2)
+
+
+def bench_shot_openings(times=1000):
+    def variants(world, n):
+        goal = world.right_goal
+        return [
+            ('5 samples', lambda: point_to_kick_sampled(world, goal, 5)),
+            ('10 samples', lambda: point_to_kick_sampled(world, goal, 10)),
+            ('exact', lambda: world.best_opening(goal.p2, goal.p1)),
+        ]
+    compare('goal opening', variants, times=times)
+
+
+def bench_indirect_positions(times=100):
+    compare('best_indirect_positions', lambda world, n: [
+        ('6x4 grid', lambda: world.blue_team.best_indirect_positions()),
+        ('60x58 grid best only', lambda: world.blue_team.best_indirect_positions(precision=60, k=1)),
+    ], times=times)
+
+
+def history_step(world, n, filtered=True):
+    """A step of the apply of an update, after the speed filters bound to world if filtered."""
+    update = detection_update(n)
+    filters = [filter.DeactivateInactives(), filter.Acceleration(), filter.Speed()] if filtered else []
+    for fi in filters:
+        fi.bind(world)
+    frame = [0]
+
+    def step():
+        frame[0] += 1
+        u = deepcopy(update)
+        u['timestamp'] = frame[0] / 60.0
+        for fi in reversed(filters):
+            fi.filter_update(u)
+        u.apply(world)
+    return step
+
+
+def bench_history(times=1000):
+    compare('update applied', lambda world, n: [
+        ('alone', history_step(populated_world(n), n, filtered=False)),
+        ('after the speed filters', history_step(world, n)),
+    ], times=times)
+
+    def queries(world, n):
+        step = history_step(world, n)
+        for _ in xrange(10):
+            step()
+        robot = world.blue_team[0]
+        return [
+            ('pose_at', lambda: world.pose_at(robot, world.timestamp / 2)),
+            ('velocity', lambda: world.velocity(robot, 0.1)),
+            ('last 8 samples', lambda: world.last_samples(robot, 8)),
+        ]
+    compare('history of a robot', queries, sizes=(11,), times=times)
+
+
+class NullSender(object):
+    """Stands for the sender of a commander, drops everything."""
+
+    def send(self, packet):
+        pass
+
+    def send_packet(self, packet):
+        pass
+
+
+def commander_step(world, n, commander):
+    """Set the actions of n robots of the blue team and send them with commander, on a NullSender."""
+    robots = [world.blue_team[uid] for uid in xrange(n)]
+    sender = NullSender()
+    if isinstance(commander, SimCommander):
+        sender.new_packet = commander.sender.new_packet
+    commander.sender = sender
+
+    def step():
+        for i, r in enumerate(robots):
+            r.action.absolute_speeds = (0.5, -0.2, 10.0 * i)
+            r.action.kick = 0.5 if i % 2 else None
+        commander.send([r.action for r in robots])
+    return step
+
+
+def bench_commanders(times=1000):
+    compare('commander send', lambda world, n: [
+        ('SimCommander', commander_step(world, n, SimCommander(world.blue_team, ('127.0.0.1', 20011)))),
+        ('Tx2012Commander', commander_step(world, n, Tx2012Commander(world.blue_team))),
+    ], times=times, repeat=5)
+
+
+def detection_packet(robots_per_team=6, seed=0, camera=0):
+    """A vision packet with one detection frame, in millimeters as the vision sends it."""
+    rand = Random(seed)
+    packet = SSL_WrapperPacket()
+    d = packet.detection
+    d.frame_number, d.t_capture, d.t_sent, d.camera_id = 1000 + seed, 10.0 + seed / 60.0, 10.01 + seed / 60.0, camera
+    for robots in (d.robots_blue, d.robots_yellow):
+        for uid in xrange(robots_per_team):
+            r = robots.add()
+            r.robot_id, r.confidence, r.pixel_x, r.pixel_y = uid, rand.uniform(0.5, 1.0), 0.0, 0.0
+            r.x, r.y, r.orientation = rand.uniform(-3000, 3000), rand.uniform(-2000, 2000), rand.uniform(-3.1, 3.1)
+    b = d.balls.add()
+    b.confidence, b.pixel_x, b.pixel_y = 0.9, 0.0, 0.0
+    b.x, b.y = rand.uniform(-3000, 3000), rand.uniform(-2000, 2000)
+    return packet
+
+
+class PacketReceiver(object):
+    """Stands for a VisionReceiver, always gives the same packet."""
+
+    def __init__(self, packet):
+        self.packet = packet
+
+    def get_packet(self):
+        return self.packet
+
+
+def bench_detection_transport(times=300, cameras=4):
+    """What the main loop spends on the detections that arrived since the last step."""
+    for n, backlog in ((6, 1), (11, 1), (11, 10)):
+        updater = VisionUpdater(('224.5.23.2', 10002), '0.0.0.0')
+        queue = Queue()
+        queued = shared = 0.0
+        for i in xrange(times):
+            # backlog frames per camera, as when the loop stalls
+            for k in xrange(backlog):
+                for c in xrange(cameras):
+                    packet = detection_packet(n, seed=i * backlog + k, camera=c)
+                    updater.receiver = PacketReceiver(packet)
+                    queue.put(updater.receive())
+                    with updater.slots[c].writing() as record:
+                        write_detection(record, packet.detection)
+            # let the feeder thread of the queue flush everything
+            sleep(0.002 * backlog)
+
+            # whichever goes first finds the caches colder, take turns
+            for which in ((0, 1) if i % 2 else (1, 0)):
+                t0 = time()
+                if which:
+                    updater.poll()
+                    shared += time() - t0
+                else:
+                    # the previous Interface.step drain
+                    for _ in xrange(15):
+                        queue.get()
+                        if queue.empty():
+                            break
+                    queued += time() - t0
+        # the old drain never catches up with a backlog
+        try:
+            while True:
+                queue.get(timeout=0.1)
+        except Empty:
+            pass
+        print '{0}v{0} {1} cameras, {2} frames behind: queue {3:.1f}us for the last frame, slots {4:.1f}us for the last of each camera fused'.format(
+            n, cameras, backlog, queued * 1e6 / times, shared * 1e6 / times)
+
+        # and what the updater spends on each one
+        packet = detection_packet(n)
+        updater.receiver = PacketReceiver(packet)
+
+        def write():
+            with updater.slots[0].writing() as record:
+                write_detection(record, packet.detection)
+
+        print '{0}v{0} detection from the updater: Update pickled {1:.1f}us, record written {2:.1f}us'.format(
+            n, timeit(lambda: dumps(updater.receive(), HIGHEST_PROTOCOL), 1000, repeat=3), timeit(write, 1000, repeat=3))
+
+
+def vision_filters(world):
+    """The filters of a TxInterface bound to world, in the order Interface.step runs them."""
+    filters = list(reversed([
+        filter.DeactivateInactives(),
+        filter.Acceleration(),
+        filter.Speed(),
+        filter.Kalman(),
+        filter.Speed(3),
+        filter.RegisterPosition("input"),
+        filter.Scale(),
+    ]))
+    for fi in filters:
+        fi.bind(world)
+    return filters
+
+
+def bench_fusion(times=300, cameras=4):
+    """What a step spends filtering and applying the frames of all cameras."""
+    for n in (6, 11):
+        updater = VisionUpdater(('224.5.23.2', 10002), '0.0.0.0')
+        worlds = [populated_world(n), populated_world(n)]
+        filters = [vision_filters(w) for w in worlds]
+        spent = [0.0, 0.0]
+        for i in xrange(times):
+            records = []
+            for c in xrange(cameras):
+                with updater.slots[c].writing() as record:
+                    write_detection(record, detection_packet(n, seed=i, camera=c).detection)
+                records.append(record.copy())
+            for which in ((0, 1) if i % 2 else (1, 0)):
+                t0 = time()
+                # each frame on its own, as before, or fused
+                updates = [Update.from_detection(r) for r in records] if which == 0 else updater.poll()
+                for update in updates:
+                    for fi in filters[which]:
+                        update = fi.filter_update(update) or update
+                    update.apply(worlds[which])
+                spent[which] += time() - t0
+        print '{0}v{0} {1} cameras per step: each frame filtered {2:.1f}us, fused {3:.1f}us'.format(
+            n, cameras, spent[0] * 1e6 / times, spent[1] * 1e6 / times)
+
+
+def bench_receive_latency(times=300, port=10992):
+    """
+    From a vision packet being sent to its frame being polled, with the
+    VisionUpdater on a process of its own or attached to an IOLoop. The
+    packets are sent straight to the port, the loopback has no multicast.
+    """
+    packets = [detection_packet(6, seed=i).SerializeToString() for i in xrange(times)]
+    sender = socket(AF_INET, SOCK_DGRAM)
+    for attached in (False, True):
+        updater = VisionUpdater(('224.5.23.2', port), '127.0.0.1')
+        ioloop = IOLoop()
+        if attached:
+            updater.attach(ioloop)
+        else:
+            updater.start()
+            sleep(0.5)
+        latencies = []
+        for packet in packets:
+            t0 = time()
+            sender.sendto(packet, ('127.0.0.1', port))
+            while time() - t0 < 0.1:
+                ioloop.poll(0)
+                if updater.poll():
+                    latencies.append(time() - t0)
+                    break
+            sleep(0.001)
+        if attached:
+            updater.detach(ioloop)
+        else:
+            updater.stop()
+        latencies.sort()
+        print 'vision {0}: median {1:.1f}us, 90th percentile {2:.1f}us, {3} of {4} lost'.format(
+            'on an IOLoop' if attached else 'on its process', latencies[len(latencies) // 2] * 1e6,
+            latencies[len(latencies) * 9 // 10] * 1e6, times - len(latencies), times)
+
+
+def bench_receive_burst(times=200, cameras=4, port=10993):
+    """
+    Reading and decoding a burst of frames, one per camera, as they pile up
+    while the loop is busy. The old receiver read one datagram of at most
+    1024 bytes per call, the last frame with 16 robots a team doesn't fit.
+    """
+    packets = [detection_packet(11, camera=c).SerializeToString() for c in xrange(cameras - 1)]
+    packets.append(detection_packet(16, camera=cameras - 1).SerializeToString())
+    sender = socket(AF_INET, SOCK_DGRAM)
+    receiver = VisionReceiver(('224.5.23.2', port), '127.0.0.1', buffers=cameras)
+
+    def read_one():
+        wrapper = SSL_WrapperPacket()
+        try:
+            wrapper.ParseFromString(receiver._sock.recvfrom(1024)[0])
+            return wrapper
+        except DecodeError:
+            return None
+
+    spent = [0.0, 0.0]
+    decoded = [0, 0]
+    for i in xrange(times):
+        for which in ((0, 1) if i % 2 else (1, 0)):
+            for packet in packets:
+                sender.sendto(packet, ('127.0.0.1', port))
+            sleep(0.001)
+            t0 = time()
+            got = receiver.get_packets(block=True) if which else [read_one() for _ in packets]
+            spent[which] += time() - t0
+            decoded[which] += sum(p is not None for p in got)
+    print '{0} frames of {1} bytes a burst: recvfrom {2:.1f}us {3} decoded, drained {4:.1f}us {5} decoded of {6}'.format(
+        cameras, '/'.join(str(len(p)) for p in packets), spent[0] * 1e6 / times, decoded[0],
+        spent[1] * 1e6 / times, decoded[1], cameras * times)
+    receiver.close()
+
+
+def bench_loop_rate(rate=120, ticks=240, step=0.003):
+    """
+    A loop of steps taking step seconds at rate, sleeping a fixed delay
+    after each step as the CLI did, or on the deadlines of a Scheduler.
+    """
+    def busy():
+        t0 = monotonic()
+        while monotonic() - t0 < step:
+            pass
+
+    t0 = monotonic()
+    for _ in xrange(ticks):
+        busy()
+        sleep(1.0 / rate)
+    delayed = ticks / (monotonic() - t0)
+
+    scheduler = Scheduler(rate)
+    scheduler.start()
+    t0 = monotonic()
+    for _ in xrange(ticks):
+        busy()
+        scheduler.wait()
+    scheduled = ticks / (monotonic() - t0)
+    print '{0} Hz with {1:.0f}ms steps: delay after each step {2:.1f} Hz, scheduled {3:.1f} Hz, jitter avg {4:.3f}ms max {5:.3f}ms, {6} overruns'.format(
+        rate, step * 1e3, delayed, scheduled, scheduler.mean_jitter * 1e3, scheduler.max_jitter * 1e3, scheduler.overruns)
+
+
+def update_from_dicts(data):
+    """The Update of a serialized packet as VisionUpdater.receive used to build it, then scaled."""
+    packet = SSL_WrapperPacket()
+    packet.ParseFromString(data)
+    d = packet.detection
+    update = Update({
+        'timestamp': d.t_capture,
+        '__detection_data__': 1,
+        'camera': d.camera_id,
+        'frame_number': d.frame_number,
+        'yellow_team': {'__robots__': {}},
+        'blue_team': {'__robots__': {}},
+        'balls': {},
+    })
+    for i, b in enumerate(d.balls):
+        update['balls'].update({i: {'x': b.x, 'y': b.y}})
+    for robots, team in ((d.robots_yellow, 'yellow_team'), (d.robots_blue, 'blue_team')):
+        for r in robots:
+            update[team]['__robots__'].update({r.robot_id: {'x': r.x, 'y': r.y, 'angle': r.orientation}})
+    return filter.Scale().filter_update(update) or update
+
+
+def bench_decode(times=2000):
+    """
+    Serialized packets to meters and degrees, through dicts and the Scale
+    filter for each packet or into a record, which only becomes an Update
+    once per fused frame.
+    """
+    record = numpy.zeros(1, dtype=DETECTION_RECORD)[0]
+
+    def variants(world, n):
+        data = detection_packet(n).SerializeToString()
+        decode_packet(data, record)
+        return [
+            ('dicts and Scale', lambda: update_from_dicts(data)),
+            ('record', lambda: decode_packet(data, record)),
+            ('Update of the fused frame', lambda: Update.from_detection(record)),
+        ]
+    compare('packet decoded', variants, times=times, repeat=5)
+
+
+def geometry_packet(length=9000, width=6000):
+    """A vision packet with the field geometry, in millimeters."""
+    packet = SSL_WrapperPacket()
+    f = packet.geometry.field
+    f.line_width, f.field_length, f.field_width, f.boundary_width, f.referee_width = 10, length, width, 250, 425
+    f.goal_width, f.goal_depth, f.goal_wall_width, f.center_circle_radius = 1000, 180, 20, 500
+    f.defense_radius, f.defense_stretch, f.free_kick_from_defense_dist = 1000, 500, 700
+    f.penalty_spot_from_field_line_dist, f.penalty_line_from_spot_dist = 1000, 400
+    return packet
+
+
+class RepeatingUpdater(object):
+    """Stands for a VisionUpdater on a vision that sends the geometry with every frame."""
+
+    def __init__(self, *updates):
+        self.updates = updates
+
+    def poll(self):
+        return [Update(u) for u in self.updates]
+
+
+def bench_geometry(times=600, forward_on='tcp://127.0.0.1:16665'):
+    """
+    A step with a detection frame and the same geometry again, as the
+    vision repeats it, and what is forwarded for it.
+    """
+    world = populated_world(6)
+    geometry = Update(geometry_data(geometry_packet().geometry))
+    geometry.apply(world)
+    world.right_goal.area
+
+    def repeated():
+        geometry.apply(world)
+        # what the goals cache is rebuilt on the next look if they were touched
+        world.right_goal.area
+        world.left_goal.area
+    print 'repeated geometry applied: {0:.1f}us'.format(timeit(repeated, times, repeat=3))
+
+    forward_vision_on = config['interface']['forward_vision_on']
+    config['interface']['forward_vision_on'] = forward_on
+    try:
+        interface = Interface(World(), updaters=[RepeatingUpdater(geometry, detection_update(6))])
+    finally:
+        config['interface']['forward_vision_on'] = forward_vision_on
+    sub = interface.zmq_socket.context.socket(zmq.SUB)
+    sub.connect(forward_on)
+    sub.setsockopt(zmq.SUBSCRIBE, '')
+    sleep(0.2)
+    t0 = time()
+    for _ in xrange(times):
+        interface.update()
+    elapsed = (time() - t0) * 1e6 / times
+    sleep(0.1)
+    sizes = []
+    with_geometry = 0
+    while sub.poll(100):
+        message = sub.recv()
+        sizes.append(len(message))
+        with_geometry += bool(worldstream.HEADER.unpack_from(message)[2] & worldstream.FLAG_GEOMETRY)
+    print '{0} steps forwarded: {1:.1f}us a step, {2} of {3} messages with geometry, {4:.0f} bytes a message'.format(
+        times, elapsed, with_geometry, len(sizes), float(sum(sizes)) / max(len(sizes), 1))
+    sub.close()
+    interface.zmq_socket.close()
+
+
+class Named(object):
+    """Stands for a skill or tactic, only the name is forwarded."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+def json_wrapper(world, latency):
+    """What was forwarded with send_json for each frame, before the world stream."""
+    w = world
+    detection = {
+        'camera_id': 'intel',
+        'frame_number': w.frame_number,
+        'balls': [{'x': 1000 * w.ball.x, 'y': 1000 * w.ball.y}],
+        'robots_blue': [],
+        'robots_yellow': [],
+    }
+    for t, k in [(w.blue_team, 'robots_blue'), (w.yellow_team, 'robots_yellow')]:
+        for r in t:
+            robot = {
+                'robot_id': r.uid,
+                'x': 1000 * r.x,
+                'y': 1000 * r.y,
+                'orientation': math.radians(r.angle),
+            }
+            if r.skill is not None:
+                robot['skill'] = {'name': r.skill.name}
+            if r.tactic is not None:
+                robot['tactic'] = {'name': r.tactic.name}
+            detection[k].append(robot)
+    return {'detection': detection, 'latency': latency}
+
+
+def forwarded_world(world):
+    """Gives every robot of world an angle, a skill and a tactic, returns a function moving them all."""
+    for r in world.iterrobots():
+        r.angle = 45.0
+        r.skill, r.tactic = Named('Goto'), Named('Blocker')
+
+    def move():
+        world.state.robots[:, X] += 1e-3
+    return move
+
+
+def bench_forward(times=2000):
+    """
+    A frame of the forwarded stream as JSON and packed, with every robot
+    moving, and decoding it on the other end.
+    """
+    latency = dict((name, 1.0) for name in worldstream.LATENCY_NAMES)
+
+    def encoders(world, n):
+        move = forwarded_world(world)
+        encoder = worldstream.Encoder()
+        encoder.encode(world, latency=latency)
+        move()
+        json_size, delta_size = len(json.dumps(json_wrapper(world, latency))), len(encoder.encode(world, latency=latency))
+        return [
+            ('json {} bytes'.format(json_size), lambda: (move(), json.dumps(json_wrapper(world, latency)))),
+            ('packed {} bytes'.format(delta_size), lambda: (move(), encoder.encode(world, latency=latency))),
+        ]
+    compare('forwarded frame', encoders, times=times, repeat=3)
+
+    def decoders(world, n):
+        forwarded_world(world)
+        encoder, decoder = worldstream.Encoder(), worldstream.Decoder()
+        encoded = json.dumps(json_wrapper(world, latency))
+        # a key frame and the deltas after it
+        messages = [encoder.encode(world, latency=latency, key=True)] + [encoder.encode(world, latency=latency) for _ in xrange(9)]
+
+        def decode():
+            for message in messages:
+                decoder.decode(message)
+        return [('json', lambda: json.loads(encoded)), ('packed key frame and 9 deltas', decode)]
+    compare('forwarded frame decoded', decoders, times=times, repeat=3)
+
+
+def bench_play_workers(times=200):
+    """
+    The plays of both teams of a self-play, AutoRetaliate on each, stepped
+    one after the other or on a PlayWorker each, merging their actions.
+    """
+    workers = []
+
+    def variants(world, n):
+        for i, r in enumerate(world.iterrobots()):
+            r.angle = 30.0 * i
+        teams = world.blue_team, world.yellow_team
+        plays = [AutoRetaliate(t) for t in teams]
+
+        def sequential():
+            for p in plays:
+                p.step()
+
+        shared = SharedWorld()
+        started = [PlayWorker(t.color, shared, {'auto_retaliate': AutoRetaliate}) for t in teams]
+        workers.extend(started)
+        for w in started:
+            w.start()
+            w.set_play('auto_retaliate')
+
+        def parallel():
+            frame = shared.write(world)
+            for w, t in zip(started, teams):
+                w.step(frame, t)
+            for w, t in zip(started, teams):
+                w.collect(t)
+        return [('sequential', sequential), ('on workers', parallel)]
+
+    try:
+        compare('both plays', variants, times=times, repeat=3)
+    finally:
+        for w in workers:
+            w.stop()
+
+
+def bench_planner(frames=120, period=1.0 / 60):
+    """
+    What the expensive plans cost the frame, made inline or on a Planner
+    with threads, on a loop that idles until the next frame as the CLI does.
+    Only the calls are timed, the percent of frames that fell back is shown
+    too.
+    """
+    world = populated_world(6)
+    for i, r in enumerate(world.iterrobots()):
+        r.angle = 30.0 * i
+    robot = world.blue_team[0]
+    robot.update(-2.0, 0.0)
+    world.yellow_team[1].update(0.2, 0.0)
+    goto = Goto(robot, target=geom.Point(2.0, 0.0))
+    ifrit = Ifrit(world.blue_team)
+    passer, receiver = world.blue_team[1], world.blue_team[2]
+    indirect = IndirectKick(world.blue_team)
+    plans = [
+        # without threads Goto makes its full plan on the frame
+        ('Goto._step detouring', goto._step, goto._step),
+        ('Ifrit best receiver', lambda: ifrit.best_receiver_positions(passer, receiver), lambda: world.planner.plan(
+            ifrit, 'receiver', world.frame_number,
+            lambda: ifrit.receiver_positions_job(passer, receiver),
+            lambda: ifrit.crude_receiver_positions(passer, receiver))),
+        ('IndirectKick 30x28 spot', lambda: world.blue_team.best_indirect_positions(precision=indirect.fine_precision, k=1),
+         indirect.plan_position),
+    ]
+    for name, inline, planned in plans:
+        results = []
+        for threads, func in ((0, inline), (2, planned)):
+            world.planner = Planner(threads)
+            times = []
+            for frame in xrange(frames):
+                world.frame_number = frame
+                t0 = time()
+                func()
+                times.append(time() - t0)
+                sleep(max(period - times[-1], 0.0))
+            world.planner.wait()
+            world.planner.close()
+            times.sort()
+            results.append((1e6 * times[len(times) / 2], 1e6 * times[-1], 100.0 * world.planner.fallbacks / frames))
+        print '{}: inline p50 {:.1f}us max {:.1f}us, planned p50 {:.1f}us max {:.1f}us, {:.0f}% fallbacks'.format(
+            name, results[0][0], results[0][1], results[1][0], results[1][1], results[1][2])
+
+
+def main():
+    bench_closest_robots()
+    bench_clear_shots()
+    bench_update_apply()
+    bench_defense_area()
+    bench_shot_openings()
+    bench_indirect_positions()
+    bench_history()
+    bench_goto_step()
+    bench_commanders()
+    bench_detection_transport()
+    bench_fusion()
+    bench_receive_latency()
+    bench_receive_burst()
+    bench_loop_rate()
+    bench_decode()
+    bench_geometry()
+    bench_forward()
+    bench_play_workers()
+    bench_planner()
+
+
+if __name__ == '__main__':
+    main()
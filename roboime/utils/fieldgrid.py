@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Scoring candidate positions over a grid on the field.
+
+All cells are evaluated at once, so fine grids are affordable every frame.
+Searches are expressed as masks (which cells are acceptable) and cost
+terms (arrays with one value per cell, lower is better).
+"""
+import numpy as np
+
+from . import geom
+from .lineofsight import occlusion_matrix
+
+
+class FieldGrid(object):
+
+    def __init__(self, world, nx, ny, length=None, width=None, avoid_defense_areas=True):
+        """
+        A grid of nx by ny cells centered on the field.
+
+        length and width are the extents covered by the grid and default to
+        the field size. Cells inside a goal area (the defense area grown by
+        the radius of a robot) are dropped when avoid_defense_areas is set.
+
+        >>> from ..base import World
+        >>> grid = FieldGrid(World(), 7, 5)
+        >>> len(grid), grid.points[0]
+        (33, array([-3., -2.]))
+        >>> len(FieldGrid(World(), 7, 5, length=4.0))
+        35
+        """
+        self.world = world
+        length = world.length if length is None else length
+        width = world.width if width is None else width
+        xs, ys = np.meshgrid(
+            np.linspace(-length / 2, length / 2, nx),
+            np.linspace(-width / 2, width / 2, ny),
+            indexing='ij',
+        )
+        self.points = np.column_stack((xs.ravel(), ys.ravel()))
+        if avoid_defense_areas:
+            for goal in (world.left_goal, world.right_goal):
+                self.points = self.points[~goal.shapes.area_stadium.contains(self.points)]
+
+    def __len__(self):
+        return len(self.points)
+
+    def distances(self, point):
+        """Distance from every cell to point, anything geom.Vec2.of takes."""
+        x, y = geom.Vec2.of(point)
+        return np.hypot(self.points[:, 0] - x, self.points[:, 1] - y)
+
+    def visible_from(self, origin, centers, radii, width=0.0):
+        """
+        Cells with a clear way from origin past the given discs.
+
+        Discs holding origin, like the robot with the ball, don't block.
+        """
+        origin = np.asarray(origin, dtype=float)
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        radii = np.asarray(radii, dtype=float) + width
+        blocking = np.hypot(centers[:, 0] - origin[0], centers[:, 1] - origin[1]) >= radii
+        blocked = occlusion_matrix(origin, self.points, centers[blocking], np.broadcast_to(radii, len(centers))[blocking])
+        return ~blocked.any(axis=1)
+
+    def visible_to(self, target, centers, radii, width=0.0):
+        """Cells with a clear way to target past the given discs."""
+        blocked = occlusion_matrix(self.points, np.asarray(target, dtype=float), centers, radii, width)
+        return ~blocked.any(axis=1)
+
+    def evaluate(self, terms, mask=None, k=None):
+        """
+        Rank the cells by the weighted sum of cost terms.
+
+        terms is a list of (weight, term) where term is a function taking
+        this grid and returning one cost per cell. Only cells in mask, when
+        given, are considered. Returns a list of (Point, cost) sorted with
+        the cheapest first, only the k cheapest if k is given.
+        """
+        return [(geom.Point(x, y), cost) for (x, y), cost in self.rank(terms, mask, k)]
+
+    def rank(self, terms, mask=None, k=None):
+        """
+        Like evaluate, with ((x, y), cost) tuples of plain floats and no
+        Points, so it can run off the main thread.
+
+        >>> from ..base import World
+        >>> grid = FieldGrid(World(), 7, 5)
+        >>> grid.rank([(1.0, lambda g: g.distances((1.0, 1.0)))], k=1)
+        [((1.0, 1.0), 0.0)]
+        """
+        cost = np.zeros(len(self))
+        for weight, term in terms:
+            cost += weight * term(self)
+        index = np.arange(len(self)) if mask is None else mask.nonzero()[0]
+        index = index[cost[index].argsort(kind='mergesort')[:k]]
+        return [(tuple(self.points[i].tolist()), cost[i].item()) for i in index]
@@ -12,17 +12,165 @@
 # GNU Affero General Public License for more details.
 #
 """Geometry classes."""
+from math import hypot as _hypot
 from shapely import geometry
 from shapely.geometry import point
+from shapely.geometry import polygon
 from numpy import cross
 from numpy.linalg import norm
 from numpy import pi
 from numpy import arctan2
+from numpy import array, hypot, ndarray
+
+from .mathutils import atan2, cos, sin
 
 
 _c_double_Array_2 = point.c_double * (2)
 
 
+class Vec2(object):
+    """
+    A mutable 2D vector of plain floats, for math on the hot paths.
+
+    Unlike Point it has no shapely geometry behind it, converting back
+    is explicit through point(). Angles are in degrees:
+
+    >>> v = Vec2(3.0, 4.0) - Vec2(0.0, 0.0)
+    >>> v.norm(), Vec2(0.0, 2.0).angle()
+    (5.0, 90.0)
+    >>> v *= 2
+    >>> v, tuple(Vec2(1.0, 0.0).rotate(90.0).round(6))
+    (Vec2(6.0, 8.0), (0.0, 1.0))
+    >>> (Vec2.of(Point(1.0, 2.0)) + Vec2.polar(2.0, 180.0)).round(6)
+    Vec2(-1.0, 2.0)
+
+    A vector of no length has no direction, normalized gives it back:
+
+    >>> Vec2(0.0, 3.0).normalized(), Vec2(0.0, 0.0).normalized()
+    (Vec2(0.0, 1.0), Vec2(0.0, 0.0))
+    """
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x=0.0, y=0.0):
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def of(cls, obj):
+        """A new vector with the coordinates of a point, robot, ball or (x, y) pair."""
+        vec = getattr(obj, 'vec', None)
+        if vec is not None:
+            return vec
+        x, y = obj
+        return cls(x, y)
+
+    @classmethod
+    def polar(cls, length, angle):
+        return cls(length * cos(angle), length * sin(angle))
+
+    def point(self):
+        """A shapely backed Point at this vector."""
+        return Point(self.x, self.y)
+
+    def copy(self):
+        return Vec2(self.x, self.y)
+
+    def __repr__(self):
+        return 'Vec2({!r}, {!r})'.format(self.x, self.y)
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, i):
+        return (self.x, self.y)[i]
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __eq__(self, other):
+        return isinstance(other, Vec2) and self.x == other.x and self.y == other.y
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __neg__(self):
+        return Vec2(-self.x, -self.y)
+
+    def __add__(self, other):
+        return Vec2(self.x + other.x, self.y + other.y)
+
+    def __sub__(self, other):
+        return Vec2(self.x - other.x, self.y - other.y)
+
+    def __mul__(self, k):
+        return Vec2(self.x * k, self.y * k)
+
+    __rmul__ = __mul__
+
+    def __div__(self, k):
+        return Vec2(self.x / k, self.y / k)
+
+    __truediv__ = __div__
+
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def __imul__(self, k):
+        self.x *= k
+        self.y *= k
+        return self
+
+    def __idiv__(self, k):
+        self.x /= k
+        self.y /= k
+        return self
+
+    __itruediv__ = __idiv__
+
+    def dot(self, other):
+        return self.x * other.x + self.y * other.y
+
+    def cross(self, other):
+        """The z of the cross product, positive if other is counterclockwise from self."""
+        return self.x * other.y - self.y * other.x
+
+    def norm(self):
+        return _hypot(self.x, self.y)
+
+    def normalized(self):
+        n = _hypot(self.x, self.y)
+        if n == 0.0:
+            return Vec2(0.0, 0.0)
+        return Vec2(self.x / n, self.y / n)
+
+    def distance(self, other):
+        return _hypot(other.x - self.x, other.y - self.y)
+
+    def angle(self):
+        """Direction of the vector, in [0, 360) degrees from the x axis."""
+        return atan2(self.y, self.x) % 360
+
+    def angle_to(self, other):
+        """Direction from self to other, like Point.angle_to_point."""
+        return atan2(other.y - self.y, other.x - self.x) % 360
+
+    def rotate(self, angle):
+        """A new vector rotated counterclockwise by angle degrees."""
+        c, s = cos(angle), sin(angle)
+        return Vec2(self.x * c - self.y * s, self.x * s + self.y * c)
+
+    def round(self, ndigits=0):
+        return Vec2(round(self.x, ndigits), round(self.y, ndigits))
+
+
 class Point(geometry.Point):
     def distance_to_line(self, line):
         """ Distance to a line, NOT a segment."""
@@ -42,6 +190,12 @@ class Point(geometry.Point):
             ctypes_data = _c_double_Array_2(*args)
         self._ctypes_data = ctypes_data
 
+    @property
+    def vec(self):
+        """A new Vec2 with the coordinates of this point."""
+        x, y = self.coords[0][:2]
+        return Vec2(x, y)
+
     def angle_to_point(self, P2):
         """ Calculates the angle from self.point to P2, relative to the x axis.
            ^   P2
@@ -69,11 +223,23 @@ class Point(geometry.Point):
         return ang_rad
 
     def closest_to(self, iterable):
-        """Will return the closest object to self from iterable."""
-        distance_elem_list = [(self.distance(elem), elem) for elem in iterable]
-        if distance_elem_list:
-            d, i = min(distance_elem_list)
-            return i
+        """
+        Will return the closest object to self from iterable.
+
+        If iterable is an array of shape (n, 2) the index of the closest
+        row is returned instead:
+
+        >>> Point(1.0, 1.0).closest_to(array([[0.0, 0.0], [1.0, 2.0]]))
+        1
+        """
+        if isinstance(iterable, ndarray):
+            if len(iterable):
+                return hypot(iterable[:, 0] - self.x, iterable[:, 1] - self.y).argmin()
+            return None
+        elems = list(iterable)
+        if elems:
+            coords = array([(elem.x, elem.y) for elem in elems])
+            return elems[hypot(coords[:, 0] - self.x, coords[:, 1] - self.y).argmin()]
 
 # Reference: http://stackoverflow.com/questions/11949808/what-is-the-difference-between-a-function-an-unbound-method-and-a-bound-methodo
 
@@ -84,6 +250,7 @@ geometry.Point.distance_to_line = Point.distance_to_line.im_func
 geometry.Point.update = Point.update.im_func
 geometry.Point.angle_to_point = Point.angle_to_point.im_func
 geometry.Point.closest_to = Point.closest_to.im_func
+geometry.Point.vec = Point.vec
 geometry.Point.within = Point.within.im_func
 
 
@@ -95,15 +262,34 @@ class Circle(geometry.Polygon):
         >>> p = Point(1.0, 0.0)
         >>> c = Circle(p, 2.0)
 
-        The circle is a shapely polygon
+        Points, distances and other circles are dealt with analytically
+        >>> c.contains(Point(2.0, 1.0)), c.distance(Point(4.0, 0.0))
+        (True, 1.0)
+        >>> c.distance(Circle(Point(6.0, 0.0), 1.0)), c.intersects(Circle(Point(4.0, 0.0), 1.0))
+        (2.0, True)
+
+        The circle is a shapely polygon, built only when it is first needed
         >>> len(c.exterior.coords)
         66
         """
-        # the following is not really optimized as it creates a polygon twice
-        # but it's ok for now, I tried doing some magic with __new__, didn't work
-        super(Circle, self).__init__(center.buffer(radius).exterior.coords)
+        self._built = False
+        super(Circle, self).__init__()
         self._center = center
         self._radius = radius
+        # the center may be a moving object, the circle must not follow it
+        self._cx, self._cy = center.x, center.y
+
+    @property
+    def _geom(self):
+        if not self._built:
+            self._built = True
+            coords = Point(self._cx, self._cy).buffer(self._radius).exterior.coords
+            self._geom, self._ndim = polygon.geos_polygon_from_py(coords)
+        return self.__geom__
+
+    @_geom.setter
+    def _geom(self, val):
+        geometry.Polygon._geom.fset(self, val)
 
     @property
     def center(self):
@@ -113,6 +299,30 @@ class Circle(geometry.Polygon):
     def radius(self):
         return self._radius
 
+    def _center_distance(self, other):
+        if isinstance(other, Circle):
+            return hypot(other._cx - self._cx, other._cy - self._cy)
+        return hypot(other.x - self._cx, other.y - self._cy)
+
+    def distance(self, other):
+        if isinstance(other, Circle):
+            return max(self._center_distance(other) - self._radius - other._radius, 0.0)
+        elif isinstance(other, geometry.Point):
+            return max(self._center_distance(other) - self._radius, 0.0)
+        return super(Circle, self).distance(other)
+
+    def contains(self, other):
+        if isinstance(other, geometry.Point):
+            return self._center_distance(other) < self._radius
+        return super(Circle, self).contains(other)
+
+    def intersects(self, other):
+        if isinstance(other, Circle):
+            return self._center_distance(other) <= self._radius + other._radius
+        elif isinstance(other, geometry.Point):
+            return self._center_distance(other) <= self._radius
+        return super(Circle, self).intersects(other)
+
 
 class Line(geometry.LineString):
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,120 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Preallocated circular buffers of timestamped samples.
+"""
+import numpy as np
+
+
+class History(object):
+
+    def __init__(self, objects, size, columns):
+        """
+        Keeps the last size samples of each of the objects, indexed from 0.
+
+        columns are the names of the values of a sample, the first one is
+        the time. Samples are pushed in time order:
+
+        >>> h = History(2, 3, ('t', 'x'))
+        >>> for t in xrange(5):
+        ...     h.push(1, (t, 10.0 * t))
+        >>> h.last(1)
+        array([[ 2., 20.],
+               [ 3., 30.],
+               [ 4., 40.]])
+        >>> h.at(1, 3.5)
+        array([ 3.5, 35. ])
+        >>> h.rate(1, 2.0)
+        array([10.])
+        >>> len(h.last(0)), h.at(0, 1.0)
+        (0, None)
+        """
+        self.columns = tuple(columns)
+        self.size = size
+        self.data = np.zeros((objects, size, len(self.columns)))
+        # next position to be written and number of samples of each object,
+        # plain lists since they are read one item at a time
+        self.head = [0] * objects
+        self.count = [0] * objects
+
+    def push(self, i, sample):
+        head = self.head[i]
+        self.data[i, head] = sample
+        self.head[i] = head + 1 if head + 1 < self.size else 0
+        if self.count[i] < self.size:
+            self.count[i] += 1
+
+    def push_many(self, indices, samples):
+        """
+        Push a sample for each of the objects on indices, which must not repeat:
+
+        >>> h = History(3, 2, ('t', 'x'))
+        >>> for t in xrange(3):
+        ...     h.push_many([0, 2], [(t, 1.0 * t), (t, -1.0 * t)])
+        >>> h.last(0).tolist(), h.last(2).tolist(), h.count
+        ([[1.0, 1.0], [2.0, 2.0]], [[1.0, -1.0], [2.0, -2.0]], [2, 0, 2])
+        """
+        heads = [self.head[i] for i in indices]
+        self.data[indices, heads] = samples
+        size, head, count = self.size, self.head, self.count
+        for i, h in zip(indices, heads):
+            head[i] = h + 1 if h + 1 < size else 0
+            if count[i] < size:
+                count[i] += 1
+
+    def clear(self, i):
+        self.head[i] = self.count[i] = 0
+
+    def latest(self, i):
+        """The last sample of object i, None if there's none."""
+        if self.count[i]:
+            return self.data[i, self.head[i] - 1]
+
+    def latest_times(self):
+        """Time of the last sample of every object, nan for those without samples."""
+        times = self.data[np.arange(len(self.head)), np.subtract(self.head, 1), 0]
+        times[np.equal(self.count, 0)] = np.nan
+        return times
+
+    def last(self, i, k=None):
+        """The last k samples (all if k is None) of object i, oldest first."""
+        n = self.count[i] if k is None else min(k, self.count[i])
+        return self.data[i, np.arange(self.head[i] - n, self.head[i]) % self.size]
+
+    def at(self, i, t):
+        """
+        A sample of object i at time t, interpolated from the samples around it.
+
+        Times outside of the buffered ones are clamped to it, None if there
+        are no samples.
+        """
+        samples = self.last(i)
+        if not len(samples):
+            return None
+        return np.array([np.interp(t, samples[:, 0], samples[:, c]) for c in xrange(len(self.columns))])
+
+    def rate(self, i, window, columns=(1,)):
+        """
+        Finite difference of the given columns over the last window of time.
+
+        Uses the newest sample and the oldest one not older than window
+        before it, zeros if there are not two such samples.
+        """
+        samples = self.last(i)
+        if len(samples) > 1:
+            t = samples[:, 0]
+            first = np.searchsorted(t, t[-1] - window)
+            if first < len(samples) - 1 and t[-1] > t[first]:
+                return (samples[-1, list(columns)] - samples[first, list(columns)]) / (t[-1] - t[first])
+        return np.zeros(len(columns))
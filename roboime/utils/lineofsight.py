@@ -0,0 +1,141 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Closed form line of sight tests.
+
+A segment of a given width (a capsule) is blocked by a disc when the
+distance from the disc center to the segment is less than the sum of the
+disc radius and the half width of the segment. Everything here works on
+arrays so that many segments are tested against many discs at once.
+"""
+from math import atan2, copysign, cos, degrees, hypot, pi, sin
+
+import numpy as np
+
+# how close to the line of a segment a point is taken to be on it, in meters
+EPSILON = 1e-9
+
+
+def segment_distances(starts, ends, centers):
+    """
+    Distances from each of the N centers to each of the M segments.
+
+    starts, ends: (M, 2) arrays, centers: (N, 2) array. Returns an (M, N)
+    array:
+
+        >>> segment_distances([(0, 0)], [(2, 0)], [(1, 1), (3, 0), (-1, 0)])
+        array([[1., 1., 1.]])
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    d = ends - starts
+    dd = (d * d).sum(axis=1)
+    # degenerate segments are points, any t will do
+    dd[dd == 0.0] = 1.0
+    f = centers[np.newaxis, :, :] - starts[:, np.newaxis, :]
+    t = np.clip((f * d[:, np.newaxis, :]).sum(axis=2) / dd[:, np.newaxis], 0.0, 1.0)
+    r = f - t[:, :, np.newaxis] * d[:, np.newaxis, :]
+    return np.hypot(r[:, :, 0], r[:, :, 1])
+
+
+def occlusion_matrix(starts, ends, centers, radii, width=0.0):
+    """
+    Which of the N discs block which of the M segments.
+
+    radii is either a scalar or an (N,) array and width is the half width
+    of the segments, i.e. the radius of whatever travels along them. The
+    result is an (M, N) boolean array, True meaning the disc is in the way:
+
+        >>> occlusion_matrix([(0, 0), (0, 0)], [(2, 0), (0, 2)], [(1, 0.1)], 0.09)
+        array([[False],
+               [False]])
+        >>> occlusion_matrix([(0, 0), (0, 0)], [(2, 0), (0, 2)], [(1, 0.1)], 0.09, 0.02)
+        array([[ True],
+               [False]])
+    """
+    return segment_distances(starts, ends, centers) < np.asarray(radii, dtype=float) + width
+
+
+def open_intervals(origin, p1, p2, centers, radii, width=0.0, front=None):
+    """
+    The parts of the segment from p1 to p2 that can be seen from origin.
+
+    Each disc casts an angular shadow on the segment, the shadows are
+    merged and what is left between them is returned as a list of
+    (t0, t1, angle) tuples, sorted from the widest angle (in degrees) seen
+    from origin to the narrowest. The points of an interval are
+    p1 + t * (p2 - p1) for t0 <= t <= t1.
+
+    Discs holding origin, and discs past the segment, cast no shadow:
+
+        >>> intervals = open_intervals((0, 0), (2, -1), (2, 1), [(1, 0), (3, 0), (0, 0)], 0.1)
+        >>> [(round(t0, 3), round(t1, 3), round(angle, 1)) for t0, t1, angle in intervals]
+        [(0.0, 0.399, 20.8), (0.601, 1.0, 20.8)]
+        >>> open_intervals((0, 0), (2, -1), (2, 1), [(1, 0)], 0.9)
+        []
+
+    Nothing is seen from the line of the segment, nor from behind it, the
+    side away from front when it's given:
+
+        >>> open_intervals((2, 0), (2, -1), (2, 1), [], 0.1), open_intervals((3, 0), (2, -1), (2, 1), [], 0.1, front=(0, 0))
+        ([], [])
+    """
+    ox, oy = origin
+    x1, y1 = p1
+    dx, dy = p2[0] - x1, p2[1] - y1
+    # twice the signed area of origin and the segment, zero on its line
+    cross = dx * (oy - y1) - dy * (ox - x1)
+    if abs(cross) <= EPSILON * hypot(dx, dy):
+        return []
+    if front is not None and cross * (dx * (front[1] - y1) - dy * (front[0] - x1)) < 0.0:
+        return []
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    radii = np.broadcast_to(np.asarray(radii, dtype=float) + width, len(centers))
+
+    # angles are measured from the direction of the middle of the segment
+    # which is less than 90 degrees away from any of its points
+    base = atan2(y1 + dy / 2 - oy, x1 + dx / 2 - ox)
+
+    def angle(x, y):
+        return (atan2(y - oy, x - ox) - base + pi) % (2 * pi) - pi
+
+    lo, hi = sorted((angle(x1, y1), angle(x1 + dx, y1 + dy)))
+
+    vx, vy = centers[:, 0] - ox, centers[:, 1] - oy
+    dist = np.hypot(vx, vy)
+    # distances to the line of the segment, positive on the side of origin
+    side = copysign(1.0, cross) / hypot(dx, dy)
+    ahead = (dx * (centers[:, 1] - y1) - dy * (centers[:, 0] - x1)) * side > -radii
+    casting = (dist > radii) & ahead
+    c = (np.arctan2(vy[casting], vx[casting]) - base + pi) % (2 * pi) - pi
+    a = np.arcsin(radii[casting] / dist[casting])
+    shadows = sorted(zip(np.clip(c - a, lo, hi).tolist(), np.clip(c + a, lo, hi).tolist()))
+
+    gaps = []
+    start = lo
+    for s, e in shadows:
+        if s > start:
+            gaps.append((start, s))
+        start = max(start, e)
+    if start < hi:
+        gaps.append((start, hi))
+
+    def to_t(angle):
+        ux, uy = cos(angle + base), sin(angle + base)
+        t = ((ox - x1) * uy - (oy - y1) * ux) / (dx * uy - dy * ux)
+        return min(max(t, 0.0), 1.0)
+
+    intervals = [tuple(sorted((to_t(s), to_t(e)))) + (degrees(e - s),) for s, e in gaps]
+    return sorted(intervals, key=lambda i: -i[2])
@@ -0,0 +1,143 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Expensive planning off the frame, on a pool of threads.
+
+Skills and plays ask for a plan on each frame, the planner hands them the
+latest one it has, if it's recent enough, and starts a new one in the
+background. Plans are tagged with the frame they were asked on, when the
+latest is more than max_staleness frames old a fallback, something quick
+computed on the spot, is used instead. Without threads there are only the
+fallbacks, the plans are too slow to be made on the frame.
+
+Jobs run while the world keeps changing, they must take what they need of
+it when they are made, as plain values and arrays, and read nothing else:
+neither robots, whose shapely geometries are rebuilt when read, nor
+teams, which make robots when read.
+"""
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from time import sleep
+from traceback import format_exc
+from weakref import WeakKeyDictionary
+
+from ..config import config
+from .log import Log
+
+
+class Planner(object):
+
+    def __init__(self, threads=None, max_staleness=None):
+        """
+        Runs plans on threads threads, and falls back when they're more than
+        max_staleness frames old, or always when there are no threads. Both
+        default to the planner_* entries of the core config.
+
+        >>> planner = Planner(threads=1, max_staleness=2)
+        >>> class Owner(object): pass
+        >>> owner = Owner()
+        >>> plan = lambda frame: planner.plan(owner, 'answer', frame, lambda: lambda: 42, lambda: 0)
+        >>> plan(10)
+        0
+        >>> planner.wait(); plan(12)
+        42
+        >>> planner.wait(); plan(15), planner.fallbacks
+        (0, 2)
+
+        A plan made for another key is not used either:
+
+        >>> planner.wait(); planner.plan(owner, 'answer', 15, lambda: lambda: 42, lambda: 0, key='elsewhere')
+        0
+        >>> planner.close()
+
+        Nor is there any without threads:
+
+        >>> Planner(threads=0).plan(owner, 'answer', 15, lambda: lambda: 42, lambda: 0)
+        0
+        """
+        self.threads = config['core']['planner_threads'] if threads is None else threads
+        self.max_staleness = config['core']['planner_max_staleness'] if max_staleness is None else max_staleness
+        self.log = Log('core')
+        self._pool = None
+        self._lock = Lock()
+        # owner to name to (frame, key, plan) of the latest plans, and the names planning
+        self._plans = WeakKeyDictionary()
+        self._planning = WeakKeyDictionary()
+        # plans asked for that were too old or missing, and jobs that failed
+        self.fallbacks = 0
+        self.errors = 0
+
+    def plan(self, owner, name, frame, make_job, fallback, key=None):
+        """
+        The latest plan named name of owner, a skill or play, started on a
+        frame at most max_staleness frames before frame, and for the same
+        key, what it was planned for, otherwise what fallback() returns.
+
+        A new one is started to replace it unless a plan of that name is
+        still being made, only one per name is made at a time. make_job()
+        takes what it needs of the world then, and returns the job, which
+        makes the plan on the pool.
+        """
+        if not self.threads:
+            return fallback()
+        with self._lock:
+            planning = self._planning.setdefault(owner, set())
+            start = name not in planning
+            if start:
+                planning.add(name)
+            latest = self._plans.get(owner, {}).get(name)
+        if start:
+            try:
+                job = make_job()
+            except Exception:
+                with self._lock:
+                    planning.discard(name)
+                raise
+            if self._pool is None:
+                self._pool = ThreadPool(self.threads)
+            self._pool.apply_async(self._run, (owner, name, frame, key, job))
+        if latest is not None and 0 <= frame - latest[0] <= self.max_staleness and latest[1] == key:
+            return latest[2]
+        with self._lock:
+            self.fallbacks += 1
+        return fallback()
+
+    def _run(self, owner, name, frame, key, job):
+        try:
+            result = job()
+        except Exception:
+            self.log(format_exc())
+            result = None
+        else:
+            result = (frame, key, result)
+        with self._lock:
+            if result is None:
+                self.errors += 1
+            else:
+                self._plans.setdefault(owner, {})[name] = result
+            self._planning.get(owner, set()).discard(name)
+
+    def wait(self):
+        """Wait for the jobs started so far, only meant for tests."""
+        while True:
+            with self._lock:
+                planning = any(self._planning.values())
+            if not planning:
+                break
+            sleep(1e-3)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
@@ -1,5 +1,23 @@
+from collections import OrderedDict
 from time import time
 
+import numpy as np
+
+from .history import History
+
+# what is stamped on each frame, the first two on the clock of the vision
+# and the others on the local monotonic clock
+FRAME_STAMPS = ('t_capture', 't_sent', 'received', 'filtered', 'planned', 'commanded')
+
+# stretches measured between the stamps, from the first stamp to the second
+LATENCY_SPANS = OrderedDict([
+    ('vision', ('t_capture', 't_sent')),
+    ('received to filtered', ('received', 'filtered')),
+    ('stp', ('filtered', 'planned')),
+    ('commanders', ('planned', 'commanded')),
+    ('received to command', ('received', 'commanded')),
+])
+
 
 class Profile(object):
 
@@ -16,3 +34,46 @@ class Profile(object):
     @property
     def profile_deltas(self):
         return self._deltas if hasattr(self, '_deltas') else []
+
+
+class Latency(object):
+
+    def __init__(self, size=1000):
+        """
+        Stamps of the last size frames, from being captured to the commands
+        computed from them being sent.
+
+        The clocks of the vision and the local one are not the same, the
+        time from capture to command is what the vision took plus the local
+        time from receiving to commanding, without the network in between:
+
+        >>> latency = Latency()
+        >>> latency.stamp(10.000, 10.004, 3.000, 3.001, 3.006, 3.008)
+        >>> latency.stamp(10.017, 10.021, 3.017, 3.018, 3.021, 3.022)
+        >>> [round(ms, 1) for ms in latency.spans()['capture to command']]
+        [12.0, 9.0]
+        >>> [round(ms, 1) for ms in latency.percentiles((50, 100))['stp']]
+        [4.0, 5.0]
+        """
+        self.history = History(1, size, FRAME_STAMPS)
+
+    def stamp(self, *stamps):
+        """Record the FRAME_STAMPS of a frame, in seconds."""
+        self.history.push(0, stamps)
+
+    def spans(self):
+        """Each of the LATENCY_SPANS, and the one from capture to command, of every frame kept, in milliseconds."""
+        stamps = self.history.last(0)
+        column = dict((c, stamps[:, i]) for i, c in enumerate(FRAME_STAMPS))
+        spans = OrderedDict((name, 1e3 * (column[end] - column[begin])) for name, (begin, end) in LATENCY_SPANS.iteritems())
+        spans['capture to command'] = spans['vision'] + spans['received to command']
+        return spans
+
+    def percentiles(self, q=(50, 90, 99, 100)):
+        """The q percentiles of each of the spans, empty lists with no frames."""
+        return OrderedDict((name, np.percentile(span, q).tolist() if len(span) else []) for name, span in self.spans().iteritems())
+
+    def last(self):
+        """The spans of the last frame, None if there's none."""
+        if self.history.count[0]:
+            return OrderedDict((name, span[-1]) for name, span in self.spans().iteritems())
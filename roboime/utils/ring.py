@@ -0,0 +1,141 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Fixed layout records shared between processes without pickling.
+
+A RecordRing lives on shared memory allocated before the processes fork,
+one process writes records to it and another reads them in place. Each
+slot has a sequence number, odd while the slot is being written, so the
+reader can tell complete records from ones it raced with.
+"""
+from ctypes import c_char, c_ulonglong
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import numpy as np
+
+
+class RecordRing(object):
+
+    def __init__(self, dtype, size=16):
+        """
+        A ring of size records of dtype, a numpy structured dtype.
+
+        There must be a single writer. Readers get copies of the records
+        written since their last read, the older ones are lost when the
+        writer laps them:
+
+        >>> ring = RecordRing([('t', 'f8'), ('n', 'i4')], size=4)
+        >>> for t in xrange(6):
+        ...     with ring.writing() as record:
+        ...         record['t'], record['n'] = t, 10 * t
+        >>> [r['n'] for r in ring.read()], ring.lost
+        ([20, 30, 40, 50], 2)
+        >>> ring.read(), ring.latest()
+        ([], None)
+        """
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        self._buffer = RawArray(c_char, size * self.dtype.itemsize)
+        self._seq = RawArray(c_ulonglong, size)
+        self._written = RawValue(c_ulonglong, 0)
+        self._bind()
+        # reader side, each process has its own
+        self.count = 0
+        self.lost = 0
+        self.torn = 0
+
+    def _bind(self):
+        self.records = np.frombuffer(self._buffer, dtype=self.dtype)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['records']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    @property
+    def written(self):
+        """How many records were ever written."""
+        return int(self._written.value)
+
+    def writing(self):
+        """Context manager giving the next record to be filled in place."""
+        return _Writing(self)
+
+    def _copy(self, n):
+        """A copy of record n, None if it was overwritten or is being written."""
+        slot = n % self.size
+        seq = 2 * n + 2
+        if self._seq[slot] != seq:
+            return None
+        record = self.records[slot].copy()
+        if self._seq[slot] != seq:
+            self.torn += 1
+            return None
+        return record
+
+    def read(self):
+        """Copies of the complete records written since the last read, oldest first."""
+        written = self.written
+        first = max(self.count, written - self.size)
+        self.lost += first - self.count
+        records = []
+        for n in xrange(first, written):
+            record = self._copy(n)
+            if record is None:
+                self.lost += 1
+            else:
+                records.append(record)
+        self.count = written
+        return records
+
+    def latest(self):
+        """
+        A copy of the newest record written since the last read, None if there
+        is none. The ones before it count as lost.
+        """
+        written = self.written
+        for n in xrange(written - 1, max(self.count, written - self.size) - 1, -1):
+            record = self._copy(n)
+            if record is not None:
+                self.lost += n - self.count
+                self.count = written
+                return record
+        self.lost += written - self.count
+        self.count = written
+        return None
+
+
+class _Writing(object):
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __enter__(self):
+        ring = self.ring
+        n = ring._written.value
+        slot = n % ring.size
+        ring._seq[slot] = 2 * n + 1
+        return ring.records[slot]
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ring = self.ring
+        n = ring._written.value
+        if exc_type is None:
+            ring._seq[n % ring.size] = 2 * n + 2
+            ring._written.value = n + 1
+        # a failed write leaves the slot odd, readers skip it
@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Running a loop at a fixed rate, on absolute deadlines.
+"""
+import ctypes
+import sys
+from time import time, sleep
+
+POLICIES = ('skip', 'catch_up')
+
+
+def _clock_gettime():
+    """A monotonic clock in seconds from clock_gettime, None where it's not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    CLOCK_MONOTONIC = 1
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for name in ('librt.so.1', 'libc.so.6'):
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        t = timespec()
+
+        def monotonic():
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)):
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return t.tv_sec + t.tv_nsec * 1e-9
+        return monotonic
+
+
+# time.time steps when the system clock is set, use it only as a fallback
+monotonic = _clock_gettime() or time
+
+
+class Scheduler(object):
+
+    def __init__(self, rate=60, policy='skip', clock=monotonic):
+        """
+        Ticks rate times a second, as fast as possible when rate is 0.
+
+        wait() is called after each step and returns at the next tick.
+        When a step goes past the next tick it is an overrun, then policy
+        says whether the ticks missed are skipped or run one after the other
+        until the loop catches up:
+
+        >>> now = [0.0]
+        >>> def sleep(dt):
+        ...     now[0] += dt
+        >>> scheduler = Scheduler(4, clock=lambda: now[0])
+        >>> scheduler.start()
+        >>> now[0] += 0.125; scheduler.wait(sleep); now[0]
+        0.25
+        >>> now[0] += 0.625; scheduler.wait(sleep); now[0], scheduler.overruns, scheduler.skipped
+        (1.0, 1, 2)
+        >>> scheduler.policy = 'catch_up'
+        >>> now[0] += 0.375; scheduler.wait(sleep); now[0], scheduler.deadline, scheduler.overruns
+        (1.375, 1.25, 2)
+        >>> scheduler.wait(sleep); now[0]
+        1.5
+        """
+        self.clock = clock
+        self.rate = rate
+        self.policy = policy
+        self.deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        # how late the loop wakes up from the deadlines, in seconds
+        self.jitter = 0.0
+        self.max_jitter = 0.0
+        self._total_jitter = 0.0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        if value < 0:
+            raise ValueError('invalid rate {}'.format(value))
+        self._rate = value
+        self.period = 1.0 / value if value else 0.0
+        # ticks start over from the next wait
+        self.deadline = None
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @policy.setter
+    def policy(self, value):
+        if value not in POLICIES:
+            raise ValueError('policy must be one of {}, not {}'.format(', '.join(POLICIES), value))
+        self._policy = value
+
+    @property
+    def mean_jitter(self):
+        return self._total_jitter / self.ticks if self.ticks else 0.0
+
+    def start(self):
+        self.deadline = self.clock()
+
+    def wait(self, sleep=sleep):
+        """
+        Sleep until the next tick. sleep is called with the seconds left,
+        it may return early, like a poll that gets something.
+        """
+        now = self.clock()
+        if not self.period or self.deadline is None:
+            self.deadline = now
+            self.ticks += 1
+            return
+        deadline = self.deadline + self.period
+        if now > deadline:
+            self.overruns += 1
+            if self.policy == 'skip':
+                missed = int((now - self.deadline) / self.period)
+                self.skipped += missed
+                deadline = self.deadline + (missed + 1) * self.period
+        while True:
+            left = deadline - now
+            if left <= 0:
+                break
+            sleep(left)
+            now = self.clock()
+        self.deadline = deadline
+        self.jitter = max(now - deadline, 0.0)
+        self.max_jitter = max(self.max_jitter, self.jitter)
+        self._total_jitter += self.jitter
+        self.ticks += 1
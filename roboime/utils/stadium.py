@@ -0,0 +1,83 @@
+#
+# Copyright (C) 2013-2015 RoboIME
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+"""
+Closed form stadium shapes.
+
+A stadium is a segment buffered by a radius, which is exactly what the
+defense areas are. Every method takes either a single (x, y) or an (n, 2)
+array of points and answers for all of them at once.
+"""
+import numpy as np
+
+
+class Stadium(object):
+
+    def __init__(self, p1, p2, radius, normal=None):
+        """
+        The stadium around the segment from p1 to p2.
+
+        normal is the direction points lying exactly on the segment are
+        pushed to when projected out, it defaults to the left of p1 -> p2.
+
+        >>> s = Stadium((0.0, 1.0), (0.0, -1.0), 0.5, normal=(1.0, 0.0))
+        >>> s.contains([(0.2, 0.0), (0.0, 1.6), (0.3, 1.3)])
+        array([ True, False,  True])
+        >>> s.signed_distance((1.0, 0.0))
+        0.5
+        >>> s.nearest_exterior((0.0, 0.0))
+        array([0.5, 0. ])
+        >>> s.project_out([(0.0, 1.2), (2.0, 2.0)])
+        array([[0. , 1.5],
+               [2. , 2. ]])
+        """
+        self.p1 = np.asarray(p1, dtype=float)
+        self.p2 = np.asarray(p2, dtype=float)
+        self.radius = radius
+        self._d = self.p2 - self.p1
+        self._dd = np.dot(self._d, self._d) or 1.0
+        if normal is None:
+            normal = (self._d[1], -self._d[0])
+        normal = np.asarray(normal, dtype=float)
+        self._normal = normal / np.hypot(*normal)
+
+    def _offsets(self, points):
+        """Closest points on the segment and the offsets of points from them."""
+        t = np.clip(np.dot(points - self.p1, self._d) / self._dd, 0.0, 1.0)
+        closest = self.p1 + t[..., np.newaxis] * self._d
+        return closest, points - closest
+
+    def signed_distance(self, points):
+        """Distance to the border, negative inside."""
+        _, v = self._offsets(np.asarray(points, dtype=float))
+        return np.hypot(v[..., 0], v[..., 1]) - self.radius
+
+    def contains(self, points):
+        return self.signed_distance(points) < 0.0
+
+    def _border(self, points, margin):
+        """Points margin away from the border, closest to points, and the distances to the segment."""
+        closest, v = self._offsets(points)
+        dist = np.hypot(v[..., 0], v[..., 1])[..., np.newaxis]
+        direction = np.where(dist > 0.0, v / np.where(dist > 0.0, dist, 1.0), self._normal)
+        return closest + direction * (self.radius + margin), dist
+
+    def nearest_exterior(self, points):
+        """Closest point on the border of the stadium."""
+        return self._border(np.asarray(points, dtype=float), 0.0)[0]
+
+    def project_out(self, points, margin=0.0):
+        """Points inside are moved to the border, plus margin, points outside are kept."""
+        points = np.asarray(points, dtype=float)
+        border, dist = self._border(points, margin)
+        return np.where(dist < self.radius, border, points)